@@ -1,34 +1,65 @@
+# Streamlit front end for the Law Q&A Bot
+#
+# Run with:  streamlit run app.py
+#
+# Streamlit re-runs this script on every interaction, so nothing heavy happens at
+# module level: the QA pipeline is a cached resource and only new answers are computed.
 import streamlit as st
-from utils import qa_pipeline
 
-chain = qa_pipeline()
+# Load the QA pipeline once per process
+@st.cache_resource(show_spinner="Loading the embeddings, vector store and Gemini...")
+def load_chain():
+    """
+    Build the QA chain on first use and share it across reruns and
+    sessions. Raises if it can't be built, so a failure isn't cached.
+    """
+    # Imported here so torch and langchain load on first use, after the page is up
+    from utils import qa_pipeline
+
+    chain = qa_pipeline()
+    if chain is None:
+        raise RuntimeError("The QA pipeline couldn't be loaded, see the server log")
+    return chain
+
+def show_exchange(question, answer):
+    with st.chat_message("user"):
+        st.markdown(question)
+    with st.chat_message("assistant"):
+        st.markdown(answer)
 
 def main():
-    global chain
     # Set the title of the web application
     st.title('Law Q&A Bot')
 
+    # Load before the first question, so no question pays for the cold start
+    try:
+        chain = load_chain()
+    except Exception as e:
+        st.error(str(e))
+        return
+
     # Initialize the session state if it doesn't exist
     if 'chat_log' not in st.session_state:
         st.session_state.chat_log = []
 
-    # Get the user's question
-    user_input = st.text_input("You:")
+    # Earlier exchanges are redrawn from the session state, never recomputed
+    for exchange in st.session_state.chat_log:
+        show_exchange(exchange["User"], exchange["Bot"])
 
-    # On user input, generate response and add to the chat log
-    if user_input:
-        # Generate the answer
-        bot_output = chain(user_input)
-        bot_output = bot_output['result']
-        # Add the user input and bot output to the chat log
-        st.session_state.chat_log.append({"User": user_input, "Bot": bot_output})
-        # Clear the input box
-        st.text_input("You:", value="", key="unique")
+    # chat_input returns the question only on the run it was submitted in
+    user_input = st.chat_input("Ask a legal question")
+    if not user_input:
+        return
 
-    # Display the chat log
-    for exchange in st.session_state.chat_log:
-        st.markdown(f'**You:** {exchange["User"]}')
-        st.markdown(f'**Bot:** {exchange["Bot"]}')
+    with st.chat_message("user"):
+        st.markdown(user_input)
+    with st.chat_message("assistant"):
+        with st.spinner("Thinking..."):
+            bot_output = chain(user_input)['result']
+        st.markdown(bot_output)
+
+    # Add the user input and bot output to the chat log
+    st.session_state.chat_log.append({"User": user_input, "Bot": bot_output})
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,95 @@
+# ASGI entry point: streams /chat/stream on the event loop, everything else goes to Flask
+#
+# Run with:  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+import json
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+import flask_app
+from utils_gemini import astream_answer
+from domains import DOMAIN_NAMES
+from sessions import SESSION_ID_RE
+from telemetry import log
+
+# The Flask app, served through a thread pool for the non-streaming routes
+flask_asgi = WsgiToAsgi(flask_app.app)
+
+async def read_body(receive):
+    """Read the full request body"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+async def chat_stream(scope, receive, send):
+    """Stream the answer as Server-Sent Events without holding a thread"""
+    body = await read_body(receive)
+    try:
+        data = json.loads(body or b'{}')
+        message = data.get('message', '').strip()
+        domain = str(data.get('domain') or '').strip().lower() or None
+        session_id = data.get('session_id') or None
+    except (ValueError, AttributeError):
+        message, domain, session_id = '', None, None
+
+    # Empty messages, unknown domains, invalid session IDs and a model that isn't ready get Flask's JSON replies
+    if (not message or (domain is not None and domain not in DOMAIN_NAMES)
+            or (session_id is not None and not (isinstance(session_id, str) and SESSION_ID_RE.match(session_id)))
+            or flask_app.is_loading or flask_app.qa_system is None):
+        async def replay():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await flask_asgi(scope, replay, send)
+        return
+
+    # Same request queue as the Flask endpoints; waiting happens off the event loop
+    if not await asyncio.to_thread(flask_app.limiter.acquire):
+        await send({
+            'type': 'http.response.start',
+            'status': 429,
+            'headers': [(b'content-type', b'application/json'), (b'retry-after', b'1')],
+        })
+        busy = {'error': True, 'response': 'The server is busy right now. Please try again in a moment.'}
+        await send({'type': 'http.response.body', 'body': json.dumps(busy).encode('utf-8')})
+        return
+    try:
+        await stream_events(message, send, domain, session_id)
+    finally:
+        flask_app.limiter.release()
+
+async def stream_events(message, send, domain=None, session_id=None):
+    """Send the answer to message, from one legal domain if given, as Server-Sent Events"""
+    log.debug("📝 User question (async streaming): %s", message)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    async for text in astream_answer(flask_app.qa_system, message, domain, session_id):
+        event = flask_app.sse_event({'token': text}).encode('utf-8')
+        await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+    done = flask_app.sse_event({'done': True}).encode('utf-8')
+    await send({'type': 'http.response.body', 'body': done, 'more_body': False})
+
+async def lifespan(receive, send):
+    """Acknowledge startup and shutdown; the model loads in flask_app's background thread"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/chat/stream' and scope['method'] == 'POST':
+        await chat_stream(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
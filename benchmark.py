@@ -0,0 +1,677 @@
+# Benchmarks for the Law Chatbot pipeline
+import os
+import time
+import argparse
+
+# Time the serial, parallel and cached ingestion paths
+def bench_ingest(workers=None, limit=None):
+    """
+    Compare wall-clock PDF parse + split time: serial, process pool, and
+    reading back the parsed-page store the pool run filled
+    """
+    import tempfile
+    from ingest import find_pdf_files, iter_file_chunks
+    from page_store import PARSER_VERSION, PageStore
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    pdf_files = find_pdf_files()
+    if limit:
+        pdf_files = pdf_files[:limit]
+
+    print(f"📚 Benchmarking ingestion of {len(pdf_files)} PDF files ({PARSER_VERSION})")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = PageStore(store_dir)
+        for label, n, run_store in (("serial", 1, None), (f"parallel x{workers}", workers, store),
+                                    ("page store", 1, store)):
+            start = time.perf_counter()
+            chunks = 0
+            for pdf_file, file_chunks in iter_file_chunks(pdf_files, n, run_store):
+                try:
+                    chunks += len(list(file_chunks))
+                except RuntimeError as e:
+                    print(f"⚠️  Skipping {pdf_file}: {e}")
+            elapsed = time.perf_counter() - start
+            results[label] = elapsed
+            print(f"⏱️  {label:<16} {elapsed:8.2f}s  ({chunks} chunks)")
+
+    serial = results["serial"]
+    parallel = results[f"parallel x{workers}"]
+    print(f"🚀 Speedup: {serial / parallel:.2f}x parallel, {serial / results['page store']:.2f}x from the page store")
+    return results
+
+# Compare search index types against the exact flat index
+def bench_index(index_dir="vectorstore/", k=10, num_queries=200, types=None, nprobe_values=(1, 4, 16, 64)):
+    """
+    Report recall@k, per-query latency, memory and build time of each
+    index type, using the flat index's own results as ground truth
+    """
+    import faiss
+    import numpy as np
+    from vector_store import INDEX_TYPES, build_index, flat_vectors, set_search_params
+
+    flat = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    vectors = flat_vectors(flat)
+    ntotal, dimension = vectors.shape
+    k = min(k, ntotal)
+    print(f"📚 {ntotal} vectors of dimension {dimension}, recall@{k} over {num_queries} queries")
+
+    # Queries: stored vectors with a little noise, so they are not exact matches
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(ntotal, size=min(num_queries, ntotal), replace=False)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    _, truth = flat.search(queries, k)
+
+    def measure(index):
+        start = time.perf_counter()
+        found = np.vstack([index.search(query[None, :], k)[1] for query in queries])
+        latency = (time.perf_counter() - start) / len(queries) * 1000
+        recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+        return recall, latency
+
+    rows = []
+    for index_type in types or INDEX_TYPES:
+        if index_type != "flat" and ntotal < 256:
+            print(f"⏭️  {index_type}: too few vectors to train")
+            continue
+        start = time.perf_counter()
+        index = flat if index_type == "flat" else build_index(vectors, index_type)
+        build_time = time.perf_counter() - start
+        memory = len(faiss.serialize_index(index)) / 1e6
+
+        settings = [{}]
+        if index_type in ("ivf", "ivfpq"):
+            settings = [{'nprobe': n} for n in nprobe_values]
+        elif index_type == "hnsw":
+            settings = [{'efSearch': n} for n in (16, 64, 256)]
+
+        for params in settings:
+            set_search_params(index, params)
+            recall, latency = measure(index)
+            label = index_type + "".join(f" {name}={value}" for name, value in params.items())
+            rows.append({'index': label, f'recall@{k}': recall, 'latency_ms': latency,
+                         'memory_mb': memory, 'build_s': build_time})
+            print(f"{label:<22} recall@{k} {recall:6.3f}  {latency:7.3f} ms/query  "
+                  f"{memory:8.1f} MB  built in {build_time:6.2f}s")
+    return rows
+
+# Time the hybrid BM25 + vector retrieval step
+def bench_hybrid(index_dir="vectorstore/", k=3, fetch_k=20, num_queries=200):
+    """
+    Report p50/p95/max latency of the dense search, the BM25 search and the
+    fused hybrid step (including the chunk fetch), excluding the query
+    embedding, which is shared by both paths
+    """
+    import faiss
+    import numpy as np
+    from bm25 import reciprocal_rank_fusion
+    from vector_store import flat_vectors, load_vector_store
+
+    db = load_vector_store(index_dir, None)
+    bm25_index = getattr(db, 'bm25', None)
+    if bm25_index is None:
+        print("❌ No BM25 index or SQLite chunk store, run ingest.py first")
+        return None
+
+    # Queries: a few words from a random chunk, with that chunk's vector plus a little noise
+    rng = np.random.default_rng(0)
+    ntotal = db.index.ntotal
+    positions = rng.choice(ntotal, size=num_queries, replace=ntotal < num_queries)
+    vectors = flat_vectors(faiss.read_index(os.path.join(index_dir, "index.faiss")))
+    queries = []
+    for position in positions:
+        words = db.get_by_positions([position])[0].page_content.split()
+        start = int(rng.integers(0, max(1, len(words) - 8)))
+        vector = vectors[position] + rng.normal(scale=0.01, size=vectors.shape[1]).astype(np.float32)
+        queries.append((" ".join(words[start:start + 8]), vector))
+
+    def timed(step):
+        latencies = []
+        for text, vector in queries:
+            start = time.perf_counter()
+            step(text, vector)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return np.percentile(latencies, 50), np.percentile(latencies, 95), max(latencies)
+
+    def hybrid(text, vector):
+        dense = db.search_positions(vector, fetch_k)
+        sparse = [position for position, _ in bm25_index.search(text, fetch_k)]
+        db.get_by_positions(reciprocal_rank_fusion([dense, sparse])[:k])
+
+    print(f"📚 {ntotal} chunks, {len(bm25_index.term_ids)} terms, {num_queries} queries, fetch_k={fetch_k}")
+    rows = {}
+    for label, step in (("dense", lambda text, vector: db.search_positions(vector, fetch_k)),
+                        ("bm25", lambda text, vector: bm25_index.search(text, fetch_k)),
+                        ("hybrid", hybrid)):
+        p50, p95, worst = timed(step)
+        rows[label] = {'p50_ms': p50, 'p95_ms': p95, 'max_ms': worst}
+        print(f"{label:<8} p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  max {worst:7.3f} ms")
+    return rows
+
+# Full vs domain-routed vector search
+def bench_domains(index_dir="vectorstore/", k=10, num_queries=200):
+    """
+    Route queries built from random chunks to domain partitions and report
+    the latency of the routed search against the whole index, the share of
+    the index each routed query scans, how often the source chunk is found
+    and recall@k against an exact search of the whole index
+    """
+    import faiss
+    import numpy as np
+    from vector_store import flat_vectors, load_vector_store
+
+    db = load_vector_store(index_dir, None)
+    partitions = getattr(db, 'partitions', None)
+    if partitions is None:
+        print("❌ No domain partitions, run ingest.py first")
+        return None
+
+    rng = np.random.default_rng(0)
+    ntotal = db.index.ntotal
+    positions = rng.choice(ntotal, size=num_queries, replace=ntotal < num_queries)
+    vectors = flat_vectors(faiss.read_index(os.path.join(index_dir, "index.faiss")))
+    queries = []
+    for position in positions:
+        words = db.get_by_positions([position])[0].page_content.split()
+        start = int(rng.integers(0, max(1, len(words) - 8)))
+        vector = vectors[position] + rng.normal(scale=0.01, size=vectors.shape[1]).astype(np.float32)
+        queries.append((int(position), " ".join(words[start:start + 8]), vector))
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(np.asarray([vector for _, _, vector in queries]), k)
+
+    print(f"📚 {ntotal} chunks in {len(partitions.info)} partitions: "
+          + ", ".join(f"{name} {info['count']}" for name, info in sorted(partitions.info.items())))
+    latencies, recalls, hits, shares = {'full': [], 'routed': []}, {'full': [], 'routed': []}, {'full': 0, 'routed': 0}, []
+    for (position, text, vector), relevant in zip(queries, truth):
+        start = time.perf_counter()
+        found = {'full': db.search_positions(vector, k)}
+        latencies['full'].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        domains = partitions.route(text, vector)
+        found['routed'] = db.search_positions(vector, k, domains)
+        latencies['routed'].append((time.perf_counter() - start) * 1000)
+
+        shares.append(1.0 if domains is None else sum(partitions.info[d]['count'] for d in domains) / ntotal)
+        for label, result in found.items():
+            recalls[label].append(len(set(result) & set(relevant.tolist())) / k)
+            hits[label] += position in result
+
+    rows = {}
+    for label in ("full", "routed"):
+        rows[label] = {'p50_ms': float(np.percentile(latencies[label], 50)),
+                       'p95_ms': float(np.percentile(latencies[label], 95)),
+                       'recall_at_k': float(np.mean(recalls[label])), 'hit_rate': hits[label] / num_queries}
+        print(f"{label:<7} p50 {rows[label]['p50_ms']:7.3f} ms  p95 {rows[label]['p95_ms']:7.3f} ms  "
+              f"recall@{k} {rows[label]['recall_at_k']:.3f}  source chunk found {rows[label]['hit_rate']:.1%}")
+    rows['routed']['scanned_share'] = float(np.mean(shares))
+    print(f"Routed queries scan {np.mean(shares):.1%} of the index on average")
+    return rows
+
+# The LLM gateway under a burst of partly identical questions
+def bench_gateway(num_requests=200, distinct=20, concurrency=32, latency=0.5, error_rate=0.05, hang_rate=0.02,
+                  timeout=5.0, hedge_after=None):
+    """
+    Send num_requests prompts, drawn from distinct different ones, from
+    concurrency threads to a fake LLM that injects latency, errors and
+    hangs, once directly and once through the gateway. Reports upstream
+    calls, latency and how many requests got no answer within timeout.
+    """
+    import random
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    from fake_llm import FakeLLM
+    from llm_gateway import LLMGateway
+
+    rng = random.Random(0)
+    prompts = [f"Trending question {rng.randrange(distinct)}" for _ in range(num_requests)]
+    print(f"📚 {num_requests} requests over {distinct} distinct prompts, {concurrency} at once, fake LLM latency "
+          f"{latency}s, {error_rate:.0%} errors, {hang_rate:.0%} hangs")
+
+    rows = {}
+    for label in ("direct", "gateway"):
+        fake = FakeLLM(latency=latency, error_rate=error_rate, hang_rate=hang_rate, hang=timeout * 2, seed=0)
+        llm = fake if label == "direct" else LLMGateway(fake, timeout=timeout, hedge_after=hedge_after)
+
+        def ask(prompt):
+            start = time.perf_counter()
+            try:
+                llm.invoke(prompt)
+                ok = True
+            except Exception:
+                ok = False
+            return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(ask, prompts))
+        wall = time.perf_counter() - start
+        latencies = [seconds for seconds, _ in results]
+        rows[label] = {'upstream_calls': fake.calls,
+                       'unanswered': sum(not ok or seconds > timeout for seconds, ok in results),
+                       'p50_s': float(np.percentile(latencies, 50)), 'p95_s': float(np.percentile(latencies, 95)),
+                       'max_s': max(latencies), 'wall_s': wall}
+        if label == "gateway":
+            rows[label].update(llm.stats())
+        print(f"{label:<8} {fake.calls:4d} upstream calls  p50 {rows[label]['p50_s']:6.2f}s  "
+              f"p95 {rows[label]['p95_s']:6.2f}s  max {rows[label]['max_s']:6.2f}s  "
+              f"{rows[label]['unanswered']} unanswered  ({wall:.1f}s wall)")
+    return rows
+
+# Throughput of answer_questions vs a loop over answer_question
+def bench_batch(index_dir="vectorstore/", num_questions=100, llm_latency=0.5, concurrency=8):
+    """
+    Answer the same questions one at a time and as a batch, with a
+    stand-in LLM that sleeps llm_latency seconds per call, and report
+    questions per second
+    """
+    import numpy as np
+    from langchain_core.runnables import RunnableLambda
+    from query_cache import CachedQueryEmbeddings
+    from vector_store import load_vector_store, load_store_embeddings
+    from utils_gemini import answer_question, answer_questions
+
+    model = load_store_embeddings(index_dir, device='cpu')
+    llm = RunnableLambda(lambda prompt: time.sleep(llm_latency) or f"Answer based on {len(prompt)} characters")
+
+    def qa_system():
+        # Fresh query cache, so the second run doesn't reuse the first one's embeddings
+        embeddings = CachedQueryEmbeddings(model)
+        return {'llm': llm, 'db': load_vector_store(index_dir, embeddings), 'embeddings': embeddings,
+                'answer_cache': None, 'index_version': None}
+
+    # Questions: a few words from random chunks
+    system = qa_system()
+    rng = np.random.default_rng(0)
+    if hasattr(system['db'], 'get_by_positions'):
+        positions = rng.integers(0, system['db'].index.ntotal, size=num_questions)
+        texts = [doc.page_content for doc in system['db'].get_by_positions(positions)]
+    else:
+        texts = [doc.page_content for doc in system['db'].docstore._dict.values()]
+    questions = []
+    for i in range(num_questions):
+        words = texts[i % len(texts)].split()
+        start = int(rng.integers(0, max(1, len(words) - 10)))
+        questions.append(f"What does this mean: {' '.join(words[start:start + 10])}?")
+
+    print(f"📚 {num_questions} questions, stand-in LLM latency {llm_latency}s, concurrency {concurrency}")
+    start = time.perf_counter()
+    for question in questions:
+        answer_question(system, question)
+    sequential = time.perf_counter() - start
+
+    system = qa_system()
+    start = time.perf_counter()
+    first = None
+    for _ in answer_questions(system, questions, max_concurrency=concurrency):
+        if first is None:
+            first = time.perf_counter() - start
+    batched = time.perf_counter() - start
+
+    print(f"⏱️  sequential {sequential:8.2f}s  {num_questions / sequential:7.2f} questions/s")
+    print(f"⏱️  batched    {batched:8.2f}s  {num_questions / batched:7.2f} questions/s  "
+          f"(first answer after {first:.2f}s)")
+    print(f"🚀 Speedup: {sequential / batched:.2f}x")
+    return {'sequential_s': sequential, 'batched_s': batched, 'first_answer_s': first}
+
+# Quality and latency of cross-encoder reranking
+def bench_rerank(index_dir="vectorstore/", num_queries=100, k=3, fetch_k=50, budgets=(0.05, 0.1, 0.25, 1.0)):
+    """
+    Questions are a dozen words from a random chunk, and that chunk is the
+    relevant answer. Report hit@k and MRR of the retrieval order and of the
+    reranked order under several time budgets, with reranking latency.
+    """
+    import numpy as np
+    from rerank import load_reranker
+    from vector_store import load_vector_store, load_store_embeddings
+    from utils_gemini import search_unique
+
+    embeddings = load_store_embeddings(index_dir, device='cpu')
+    db = load_vector_store(index_dir, embeddings)
+    reranker = load_reranker()
+    if reranker is None or not hasattr(db, 'get_by_positions'):
+        print("❌ Needs sentence-transformers and a published search index")
+        return None
+
+    rng = np.random.default_rng(0)
+    positions = rng.choice(db.index.ntotal, size=min(num_queries, db.index.ntotal), replace=False)
+    queries = []
+    for doc in db.get_by_positions(positions):
+        words = doc.page_content.split()
+        start = int(rng.integers(0, max(1, len(words) - 12)))
+        question = " ".join(words[start:start + 12])
+        relevant = " ".join(doc.page_content.split()).lower()
+        candidates = search_unique(db, embeddings.embed_query(question), k=fetch_k, fetch_k=2 * fetch_k,
+                                   question=question, bm25_index=getattr(db, 'bm25', None))
+        queries.append((question, relevant, candidates))
+
+    def quality(rankings):
+        hits, reciprocal_ranks = [], []
+        for (_, relevant, _), docs in zip(queries, rankings):
+            texts = [" ".join(doc.page_content.split()).lower() for doc in docs]
+            rank = texts.index(relevant) + 1 if relevant in texts else None
+            hits.append(rank is not None and rank <= k)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+        return float(np.mean(hits)), float(np.mean(reciprocal_ranks))
+
+    print(f"📚 {len(queries)} queries, {fetch_k} candidates each")
+    hit, mrr = quality([candidates for _, _, candidates in queries])
+    rows = [{'order': 'retrieval', f'hit@{k}': hit, 'mrr': mrr}]
+    print(f"{'retrieval':<18} hit@{k} {hit:6.3f}  MRR {mrr:6.3f}")
+    for budget in budgets:
+        reranker.time_budget = budget
+        results = [reranker.rerank(question, candidates, k=len(candidates)) for question, _, candidates in queries]
+        hit, mrr = quality([docs for docs, _ in results])
+        latencies = np.array([stats['seconds'] for _, stats in results]) * 1000
+        scored = np.mean([stats['scored'] for _, stats in results])
+        rows.append({'order': f'rerank {budget}s', f'hit@{k}': hit, 'mrr': mrr, 'scored': float(scored),
+                     'p50_ms': float(np.percentile(latencies, 50)), 'p95_ms': float(np.percentile(latencies, 95))})
+        print(f"{f'rerank {budget}s':<18} hit@{k} {hit:6.3f}  MRR {mrr:6.3f}  {scored:5.1f} scored  "
+              f"p50 {rows[-1]['p50_ms']:6.1f} ms  p95 {rows[-1]['p95_ms']:6.1f} ms")
+    return rows
+
+# Load test a running server
+def bench_load(url="http://localhost:5000", concurrency=32, num_requests=500, endpoint="/chat"):
+    """
+    Send num_requests chat requests from concurrency threads and report
+    throughput, latency percentiles and response status counts
+    """
+    import json
+    import urllib.error
+    import urllib.request
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+
+    questions = ["What is Section 420 IPC?", "Explain Article 21 of the Constitution.",
+                 "What is the punishment for theft?", "What are the grounds for divorce?",
+                 "What is anticipatory bail?", "What rights does an arrested person have?"]
+
+    def send(i):
+        body = json.dumps({'message': questions[i % len(questions)]}).encode('utf-8')
+        request = urllib.request.Request(url + endpoint, data=body, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 'error'
+        return status, time.perf_counter() - start
+
+    print(f"📚 {num_requests} requests to {url + endpoint} from {concurrency} clients")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = np.array([latency for status, latency in results if status == 200]) * 1000
+    summary = {'throughput_rps': num_requests / elapsed, 'statuses': statuses}
+    print(f"⏱️  {elapsed:.2f}s, {summary['throughput_rps']:.1f} requests/s, statuses {statuses}")
+    if len(latencies):
+        for name in ("p50", "p95", "p99"):
+            summary[f'{name}_ms'] = float(np.percentile(latencies, int(name[1:])))
+        print(f"⏱️  200 OK latency p50 {summary['p50_ms']:.0f} ms  p95 {summary['p95_ms']:.0f} ms  "
+              f"p99 {summary['p99_ms']:.0f} ms")
+    return summary
+
+# Labeled questions for the offline suite
+BENCHMARK_QUESTIONS = "benchmark_questions.json"
+
+def latency_summary(latencies, items=None):
+    """
+    Count, total seconds, p50/p95/p99 in ms and throughput (items per
+    second, one item per measurement unless given) of a list of timings
+    """
+    import numpy as np
+
+    latencies_ms = np.array(latencies) * 1000
+    total = float(sum(latencies))
+    items = len(latencies) if items is None else items
+    summary = {'count': len(latencies), 'total_s': total, 'throughput_per_s': items / total if total else None}
+    for name in ("p50", "p95", "p99"):
+        summary[f'{name}_ms'] = float(np.percentile(latencies_ms, int(name[1:]))) if len(latencies) else None
+    return summary
+
+def is_relevant(doc, label):
+    """
+    Whether a retrieved chunk matches a question label (source file and text)
+    """
+    source = os.path.basename(doc.metadata.get('source', '')).lower()
+    text = " ".join(doc.page_content.split()).lower()
+    return label['source'].lower() in source and " ".join(label['contains'].split()).lower() in text
+
+# End-to-end offline benchmark with quality metrics
+def bench_suite(dataset="dataset/", questions_file=BENCHMARK_QUESTIONS, ks=(1, 2, 3), rounds=5,
+                llm_latency=0.2, index_type="flat", embedding_model="all-MiniLM-L6-v2", embedding_backend=None,
+                output=None):
+    """
+    Run the whole pipeline on the bundled PDFs without network access: PDF
+    parse and split, embed, index build and load, then every labeled question
+    through prepare_answer, as the server answers it (citations, domain
+    routing, search, reranking and context building), and the gateway in
+    front of a fake LLM that answers after llm_latency seconds. Reports
+    p50/p95/p99 and throughput per stage, recall@k and MRR over the
+    labeled relevant chunks among those put into the prompt, and writes
+    everything as JSON to output (stdout if None). The questions are asked
+    rounds times with the answer and query caches off, so every round runs
+    the whole pipeline; quality is scored on the first.
+    """
+    import json
+    import shutil
+    import tempfile
+    import subprocess
+    from langchain_community.vectorstores import FAISS
+    from dedup import dedupe_files
+    from embedding_backends import load_embeddings
+    from ingest import BATCH_SIZE, find_pdf_files, iter_file_chunks
+    from manifest import file_hash
+    from fake_llm import FakeLLM
+    from llm_gateway import LLMGateway
+    from rerank import load_reranker
+    from telemetry import request_trace, span
+    from vector_store import build_search_index, load_vector_store
+    from utils_gemini import CONTEXT_K, prepare_answer
+
+    with open(questions_file, 'r', encoding='utf-8') as f:
+        questions = json.load(f)['questions']
+    stages = {}
+
+    # Same files as ingestion: byte-identical copies are skipped
+    pdf_files = sorted(dedupe_files({pdf_file: file_hash(pdf_file) for pdf_file in find_pdf_files(dataset)}))
+    print(f"📚 {len(pdf_files)} PDF files, {len(questions)} questions x {rounds} rounds, "
+          f"fake LLM latency {llm_latency}s")
+
+    # Parse and split as ingestion does; the chunks of a file arrive together
+    chunks, load_times, pages = [], [], 0
+    start = time.perf_counter()
+    for _, file_chunks in iter_file_chunks(pdf_files):
+        file_chunks = list(file_chunks)
+        chunks.extend(file_chunks)
+        pages += file_chunks[0].metadata['total_pages'] if file_chunks else 0
+        load_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+    stages['parse_split'] = latency_summary(load_times, len(chunks))
+
+    start = time.perf_counter()
+    embeddings = load_embeddings(embedding_model, embedding_backend, device='cpu')
+    stages['embedder_load'] = latency_summary([time.perf_counter() - start])
+    vectors, embed_times = [], []
+    for offset in range(0, len(chunks), BATCH_SIZE):
+        start = time.perf_counter()
+        vectors.extend(embeddings.embed_documents([chunk.page_content for chunk in chunks[offset:offset + BATCH_SIZE]]))
+        embed_times.append(time.perf_counter() - start)
+    stages['embed'] = latency_summary(embed_times, len(chunks))
+
+    index_dir = tempfile.mkdtemp(prefix="law-gpt-bench-")
+    try:
+        start = time.perf_counter()
+        flat_store = FAISS.from_embeddings(list(zip([chunk.page_content for chunk in chunks], vectors)), embeddings,
+                                           metadatas=[chunk.metadata for chunk in chunks])
+        build_search_index(index_dir, flat_store, index_type)
+        stages['index_build'] = latency_summary([time.perf_counter() - start], len(chunks))
+
+        start = time.perf_counter()
+        db = load_vector_store(index_dir, embeddings)
+        stages['index_load'] = latency_summary([time.perf_counter() - start])
+
+        qa_system = {'llm': LLMGateway(FakeLLM(latency=llm_latency)), 'db': db, 'embeddings': embeddings,
+                     'reranker': load_reranker(), 'answer_cache': None}
+        # Request spans, and the stage each is reported as (ingestion has its own 'embed')
+        stage_names = {'embed': 'query_embed', 'citations': 'citations', 'search': 'search', 'rerank': 'rerank',
+                       'prompt': 'prompt', 'llm_total': 'llm'}
+        timings = {name: [] for name in list(stage_names.values()) + ['end_to_end']}
+        first_round = []
+        for round_number in range(rounds):
+            for item in questions:
+                question = item['question']
+                with request_trace('suite') as trace:
+                    cache_key, _, prompt, _ = prepare_answer(qa_system, question)
+                    with span('llm_total'):
+                        qa_system['llm'].invoke(prompt)
+                for name, stage in stage_names.items():
+                    timings[stage].append(trace.spans.get(name, 0.0))
+                timings['end_to_end'].append(time.perf_counter() - trace.start)
+                if round_number == 0:
+                    first_round.append((item, db.get_by_ids(cache_key[2])))
+        if hasattr(db, 'close'):
+            db.close()
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    for name, latencies in timings.items():
+        stages[name] = latency_summary(latencies)
+
+    # recall@k: share of a question's labels matched in the top k; MRR: first relevant chunk
+    quality = {f'recall@{k}': 0.0 for k in ks}
+    reciprocal_ranks = []
+    per_question = []
+    for item, docs in first_round:
+        ranks = [next((rank for rank, doc in enumerate(docs, 1) if is_relevant(doc, label)), None)
+                 for label in item['relevant']]
+        for k in ks:
+            quality[f'recall@{k}'] += sum(rank is not None and rank <= k for rank in ranks) / len(ranks) / len(first_round)
+        found = [rank for rank in ranks if rank is not None]
+        reciprocal_ranks.append(1 / min(found) if found else 0.0)
+        per_question.append({'question': item['question'], 'ranks': ranks})
+    quality['mrr'] = sum(reciprocal_ranks) / len(reciprocal_ranks)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    results = {
+        'config': {'dataset': dataset, 'questions': questions_file, 'rounds': rounds, 'llm_latency_s': llm_latency,
+                   'index_type': index_type, 'embedding_model': embedding_model,
+                   'embedding_backend': getattr(embeddings, 'variant', 'torch'), 'context_k': CONTEXT_K,
+                   'reranker': qa_system['reranker'] is not None, 'commit': commit},
+        'corpus': {'files': len(pdf_files), 'pages': pages, 'chunks': len(chunks)},
+        'stages': stages,
+        'quality': quality,
+        'per_question': per_question,
+    }
+
+    for name, summary in stages.items():
+        print(f"{name:<12} p50 {summary['p50_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms  "
+              f"p99 {summary['p99_ms']:9.2f} ms  {summary['throughput_per_s'] or 0:9.1f}/s")
+    print("🎯 " + "  ".join(f"{name} {value:.3f}" for name, value in quality.items()))
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {output}")
+    else:
+        print(json.dumps(results, indent=2))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Law Chatbot benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Serial vs parallel PDF ingestion")
+    ingest_parser.add_argument("--workers", type=int, default=None)
+    ingest_parser.add_argument("--limit", type=int, default=None, help="Only use the first N PDFs")
+
+    index_parser = subparsers.add_parser("index", help="Recall vs latency vs memory of the index types")
+    index_parser.add_argument("--index-dir", default="vectorstore/")
+    index_parser.add_argument("-k", type=int, default=10)
+    index_parser.add_argument("--queries", type=int, default=200)
+
+    hybrid_parser = subparsers.add_parser("hybrid", help="Latency of BM25 + vector retrieval")
+    hybrid_parser.add_argument("--index-dir", default="vectorstore/")
+    hybrid_parser.add_argument("-k", type=int, default=3)
+    hybrid_parser.add_argument("--fetch-k", type=int, default=20)
+    hybrid_parser.add_argument("--queries", type=int, default=200)
+
+    domains_parser = subparsers.add_parser("domains", help="Domain-routed vs full vector search")
+    domains_parser.add_argument("--index-dir", default="vectorstore/")
+    domains_parser.add_argument("-k", type=int, default=10)
+    domains_parser.add_argument("--queries", type=int, default=200)
+
+    gateway_parser = subparsers.add_parser("gateway", help="LLM gateway vs direct calls against a fake LLM")
+    gateway_parser.add_argument("--requests", type=int, default=200)
+    gateway_parser.add_argument("--distinct", type=int, default=20, help="Distinct prompts among the requests")
+    gateway_parser.add_argument("--concurrency", type=int, default=32)
+    gateway_parser.add_argument("--latency", type=float, default=0.5, help="Seconds per fake LLM call")
+    gateway_parser.add_argument("--error-rate", type=float, default=0.05)
+    gateway_parser.add_argument("--hang-rate", type=float, default=0.02)
+    gateway_parser.add_argument("--timeout", type=float, default=5.0, help="Gateway deadline in seconds")
+    gateway_parser.add_argument("--hedge-after", type=float, default=None)
+
+    batch_parser = subparsers.add_parser("batch", help="Batched vs sequential question answering")
+    batch_parser.add_argument("--index-dir", default="vectorstore/")
+    batch_parser.add_argument("--questions", type=int, default=100)
+    batch_parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stand-in LLM call")
+    batch_parser.add_argument("--concurrency", type=int, default=8)
+
+    rerank_parser = subparsers.add_parser("rerank", help="Quality and latency of cross-encoder reranking")
+    rerank_parser.add_argument("--index-dir", default="vectorstore/")
+    rerank_parser.add_argument("--queries", type=int, default=100)
+    rerank_parser.add_argument("--fetch-k", type=int, default=50)
+
+    load_parser = subparsers.add_parser("load", help="Load test a running server")
+    load_parser.add_argument("--url", default="http://localhost:5000")
+    load_parser.add_argument("--endpoint", default="/chat")
+    load_parser.add_argument("--concurrency", type=int, default=32)
+    load_parser.add_argument("--requests", type=int, default=500)
+
+    suite_parser = subparsers.add_parser("suite", help="Offline end-to-end benchmark with recall@k and MRR, as JSON")
+    suite_parser.add_argument("--dataset", default="dataset/")
+    suite_parser.add_argument("--questions", default=BENCHMARK_QUESTIONS, help="Labeled question set")
+    suite_parser.add_argument("--rounds", type=int, default=5, help="Times each question is asked")
+    suite_parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    suite_parser.add_argument("--index-type", default="flat")
+    suite_parser.add_argument("--embedding-backend", default=None, help="torch, onnx or onnx-int8")
+    suite_parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        bench_ingest(workers=args.workers, limit=args.limit)
+    elif args.command == "index":
+        bench_index(index_dir=args.index_dir, k=args.k, num_queries=args.queries)
+    elif args.command == "hybrid":
+        bench_hybrid(index_dir=args.index_dir, k=args.k, fetch_k=args.fetch_k, num_queries=args.queries)
+    elif args.command == "domains":
+        bench_domains(index_dir=args.index_dir, k=args.k, num_queries=args.queries)
+    elif args.command == "gateway":
+        bench_gateway(num_requests=args.requests, distinct=args.distinct, concurrency=args.concurrency,
+                      latency=args.latency, error_rate=args.error_rate, hang_rate=args.hang_rate,
+                      timeout=args.timeout, hedge_after=args.hedge_after)
+    elif args.command == "batch":
+        bench_batch(index_dir=args.index_dir, num_questions=args.questions, llm_latency=args.llm_latency,
+                    concurrency=args.concurrency)
+    elif args.command == "rerank":
+        bench_rerank(index_dir=args.index_dir, num_queries=args.queries, fetch_k=args.fetch_k)
+    elif args.command == "load":
+        bench_load(url=args.url, concurrency=args.concurrency, num_requests=args.requests, endpoint=args.endpoint)
+    elif args.command == "suite":
+        bench_suite(dataset=args.dataset, questions_file=args.questions, rounds=args.rounds,
+                    llm_latency=args.llm_latency, index_type=args.index_type,
+                    embedding_backend=args.embedding_backend, output=args.output)
@@ -0,0 +1,178 @@
+# Sparse BM25 index over the chunks, fused with vector search
+import os
+import re
+import json
+import shutil
+import numpy as np
+
+# Directory of the BM25 index, inside the vector store directory
+BM25_DIR = "bm25"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+# Least depth of each ranking fused by hybrid search
+HYBRID_FETCH_K = 20
+
+# Words too common to be useful for matching
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+which who what when where how shall any such not no may be been being under into upon than other
+""".split())
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Split text into index terms
+def tokenize(text):
+    """
+    Lowercase alphanumeric tokens, keeping numbers such as "420" or "65b"
+    """
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+# Build and save the index
+def build_bm25_index(index_dir, texts):
+    """
+    Build the BM25 postings for texts (in index position order) and save
+    them as flat numpy arrays: per-term offsets into concatenated doc IDs
+    (uint32) and term frequencies (uint16), plus document lengths
+    """
+    postings = {}
+    doc_lengths = []
+    for position, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((position, count))
+
+    vocabulary = sorted(postings)
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    for i, term in enumerate(vocabulary):
+        offsets[i + 1] = offsets[i] + len(postings[term])
+    docs = np.empty(offsets[-1], dtype=np.uint32)
+    tfs = np.empty(offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(vocabulary):
+        entries = postings[term]
+        docs[offsets[i]:offsets[i + 1]] = [position for position, _ in entries]
+        tfs[offsets[i]:offsets[i + 1]] = [min(count, 65535) for _, count in entries]
+
+    directory = os.path.join(index_dir, BM25_DIR)
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "docs.npy"), docs)
+    np.save(os.path.join(tmp_dir, "tfs.npy"), tfs)
+    np.save(os.path.join(tmp_dir, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.uint32))
+    with open(os.path.join(tmp_dir, "vocabulary.json"), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    print(f"🔤 Built BM25 index: {len(vocabulary)} terms, {len(docs)} postings")
+
+# Memory-mapped BM25 index
+class BM25Index:
+    """
+    BM25 scorer over postings written by build_bm25_index
+    """
+
+    def __init__(self, directory, k1=K1, b=B):
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode='r')
+        self.offsets = load("offsets.npy")
+        self.docs = load("docs.npy")
+        self.tfs = load("tfs.npy")
+        doc_lengths = np.asarray(load("doc_lengths.npy"), dtype=np.float32)
+        with open(os.path.join(directory, "vocabulary.json"), 'r', encoding='utf-8') as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+
+        self.num_docs = len(doc_lengths)
+        self.k1 = k1
+        avg_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        # Per-document length normalization, precomputed once
+        self.norms = k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))
+
+    def search(self, query, k=10, mask=None):
+        """
+        Return [(position, score)] of the k best matching chunks, among the
+        positions set in the boolean mask if given
+        """
+        accumulated = None
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = np.asarray(self.docs[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = np.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            term_scores = idf * tfs * (self.k1 + 1) / (tfs + self.norms[docs])
+            if accumulated is None:
+                accumulated = np.zeros(self.num_docs, dtype=np.float32)
+            # A term's postings hold each document once, so plain fancy indexing is safe
+            accumulated[docs] += term_scores
+
+        if accumulated is None:
+            return []
+        if mask is not None:
+            accumulated[~mask] = 0
+        candidates = np.flatnonzero(accumulated)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-accumulated[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-accumulated[candidates])]
+        return [(int(position), float(accumulated[position])) for position in candidates]
+
+# Load the BM25 index of a vector store
+def load_bm25_index(index_dir):
+    """
+    Return the BM25 index of the vector store, or None if it has none
+    """
+    directory = os.path.join(index_dir, BM25_DIR)
+    if not os.path.exists(os.path.join(directory, "vocabulary.json")):
+        return None
+    return BM25Index(directory)
+
+# Merge rankings
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked lists of positions: score(d) = sum over lists of 1 / (k + rank)
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+# Dense + sparse retrieval
+def hybrid_search(db, bm25_index, question, query_vector, k=3, fetch_k=HYBRID_FETCH_K, domains=None):
+    """
+    Fuse the vector search and BM25 rankings with reciprocal rank fusion
+    and return the top k documents, from the given domains if any
+    """
+    dense = db.search_positions(query_vector, fetch_k, domains)
+    mask = db.partitions.mask(domains) if domains is not None and db.partitions is not None else None
+    sparse = [position for position, _ in bm25_index.search(question, fetch_k, mask)]
+    fused = reciprocal_rank_fusion([dense, sparse])[:k]
+    return db.get_by_positions(fused)
+
+# Dense + sparse retrieval for many questions
+def hybrid_search_batch(db, bm25_index, questions, query_vectors, k=3, fetch_k=HYBRID_FETCH_K, domains=None):
+    """
+    hybrid_search over a batch: one matrix vector search and one chunk
+    fetch for all questions. Returns a document list per question.
+    domains, if given, holds each question's domains or None.
+    """
+    domains = domains or [None] * len(questions)
+    dense = db.search_positions_batch(query_vectors, fetch_k, domains)
+    fused = []
+    for question, dense_positions, question_domains in zip(questions, dense, domains):
+        mask = db.partitions.mask(question_domains) if question_domains is not None and db.partitions else None
+        sparse = [position for position, _ in bm25_index.search(question, fetch_k, mask)]
+        fused.append(reciprocal_rank_fusion([dense_positions, sparse])[:k])
+    return db.get_by_positions_batch(fused)
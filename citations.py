@@ -0,0 +1,190 @@
+# Statute citation index: (act, section) → the chunks holding that provision
+import os
+import re
+import json
+
+# Citation index file, inside each published version
+CITATIONS_FILE = "citations.json"
+
+# Chunks after a section heading that are still counted as that section's text
+MAX_SECTION_CHUNKS = 4
+
+# A chunk with more headings than this is a table of contents, not the provisions
+MAX_HEADINGS_PER_CHUNK = 4
+
+# Bundled statutes: which PDFs hold them, how questions name them, and whether
+# they are divided into sections or articles
+ACTS = {
+    'ipc': {
+        'source': re.compile(r'penal code', re.I),
+        'aliases': re.compile(r'\b(?:indian penal code|penal code|i\.?p\.?c)\b\.?', re.I),
+        'unit': 'section',
+    },
+    'constitution': {
+        'source': re.compile(r'constitution of india', re.I),
+        'aliases': re.compile(r'\bconstitution\b', re.I),
+        'unit': 'article',
+    },
+    'evidence': {
+        'source': re.compile(r'evidence act', re.I),
+        'aliases': re.compile(r'\b(?:indian evidence act|evidence act|i\.?e\.?a)\b\.?', re.I),
+        'unit': 'section',
+    },
+}
+
+_NUMBER = r'\d{1,3}[A-Za-z]{0,2}'
+_NUMBER_RE = re.compile(rf'\b{_NUMBER}\b')
+_NUMBER_LIST = rf'{_NUMBER}\b(?:\s*(?:,|and|or|&|/)\s*{_NUMBER}\b)*'
+
+# "302. Punishment for murder.—Whoever ..." at the start of a line, optionally "Section 302."
+_HEADING_RE = re.compile(rf'^[ \t]*(?:(?i:section|sec\.|article|art\.)[ \t]*)?({_NUMBER})\.[ \t]+[A-Z][^\n]{{2,150}}?'
+                         r'(?:\.?[ \t]*[—–]|\.[ \t]*-|\.[ \t]*$)', re.M)
+
+# "Section 302", "Sections 302 and 304", "s. 65B", "u/s 420"
+_SECTION_RE = re.compile(rf'(?:\bsections?|\bsecs?\.?|\bss?\.|\bu/s\.?)\s*({_NUMBER_LIST})', re.I)
+
+# "Article 21", "Arts. 14 and 21"
+_ARTICLE_RE = re.compile(rf'(?:\barticles?|\barts?\.)\s*({_NUMBER_LIST})', re.I)
+
+# "302 IPC", "420 of the IPC": a bare number, then an act's name
+_BARE_NUMBER_RE = re.compile(rf'\b({_NUMBER})\b')
+
+# Words between a cited number and the act it belongs to
+_ACT_LINK_RE = re.compile(r'[\s,]*(?:of\s+)?(?:the\s+)?', re.I)
+
+# Any statute's name: "Companies Act", "Code of Civil Procedure", "CrPC"; "an act", "criminal act" aren't names
+_ANY_ACT_RE = re.compile(r"\b(?!(?:an?|the|this|that|any|such|same|every|no|criminal|guilty|overt|unlawful|illegal)\s)"
+                         r"[a-z][a-z.&'-]*\s+(?:act|code|sanhita)\b"
+                         r"|\bcode\s+of\s+(?:civil|criminal)\s+procedure\b"
+                         r"|\b(?:cr\.?\s?p\.?\s?c|c\.?p\.?c|bnss?|bsa|ndps|pocso)\b", re.I)
+
+def normalize_section(section):
+    """'65b' → '65B'"""
+    return section.upper()
+
+def source_act(source):
+    """
+    The bundled statute a PDF holds, from its file name, or None
+    """
+    name = os.path.basename(source or "")
+    for act, spec in ACTS.items():
+        if spec['source'].search(name):
+            return act
+    return None
+
+def find_headings(text):
+    """
+    Section/article numbers whose headings start a line of text
+    """
+    return [normalize_section(match.group(1)) for match in _HEADING_RE.finditer(text)]
+
+# Build and save the index
+def build_citation_index(index_dir, chunks):
+    """
+    chunks yields (position, source, text) in index position order. Each
+    section heading found in a statute's chunks maps (act, section) to that
+    chunk and the next few chunks of the same file, up to the next heading.
+    """
+    sections = {}
+    current = None
+    for position, source, text in chunks:
+        act = source_act(source)
+        if act is None:
+            current = None
+            continue
+        headings = find_headings(text)
+        if len(headings) > MAX_HEADINGS_PER_CHUNK:
+            current = None
+            continue
+        if headings:
+            for section in headings:
+                sections.setdefault(f"{act}:{section}", []).append(position)
+            current = {'key': f"{act}:{headings[-1]}", 'source': source, 'position': position, 'chunks': 1}
+        elif (current is not None and current['source'] == source and current['position'] == position - 1
+              and current['chunks'] < MAX_SECTION_CHUNKS):
+            sections[current['key']].append(position)
+            current.update(position=position, chunks=current['chunks'] + 1)
+        else:
+            current = None
+
+    path = os.path.join(index_dir, CITATIONS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'sections': sections}, f)
+    os.replace(tmp_path, path)
+    print(f"⚖️  Built citation index: {len(sections)} sections and articles")
+
+# Parse the provisions a question cites
+def parse_citations(text):
+    """
+    Return [(act or None, section)] in order of appearance. The act is the
+    one named right after the number ("Section 302 of the IPC"), else the
+    only statute named in the text; articles are the Constitution's. A
+    number followed by a statute that isn't bundled ("s.438 CrPC") is left
+    out, and the act is None only when the text names no statute at all.
+    """
+    named = [act for act, spec in ACTS.items() if spec['unit'] == 'section' and spec['aliases'].search(text)]
+    bundled = [match.span() for spec in ACTS.values() for match in spec['aliases'].finditer(text)]
+    other_acts = [match for match in _ANY_ACT_RE.finditer(text)
+                  if not any(start <= match.start() < end for start, end in bundled)]
+    default_act = named[0] if len(named) == 1 and not other_acts else None
+    any_act = bool(named or other_acts)
+
+    # The bundled act named after a number, False for another statute, else None
+    def act_after(end):
+        start = _ACT_LINK_RE.match(text, end).end()
+        act = next((act for act in named if ACTS[act]['aliases'].match(text, start)), None)
+        if act is None and _ANY_ACT_RE.match(text, start):
+            return False
+        return act
+
+    citations = []
+    for match in _SECTION_RE.finditer(text):
+        act = act_after(match.end())
+        if act is False or (act is None and default_act is None and any_act):
+            continue
+        citations.extend((act or default_act, normalize_section(number))
+                         for number in _NUMBER_RE.findall(match.group(1)))
+    for match in _ARTICLE_RE.finditer(text):
+        if act_after(match.end()) is False:
+            continue
+        citations.extend(('constitution', normalize_section(number)) for number in _NUMBER_RE.findall(match.group(1)))
+    for match in _BARE_NUMBER_RE.finditer(text):
+        act = act_after(match.end())
+        if act:
+            citations.append((act, normalize_section(match.group(1))))
+
+    return list(dict.fromkeys(citations))
+
+# Loaded citation index
+class CitationIndex:
+    """
+    (act, section) → chunk positions, as written by build_citation_index
+    """
+
+    def __init__(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            self.sections = json.load(f)['sections']
+
+    def lookup(self, citations):
+        """
+        Chunk positions of the cited provisions, in citation order. A
+        section cited without an act is looked up in every statute
+        divided into sections.
+        """
+        positions = []
+        for act, section in citations:
+            acts = [act] if act else [name for name, spec in ACTS.items() if spec['unit'] == 'section']
+            for name in acts:
+                positions.extend(self.sections.get(f"{name}:{section}", ()))
+        return list(dict.fromkeys(positions))
+
+# Load the citation index of a version
+def load_citation_index(index_dir):
+    """
+    Return the citation index in index_dir, or None if it has none
+    """
+    path = os.path.join(index_dir, CITATIONS_FILE)
+    if not os.path.exists(path):
+        return None
+    return CitationIndex(path)
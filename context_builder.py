@@ -0,0 +1,166 @@
+# Token-budgeted context assembly for the prompt
+import re
+import math
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from bm25 import tokenize
+from telemetry import log
+
+# Tokens of retrieved text allowed in one prompt
+CONTEXT_TOKEN_BUDGET = 1200
+
+# Average characters per token, for models without a local tokenizer (Gemini)
+CHARS_PER_TOKEN = 4
+
+# Overlap between adjacent chunks is searched for within this many characters
+# (ingestion uses chunk_overlap=200; the splitter may shift it to a word boundary)
+MAX_OVERLAP = 400
+MIN_OVERLAP = 40
+
+# Marks text left out between two kept sentences of a chunk
+GAP = " … "
+
+_SENTENCE_RE = re.compile(r'(?<=[.;:?!])\s+|\n\s*\n')
+
+# Count tokens without a tokenizer
+def estimate_tokens(text):
+    """
+    Approximate token count, about CHARS_PER_TOKEN characters per token
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# Token counter for the target model
+def make_token_counter(tokenizer_name=None):
+    """
+    Return a function counting tokens with the named HuggingFace tokenizer,
+    or estimate_tokens when there is none (Gemini only counts remotely)
+    """
+    if tokenizer_name is None:
+        return estimate_tokens
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    except Exception as e:
+        print(f"⚠️  Tokenizer {tokenizer_name} unavailable, estimating tokens: {e}")
+        return estimate_tokens
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+def _overlap(left, right):
+    """Length of the longest suffix of left that starts right (at least MIN_OVERLAP characters)"""
+    tail = left[-MAX_OVERLAP:]
+    probe = right[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    position = tail.find(probe)
+    while position != -1:
+        if right.startswith(tail[position:]):
+            return len(tail) - position
+        position = tail.find(probe, position + 1)
+    return 0
+
+# Remove text repeated between adjacent chunks
+def strip_overlaps(texts):
+    """
+    Cut from each text the start or end it shares with an earlier text,
+    as produced by chunk_overlap between neighbouring chunks
+    """
+    kept = []
+    for text in texts:
+        text = text.strip()
+        for previous in kept:
+            text = text[_overlap(previous, text):].lstrip()
+            cut = _overlap(text, previous)
+            if cut:
+                text = text[:-cut].rstrip()
+        kept.append(text)
+    return kept
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence.strip()]
+
+# Choose what goes into the prompt
+def select_context(question, docs, token_budget=CONTEXT_TOKEN_BUDGET, count_tokens=estimate_tokens):
+    """
+    Fit the retrieved docs into token_budget: drop overlapping text between
+    chunks, then keep the sentences that share the most (rare) words with
+    the question, preferring higher ranked chunks, until the budget is
+    full. Kept sentences stay in document order.
+    Returns (trimmed docs, stats) with tokens before and after.
+    """
+    texts = strip_overlaps([doc.page_content for doc in docs])
+    sentences = [(rank, position, sentence) for rank, text in enumerate(texts)
+                 for position, sentence in enumerate(split_sentences(text))]
+
+    # Weight question words by how rare they are among the retrieved sentences
+    terms = [set(tokenize(sentence)) for _, _, sentence in sentences]
+    query_terms = set(tokenize(question))
+    document_frequency = {term: sum(term in sentence_terms for sentence_terms in terms) for term in query_terms}
+    scores = [sum(math.log(1 + len(sentences) / document_frequency[term]) for term in sentence_terms & query_terms)
+              for sentence_terms in terms]
+
+    selected = set()
+    used = 0
+    for i in sorted(range(len(sentences)), key=lambda i: (-scores[i], sentences[i][0], sentences[i][1])):
+        tokens = count_tokens(sentences[i][2])
+        if used + tokens <= token_budget:
+            selected.add(i)
+            used += tokens
+
+    trimmed = []
+    for rank, doc in enumerate(docs):
+        kept = [i for i in range(len(sentences)) if sentences[i][0] == rank and i in selected]
+        if not kept:
+            continue
+        parts = [sentences[kept[0]][2]]
+        for previous, current in zip(kept, kept[1:]):
+            parts.append((" " if sentences[current][1] == sentences[previous][1] + 1 else GAP) + sentences[current][2])
+        trimmed.append(Document(page_content="".join(parts), metadata=doc.metadata, id=doc.id))
+
+    tokens_before = count_tokens("\n\n".join(doc.page_content for doc in docs))
+    tokens_after = count_tokens("\n\n".join(doc.page_content for doc in trimmed))
+    stats = {'tokens_before': tokens_before, 'tokens_after': tokens_after,
+             'tokens_saved': tokens_before - tokens_after}
+    return trimmed, stats
+
+def build_context(question, docs, token_budget=CONTEXT_TOKEN_BUDGET, count_tokens=estimate_tokens, pinned=()):
+    """
+    select_context joined into the prompt's context string. pinned docs
+    (the exact text of cited provisions) come first and are kept whole
+    while they fit the budget; docs share what is left. Returns (context, stats).
+    """
+    kept = []
+    used = 0
+    for text in strip_overlaps([doc.page_content for doc in pinned]):
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            break
+        kept.append(text)
+        used += tokens
+
+    trimmed, stats = select_context(question, docs, token_budget - used, count_tokens)
+    if pinned:
+        pinned_tokens = count_tokens("\n\n".join(doc.page_content for doc in pinned))
+        stats = {'tokens_before': stats['tokens_before'] + pinned_tokens, 'tokens_after': stats['tokens_after'] + used,
+                 'tokens_saved': stats['tokens_saved'] + pinned_tokens - used}
+    return "\n\n".join(kept + [doc.page_content for doc in trimmed]), stats
+
+def log_context_stats(stats):
+    log.info("✂️  Context: %d tokens, %d saved (of %d retrieved)",
+             stats['tokens_after'], stats['tokens_saved'], stats['tokens_before'])
+
+# Retriever for chains that stuff documents into the prompt
+class BudgetedRetriever(BaseRetriever):
+    """
+    Retrieve k chunks and trim them to a token budget with select_context
+    """
+
+    vectorstore: VectorStore
+    k: int = 4
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        docs = self.vectorstore.similarity_search(query, k=self.k)
+        trimmed, stats = select_context(query, docs, self.token_budget)
+        log_context_stats(stats)
+        return trimmed
@@ -0,0 +1,153 @@
+# Duplicate detection for source files and text chunks
+import re
+import zlib
+import hashlib
+import numpy as np
+
+# Mersenne prime used for the MinHash permutations
+_MERSENNE_PRIME = (1 << 31) - 1
+
+# Counts what deduplication saved
+class DedupReport:
+    """
+    Running totals of the files and chunks skipped as duplicates
+    """
+
+    def __init__(self):
+        self.duplicate_files = {}
+        self.file_bytes_saved = 0
+        self.exact_chunks = 0
+        self.near_chunks = 0
+        self.chunk_bytes_saved = 0
+
+    @property
+    def chunks_saved(self):
+        return self.exact_chunks + self.near_chunks
+
+    def print_summary(self, dimension=None):
+        """
+        Print how many bytes, chunks and vectors were saved
+        """
+        print("\n🧹 Deduplication Summary:")
+        print(f"📁 Duplicate files skipped: {len(self.duplicate_files)} ({self.file_bytes_saved / 1e6:.1f} MB)")
+        for duplicate, original in sorted(self.duplicate_files.items()):
+            print(f"   ↳ {duplicate} == {original}")
+        print(f"✂️  Duplicate chunks dropped: {self.chunks_saved} "
+              f"({self.exact_chunks} exact, {self.near_chunks} near-duplicate, "
+              f"{self.chunk_bytes_saved / 1e6:.1f} MB of text)")
+        if dimension:
+            print(f"🧠 Vectors saved: {self.chunks_saved} ({self.chunks_saved * dimension * 4 / 1e6:.1f} MB of float32)")
+        else:
+            print(f"🧠 Vectors saved: {self.chunks_saved}")
+
+# Drop byte-identical files
+def dedupe_files(file_hashes, sizes=None, report=None):
+    """
+    Keep one file of every group of identical files, preferring the shortest
+    path (so "X.pdf" wins over "X copy.pdf").
+    Returns the {path: hash} mapping of the files to ingest.
+    """
+    first_by_hash = {}
+    unique = {}
+    for path in sorted(file_hashes, key=lambda p: (len(p), p)):
+        content_hash = file_hashes[path]
+        original = first_by_hash.get(content_hash)
+        if original is None:
+            first_by_hash[content_hash] = path
+            unique[path] = content_hash
+        elif report is not None:
+            report.duplicate_files[path] = original
+            report.file_bytes_saved += sizes[path] if sizes else 0
+    return unique
+
+# Normalize chunk text before hashing
+def normalize_text(text):
+    """
+    Lowercase and collapse whitespace so trivial differences don't matter
+    """
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+# Exact and near-duplicate chunk filter
+class ChunkDeduplicator:
+    """
+    Detect chunks that were already seen, either exactly (SHA-1 of the
+    normalized text) or approximately (MinHash over word shingles with
+    LSH banding, verified against a Jaccard threshold), and tell which
+    kept chunk they duplicate.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, shingle_size=5, report=None, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.report = report if report is not None else DedupReport()
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._exact = {}
+        self._signatures = []
+        self._keys = []
+        self._buckets = {}
+
+    def _signature(self, normalized):
+        words = normalized.split(' ')
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = [normalized]
+        else:
+            shingles = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in set(shingles)), dtype=np.uint64)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def find_original(self, text, key):
+        """
+        Return the key of the chunk text duplicates, or None after
+        remembering text under key
+        """
+        normalized = normalize_text(text)
+        digest = hashlib.sha1(normalized.encode('utf-8')).digest()
+        if digest in self._exact:
+            self.report.exact_chunks += 1
+            self.report.chunk_bytes_saved += len(text.encode('utf-8'))
+            return self._exact[digest]
+
+        signature = self._signature(normalized)
+        keys = self._band_keys(signature)
+
+        candidates = set()
+        for band_key in keys:
+            candidates.update(self._buckets.get(band_key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                self.report.near_chunks += 1
+                self.report.chunk_bytes_saved += len(text.encode('utf-8'))
+                return self._keys[candidate]
+
+        self._exact[digest] = key
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._keys.append(key)
+        for band_key in keys:
+            self._buckets.setdefault(band_key, []).append(index)
+        return None
+
+    def seed(self, items):
+        """
+        Register already-indexed (key, text) chunks without counting them as duplicates
+        """
+        report = self.report
+        self.report = DedupReport()
+        for key, text in items:
+            self.find_original(text, key)
+        self.report = report
+
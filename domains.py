@@ -0,0 +1,165 @@
+# Per-domain partitions of the search index, and routing questions to them
+import os
+import re
+import json
+import numpy as np
+import faiss
+
+# Directory of the partitions, inside each published version
+DOMAINS_DIR = "domains"
+
+# Legal domains and the words that place a PDF (by file name) or a question in
+# one. A PDF goes to the first domain that matches, so the order matters.
+DOMAINS = {
+    'constitutional': re.compile(r'constitution|fundamental rights?|\barticles? \d|\bwrits?\b|secularism', re.I),
+    'evidence': re.compile(r'evidence|witness|confession|burden of proof', re.I),
+    'cyber': re.compile(r'cyber|information technology|\bit act\b|hack|electronic record|data protection', re.I),
+    'labour': re.compile(r'labou?r|employee|employment|wages?\b|industrial dispute|trade union|workm[ae]n|gratuity'
+                         r'|provident fund', re.I),
+    'banking': re.compile(r'bank|cheque|negotiable instrument|\bloans?\b|\brbi\b|sarfaesi', re.I),
+    'company': re.compile(r'compan(?:y|ies)|directors?\b|shareholders?|insolvency|winding up', re.I),
+    'contract': re.compile(r'contracts?\b|agreements?\b|breach|specific relief', re.I),
+    'criminal': re.compile(r'penal code|\bipc\b|criminal|crime|murder|theft|offen[cs]es?\b|\bbail\b|culpable', re.I),
+}
+
+# Domain of PDFs (and questions) that match none of the above; always searched when routing
+GENERAL_DOMAIN = "general"
+
+DOMAIN_NAMES = tuple(DOMAINS) + (GENERAL_DOMAIN,)
+
+# Questions matching no domain's words go to the partitions whose centroid is
+# within ROUTE_MARGIN cosine similarity of the best one, at most ROUTE_MAX_DOMAINS
+ROUTE_MARGIN = 0.05
+ROUTE_MAX_DOMAINS = 2
+
+# Search the whole index instead when the routed partitions hold more than this share of it
+MAX_ROUTED_SHARE = 0.6
+
+def source_domain(source):
+    """
+    The legal domain of a PDF, from its file name
+    """
+    name = os.path.basename(source or "")
+    return next((domain for domain, pattern in DOMAINS.items() if pattern.search(name)), GENERAL_DOMAIN)
+
+def question_domains(question):
+    """
+    Every domain whose words appear in the question
+    """
+    return [domain for domain, pattern in DOMAINS.items() if pattern.search(question)]
+
+# Build and save the partitions
+def build_domain_partitions(index_dir, vectors, domains, make_index, route=True):
+    """
+    Write one search index per domain over the vectors of its chunks
+    (built by make_index(vectors)), the index position of each of those
+    vectors, the domain of every position, and each domain's centroid.
+    route=False keeps unfiltered questions on the whole index.
+    """
+    directory = os.path.join(index_dir, DOMAINS_DIR)
+    os.makedirs(directory)
+    names = sorted(set(domains))
+    domain_ids = np.array([names.index(domain) for domain in domains], dtype=np.uint8)
+    np.save(os.path.join(directory, "domain_ids.npy"), domain_ids)
+
+    partitions = {}
+    for i, name in enumerate(names):
+        positions = np.flatnonzero(domain_ids == i).astype(np.int64)
+        partition_vectors = vectors[positions]
+        faiss.write_index(make_index(partition_vectors), os.path.join(directory, f"{name}.faiss"))
+        np.save(os.path.join(directory, f"{name}.positions.npy"), positions)
+        centroid = (partition_vectors / np.maximum(np.linalg.norm(partition_vectors, axis=1, keepdims=True), 1e-12)).mean(axis=0)
+        partitions[name] = {'id': i, 'count': len(positions),
+                            'centroid': (centroid / max(float(np.linalg.norm(centroid)), 1e-12)).tolist()}
+    with open(os.path.join(directory, "domains.json"), 'w', encoding='utf-8') as f:
+        json.dump({'route': route, 'partitions': partitions}, f)
+    print(f"🗂️  Built {len(names)} domain partitions: "
+          + ", ".join(f"{name} {info['count']}" for name, info in partitions.items()))
+
+# Loaded partitions
+class DomainPartitions:
+    """
+    Per-domain search indexes over disjoint subsets of the chunks. route()
+    picks the partitions a question needs and search() merges their hits,
+    so a query scans only those partitions.
+    """
+
+    def __init__(self, directory, flags=0):
+        with open(os.path.join(directory, "domains.json"), 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        self.info = layout['partitions']
+        self.routed = layout.get('route', True)
+        self.indexes = {name: faiss.read_index(os.path.join(directory, f"{name}.faiss"), flags) for name in self.info}
+        self.positions = {name: np.load(os.path.join(directory, f"{name}.positions.npy"), mmap_mode='r')
+                          for name in self.info}
+        self.domain_ids = np.load(os.path.join(directory, "domain_ids.npy"), mmap_mode='r')
+        self.names = sorted(self.info)
+        self.centroids = np.array([self.info[name]['centroid'] for name in self.names], dtype=np.float32)
+        self.total = sum(info['count'] for info in self.info.values())
+        self._masks = {}
+
+    def route(self, question, query_vector):
+        """
+        Return the domains to search for a question, or None for the whole
+        index: the domains its words name, else those whose centroid is
+        closest to the question, plus the general domain
+        """
+        if not self.routed:
+            return None
+        domains = [domain for domain in question_domains(question) if domain in self.info]
+        if not domains:
+            vector = np.asarray(query_vector, dtype=np.float32)
+            scores = self.centroids @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+            order = np.argsort(-scores)
+            domains = [self.names[i] for i in order[:ROUTE_MAX_DOMAINS] if scores[i] >= scores[order[0]] - ROUTE_MARGIN]
+        if GENERAL_DOMAIN in self.info and GENERAL_DOMAIN not in domains:
+            domains.append(GENERAL_DOMAIN)
+        if sum(self.info[domain]['count'] for domain in domains) > MAX_ROUTED_SHARE * self.total:
+            return None
+        return domains
+
+    def search(self, vector, k, domains):
+        """
+        Index positions of the k nearest chunks within the given domains, best first
+        """
+        return self.search_batch(np.asarray([vector], dtype=np.float32), k, [domains])[0]
+
+    def search_batch(self, vectors, k, domain_lists):
+        """
+        search() for many queries: one matrix search per partition over
+        the queries routed to it
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        hits = [[] for _ in range(len(vectors))]
+        queries_by_domain = {}
+        for query, domains in enumerate(domain_lists):
+            for domain in domains:
+                if domain in self.indexes:
+                    queries_by_domain.setdefault(domain, []).append(query)
+        for domain, queries in queries_by_domain.items():
+            distances, local = self.indexes[domain].search(vectors[queries], k)
+            positions = self.positions[domain]
+            for query, row_distances, row_local in zip(queries, distances, local):
+                hits[query].extend((float(d), int(positions[i])) for d, i in zip(row_distances, row_local) if i >= 0)
+        return [[position for _, position in sorted(query_hits)[:k]] for query_hits in hits]
+
+    def mask(self, domains):
+        """
+        Boolean mask over index positions of the chunks in the given domains
+        """
+        key = tuple(sorted(domains))
+        mask = self._masks.get(key)
+        if mask is None:
+            ids = [self.info[domain]['id'] for domain in domains if domain in self.info]
+            mask = self._masks[key] = np.isin(self.domain_ids, ids)
+        return mask
+
+# Load the partitions of a version
+def load_domain_partitions(index_dir, flags=0):
+    """
+    Return the domain partitions in index_dir, or None if it has none
+    """
+    directory = os.path.join(index_dir, DOMAINS_DIR)
+    if not os.path.exists(os.path.join(directory, "domains.json")):
+        return None
+    return DomainPartitions(directory, flags)
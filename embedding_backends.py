@@ -0,0 +1,287 @@
+# Pluggable embedding backends: sentence-transformers (PyTorch) or an exported ONNX graph
+#
+# Export once:  python embedding_backends.py export --model all-MiniLM-L6-v2
+# Then select:  LAW_GPT_EMBEDDING_BACKEND=onnx-int8  (or --embedding-backend for the ingest scripts)
+import os
+import re
+import json
+import argparse
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Available backends: PyTorch, ONNX Runtime in float32, ONNX Runtime with int8 weights
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Backend used when none is given
+DEFAULT_BACKEND = os.environ.get('LAW_GPT_EMBEDDING_BACKEND', 'torch')
+
+# Where exported ONNX models are kept
+ONNX_MODEL_DIR = "onnx_models/"
+
+# ONNX Runtime compute threads per process (default: all cores)
+EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', 0)) or None
+
+# Texts per ONNX forward pass
+ONNX_BATCH_SIZE = 32
+
+# Lowest cosine similarity to the PyTorch vector allowed for any sample text;
+# exports that don't reach it are refused, so existing indexes stay valid
+AGREEMENT_THRESHOLD = 0.97
+
+# Texts for the agreement check when there is no vector store to sample from
+AGREEMENT_SAMPLE = [
+    "What is the punishment for cheating under Section 420 of the Indian Penal Code?",
+    "Article 21 of the Constitution protects the right to life and personal liberty.",
+    "Anticipatory bail may be granted under Section 438 of the Code of Criminal Procedure.",
+    "A contract without consideration is void unless it falls under Section 25 of the Indian Contract Act.",
+    "The Industrial Disputes Act regulates lay-offs, retrenchment and closure of industrial establishments.",
+    "Electronic records are admissible as evidence under Section 65B of the Indian Evidence Act.",
+    "grounds for divorce",
+    "Sec. 302 IPC",
+]
+
+def hub_id(model_name):
+    """
+    Full HuggingFace Hub ID of a sentence-transformers model ("all-MiniLM-L6-v2" → "sentence-transformers/all-MiniLM-L6-v2")
+    """
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+def onnx_model_dir(model_name, model_dir=ONNX_MODEL_DIR):
+    return os.path.join(model_dir, re.sub(r'[^A-Za-z0-9._-]+', '_', hub_id(model_name)))
+
+def embedding_cache_name(model_name, embeddings):
+    """
+    Name the on-disk embedding cache keys the vectors of embeddings by:
+    int8 vectors are close to, but not the same as, the float ones
+    """
+    return f"{model_name}@int8" if getattr(embeddings, 'variant', None) == "onnx-int8" else model_name
+
+def embedder_model_name(embeddings):
+    """
+    Model name of an embedder, looking through cache wrappers, or None if unknown
+    """
+    while hasattr(embeddings, 'embeddings'):
+        embeddings = embeddings.embeddings
+    return getattr(embeddings, 'model_name', None)
+
+# Load the embedder for a model and backend
+def load_embeddings(model_name, backend=None, device=None, threads=EMBEDDING_THREADS, model_dir=ONNX_MODEL_DIR):
+    """
+    Return an Embeddings for model_name on the given backend (default:
+    LAW_GPT_EMBEDDING_BACKEND, else torch). ONNX backends fall back to
+    PyTorch, with a warning, when onnxruntime or the exported model is
+    missing or the export failed its agreement check. device only
+    applies to PyTorch (default: sentence-transformers' choice).
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+    if backend != "torch":
+        try:
+            return OnnxEmbeddings(onnx_model_dir(model_name, model_dir), quantized=backend == "onnx-int8",
+                                  threads=threads)
+        except Exception as e:
+            print(f"⚠️  ONNX embeddings unavailable, using PyTorch: {e}")
+
+    # Imported here so the ONNX path never loads torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device} if device else {})
+
+# Sentence embeddings from an exported ONNX graph
+class OnnxEmbeddings(Embeddings):
+    """
+    Run a sentence-transformers model exported by export_onnx_model with
+    ONNX Runtime: tokenize with the model's fast tokenizer, mean-pool the
+    token vectors over the attention mask and normalize, as the PyTorch
+    pipeline does. Needs only onnxruntime and tokenizers, not torch.
+    """
+
+    def __init__(self, directory, quantized=False, threads=EMBEDDING_THREADS, batch_size=ONNX_BATCH_SIZE,
+                 check_agreement=True):
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, "onnx_config.json"), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.model_name = self.config['model']
+        self.variant = "onnx-int8" if quantized else "onnx"
+        if check_agreement:
+            agreement = self.config.get('agreement', {}).get(self.variant)
+            if agreement is None or agreement['min'] < AGREEMENT_THRESHOLD:
+                raise ValueError(f"{self.variant} export of {self.config['model']} has no verified agreement "
+                                 f"with PyTorch (min cosine {agreement and agreement['min']}), re-export it")
+
+        self.directory = directory
+        self.path = os.path.join(directory, self.config['files'][self.variant])
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config['max_length'])
+        self.tokenizer.enable_padding(pad_id=self.config['pad_token_id'], pad_token=self.config['pad_token'])
+        self.reset_session(threads)
+        print(f"✅ ONNX embeddings loaded ({self.config['model']}, {self.variant})")
+
+    def reset_session(self, threads=None):
+        """
+        (Re)create the ONNX Runtime session, e.g. in a forked worker, whose
+        copy of the parent's session has lost its thread pool
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_vectors = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+        mask = feeds['attention_mask'][:, :, None].astype(np.float32)
+        vectors = (token_vectors * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config['normalize']:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def embed_documents(self, texts):
+        # Batch texts of similar length together so little time goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for offset in range(0, len(order), self.batch_size):
+            batch = order[offset:offset + self.batch_size]
+            for i, vector in zip(batch, self._embed([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+# Compare two embedders on the same texts
+def cosine_agreement(reference, candidate, texts):
+    """
+    Per-text cosine similarity between two embedders' vectors, summarized
+    as min, mean and the number of texts
+    """
+    a = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    cosines = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {'min': float(cosines.min()), 'mean': float(cosines.mean()), 'texts': len(texts)}
+
+def agreement_texts(index_dir="vectorstore/", limit=500):
+    """
+    Chunks of the existing vector store to compare vectors on, plus the
+    built-in sample questions
+    """
+    texts = list(AGREEMENT_SAMPLE)
+    try:
+        from vector_store import load_flat_store
+        docstore = load_flat_store(index_dir).docstore._dict
+        texts += [doc.page_content for doc in list(docstore.values())[:limit]]
+    except Exception as e:
+        print(f"⚠️  No vector store to sample chunks from, using the built-in sample: {e}")
+    return texts
+
+# Export a sentence-transformers model to ONNX
+def export_onnx_model(model_name, model_dir=ONNX_MODEL_DIR, quantize=True, index_dir="vectorstore/", opset=14):
+    """
+    Export the transformer of a sentence-transformers model to ONNX
+    (model.onnx), optionally with int8 dynamically quantized weights
+    (model.int8.onnx), save its tokenizer, and record the cosine agreement
+    of each with the PyTorch vectors in onnx_config.json. Needs torch,
+    transformers, sentence-transformers and onnxruntime; serving the export
+    only needs onnxruntime and tokenizers.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    directory = onnx_model_dir(model_name, model_dir)
+    os.makedirs(directory, exist_ok=True)
+    reference = SentenceTransformer(hub_id(model_name), device='cpu')
+    transformer, pooling = reference[0], reference[1]
+    if not pooling.pooling_mode_mean_tokens:
+        raise ValueError(f"{model_name} doesn't use mean pooling, which is all OnnxEmbeddings implements")
+
+    tokenizer = transformer.tokenizer
+    model = transformer.auto_model.eval()
+    sample = tokenizer(["export sample"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    print(f"📦 Exporting {model_name} to ONNX...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), os.path.join(directory, "model.onnx"),
+            input_names=input_names, output_names=['last_hidden_state'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']},
+            opset_version=opset)
+    tokenizer.save_pretrained(directory)
+    files = {'onnx': "model.onnx"}
+    if quantize:
+        print("🗜️  Quantizing weights to int8...")
+        quantize_dynamic(os.path.join(directory, "model.onnx"), os.path.join(directory, "model.int8.onnx"),
+                         weight_type=QuantType.QInt8)
+        files['onnx-int8'] = "model.int8.onnx"
+
+    config = {
+        'model': model_name,
+        'files': files,
+        'max_length': reference.max_seq_length,
+        'normalize': any(type(module).__name__ == 'Normalize' for module in reference),
+        'dimension': reference.get_sentence_embedding_dimension(),
+        'pad_token': tokenizer.pad_token,
+        'pad_token_id': tokenizer.pad_token_id,
+        'agreement': {},
+    }
+    with open(os.path.join(directory, "onnx_config.json"), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    config['agreement'] = check_onnx_model(model_name, model_dir, index_dir)
+    with open(os.path.join(directory, "onnx_config.json"), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    return config
+
+def check_onnx_model(model_name, model_dir=ONNX_MODEL_DIR, index_dir="vectorstore/"):
+    """
+    Measure how closely each exported variant reproduces the PyTorch
+    vectors on sample chunks; returns {variant: {min, mean, texts}}
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    directory = onnx_model_dir(model_name, model_dir)
+    with open(os.path.join(directory, "onnx_config.json"), 'r', encoding='utf-8') as f:
+        files = json.load(f)['files']
+    reference = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'})
+    texts = agreement_texts(index_dir)
+
+    results = {}
+    for variant in files:
+        candidate = OnnxEmbeddings(directory, quantized=variant == "onnx-int8", check_agreement=False)
+        results[variant] = cosine_agreement(reference, candidate, texts)
+        verdict = "✅" if results[variant]['min'] >= AGREEMENT_THRESHOLD else "❌"
+        print(f"{verdict} {variant}: cosine to PyTorch min {results[variant]['min']:.4f}, "
+              f"mean {results[variant]['mean']:.4f} over {len(texts)} texts")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and check ONNX embedding models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a model to ONNX (and int8) and check agreement")
+    export_parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Only export the float32 graph")
+
+    check_parser = subparsers.add_parser("check", help="Print the cosine agreement of an export with PyTorch")
+    check_parser.add_argument("--model", default="all-MiniLM-L6-v2")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx_model(args.model, quantize=not args.no_quantize)
+    elif args.command == "check":
+        check_onnx_model(args.model)
@@ -0,0 +1,240 @@
+# Persistent on-disk cache of chunk embeddings
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Default cache directory
+EMBEDDING_CACHE_DIR = "embedding_cache/"
+
+# Default maximum number of cached vectors per model
+MAX_ENTRIES = 500_000
+
+# Key length in bytes (SHA-1 digest)
+KEY_SIZE = 20
+
+# Build the cache key of a chunk
+def cache_key(model_name, text):
+    """
+    Return the cache key for (model name, normalized chunk text)
+    """
+    normalized = re.sub(r'\s+', ' ', text).strip()
+    return hashlib.sha1(f"{model_name}\0{normalized}".encode('utf-8')).digest()
+
+# Memory-mapped vector cache for one embedding model
+class EmbeddingCache:
+    """
+    Content-addressed store of float32 vectors.
+
+    Vectors live in a memory-mapped file (vectors.f32), with a parallel
+    array of 20-byte keys (keys.npy) and last-use ticks (last_used.npy).
+    When max_entries is reached, the least recently used tenth is evicted;
+    the freed slots are saved as free before new vectors reuse them.
+    """
+
+    def __init__(self, model_name, cache_dir=EMBEDDING_CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.directory = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9._-]+', '_', model_name))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.dimension = None
+        self.capacity = 0
+        self.count = 0
+        self.tick = 0
+        self._vectors = None
+        self._keys = np.zeros((0, KEY_SIZE), dtype=np.uint8)
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._slots = {}
+        self._free = []
+        self._unsaved = 0
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path("meta.json")):
+            return
+        try:
+            with open(self._path("meta.json"), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            keys = np.load(self._path("keys.npy"))
+            last_used = np.load(self._path("last_used.npy"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable embedding cache {self.directory}: {e}")
+            return
+        if meta.get('model_name') != self.model_name:
+            return
+
+        self.dimension = meta['dimension']
+        self.count = meta['count']
+        self.tick = meta['tick']
+        self._resize(max(meta['capacity'], self.count))
+        self._keys[:self.count] = keys[:self.count]
+        self._last_used[:self.count] = last_used[:self.count]
+        for slot, key in enumerate(self._keys[:self.count]):
+            if not key.any():
+                self._free.append(slot)
+            else:
+                self._slots[key.tobytes()] = slot
+
+    def _resize(self, capacity):
+        """
+        Grow the vector file and key arrays to hold capacity entries
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path("vectors.f32")
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(path, 'ab') as f:
+            f.truncate(max(os.path.getsize(path), capacity * self.dimension * 4))
+        self._vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension))
+
+        keys = np.zeros((capacity, KEY_SIZE), dtype=np.uint8)
+        keys[:len(self._keys)] = self._keys
+        last_used = np.zeros(capacity, dtype=np.int64)
+        last_used[:len(self._last_used)] = self._last_used
+        self._keys, self._last_used = keys, last_used
+        self.capacity = capacity
+
+    def _allocate(self):
+        """
+        Return a free slot, growing the file or evicting old entries if needed
+        """
+        if self._free:
+            return self._free.pop()
+        if self.count == self.capacity:
+            if self.capacity < self.max_entries:
+                self._resize(min(self.max_entries, max(1024, self.capacity * 2)))
+            else:
+                self._evict(max(1, self.max_entries // 10))
+                return self._free.pop()
+        slot = self.count
+        self.count += 1
+        return slot
+
+    def _evict(self, n):
+        """
+        Free the n least recently used slots, and save the key index
+        before any of them is overwritten
+        """
+        victims = np.argpartition(self._last_used[:self.count], n - 1)[:n]
+        for slot in victims:
+            del self._slots[self._keys[slot].tobytes()]
+            self._keys[slot] = 0
+            self._free.append(int(slot))
+        self.evictions += len(victims)
+        # Vectors are written through the memmap at once, keys only on save:
+        # a crash must not leave an evicted key on disk pointing at a new vector
+        self.save()
+
+    def get(self, key):
+        """
+        Return the cached vector for key, or None
+        """
+        slot = self._slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tick += 1
+        self._last_used[slot] = self.tick
+        return np.array(self._vectors[slot])
+
+    def put(self, key, vector):
+        """
+        Store a vector under key
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = vector.shape[0]
+        elif vector.shape[0] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dim vectors, got {vector.shape[0]}")
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate()
+            self._slots[key] = slot
+            self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+        self.tick += 1
+        self._vectors[slot] = vector
+        self._last_used[slot] = self.tick
+
+        self._unsaved += 1
+        if self._unsaved >= 1024:
+            self.save()
+
+    def save(self):
+        """
+        Flush vectors and write the key index
+        """
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        for name, array in (("keys.npy", self._keys), ("last_used.npy", self._last_used)):
+            tmp_path = self._path(name + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array[:self.count])
+            os.replace(tmp_path, self._path(name))
+        meta = {'model_name': self.model_name, 'dimension': self.dimension, 'count': self.count,
+                'capacity': self.capacity, 'tick': self.tick}
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path("meta.json"))
+        self._unsaved = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def print_stats(self):
+        """
+        Print hit/miss counters
+        """
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        print(f"🗃️  Embedding cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+              f"{self.evictions} evicted, {len(self)} entries")
+
+# Embeddings wrapper that consults the cache first
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an Embeddings model so document embeddings are served from an
+    EmbeddingCache and only cache misses go through the model
+    """
+
+    def __init__(self, embeddings, model_name, cache_dir=EMBEDDING_CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = EmbeddingCache(model_name, cache_dir, max_entries)
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+
+        # Embed each distinct missing text once
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            positions = list(missing.values())
+            computed = self.embeddings.embed_documents([texts[p[0]] for p in positions])
+            for key, indexes, vector in zip(missing, positions, computed):
+                self.cache.put(key, vector)
+                for i in indexes:
+                    vectors[i] = vector
+
+        return [vector.tolist() if isinstance(vector, np.ndarray) else list(vector) for vector in vectors]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def save(self):
+        self.cache.save()
@@ -0,0 +1,82 @@
+# Stand-in LLM with injected latency, errors and hangs, for testing the gateway without Gemini
+#
+# Serve with it:  LAW_GPT_FAKE_LLM="latency=0.5,error_rate=0.1" python flask_app.py
+import time
+import random
+import asyncio
+import threading
+
+class FakeLLMError(RuntimeError):
+    """Injected upstream failure"""
+
+class FakeLLM:
+    """
+    Answers every prompt after latency seconds (plus up to jitter more).
+    A share of calls fails with FakeLLMError (error_rate) or hangs for
+    hang seconds first (hang_rate), like an overloaded upstream. Exposes
+    the invoke / stream / astream methods the server uses, and counts the
+    calls it receives.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, hang_rate=0.0, hang=60.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang = hang
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Build from "latency=0.5,error_rate=0.1"; an empty spec or "1" gives the defaults
+        """
+        options = {}
+        for item in spec.split(","):
+            if "=" in item:
+                name, value = item.split("=", 1)
+                options[name.strip()] = float(value)
+        return cls(**options)
+
+    def _plan(self):
+        """
+        Count the call and draw its delay and whether it fails
+        """
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            delay = self.latency + self._random.random() * self.jitter
+        if roll < self.hang_rate:
+            delay = self.hang
+        return delay, self.hang_rate <= roll < self.hang_rate + self.error_rate
+
+    @staticmethod
+    def _answer(prompt):
+        return f"Answer based on {len(prompt)} characters of context."
+
+    def invoke(self, prompt, config=None):
+        delay, fails = self._plan()
+        time.sleep(delay)
+        if fails:
+            raise FakeLLMError("Injected LLM failure")
+        return self._answer(prompt)
+
+    def stream(self, prompt, config=None):
+        delay, fails = self._plan()
+        words = self._answer(prompt).split(" ")
+        for i, word in enumerate(words):
+            time.sleep(delay / len(words))
+            if fails and i == len(words) // 2:
+                raise FakeLLMError("Injected LLM failure")
+            yield word if i == 0 else " " + word
+
+    async def astream(self, prompt, config=None):
+        delay, fails = self._plan()
+        words = self._answer(prompt).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay / len(words))
+            if fails and i == len(words) // 2:
+                raise FakeLLMError("Injected LLM failure")
+            yield word if i == 0 else " " + word
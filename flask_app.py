@@ -1,18 +1,36 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS
 import os
+import hmac
 import json
-from utils_gemini import create_gemini_qa_system, answer_question
+from utils_gemini import (create_gemini_qa_system, load_gemini_llm, answer_question, answer_questions, stream_answer,
+                          DegradedAnswer)
+from request_limiter import RequestLimiter
+from domains import DOMAIN_NAMES
+from sessions import SESSION_ID_RE
+from telemetry import log, metrics
 import threading
 import time
 
 app = Flask(__name__)
 CORS(app)
 
+# Maximum number of questions in one /chat/batch request
+MAX_BATCH_SIZE = 500
+
+# Endpoints that go through the request queue
+LIMITED_ENDPOINTS = ('chat', 'chat_stream', 'chat_batch')
+
+# Set by wsgi.py, which loads the model before the server forks its workers
+PRELOAD = os.environ.get('LAW_GPT_PRELOAD') == '1'
+
 # Global variable to hold the Gemini QA system
 qa_system = None
 is_loading = False
 
+# Bounded queue in front of the chat endpoints
+limiter = RequestLimiter()
+
 def load_model():
     """Load the Gemini QA system in background"""
     global qa_system, is_loading
@@ -21,18 +39,140 @@ def load_model():
         qa_system = create_gemini_qa_system()
         is_loading = False
         print("✅ Law-GPT with Gemini loaded successfully!")
+        # Preloaded servers start watching in each worker, after the fork
+        if not PRELOAD:
+            watch_index()
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         is_loading = False
 
+def reload_model():
+    """Load a fresh QA system (e.g. for a new vector store), keeping the current one if that fails"""
+    global qa_system
+    new_system = create_gemini_qa_system()
+    if new_system is None:
+        print("❌ Reload failed, keeping the current QA system")
+        return False
+    qa_system = new_system
+    print("✅ Law-GPT reloaded")
+    return True
+
+def watch_index():
+    """Swap in newly published vector store versions in the background"""
+    if qa_system is not None and qa_system.get('index_swapper') is not None:
+        qa_system['index_swapper'].start_watching()
+
+def after_fork():
+    """Give a forked worker its own Gemini client (gRPC channels don't survive fork) and index watcher"""
+    if qa_system is not None:
+        qa_system['llm'] = load_gemini_llm()
+        # ONNX Runtime's thread pool doesn't survive fork either; one compute thread per worker
+        model = getattr(qa_system['embeddings'], 'embeddings', qa_system['embeddings'])
+        if hasattr(model, 'reset_session'):
+            model.reset_session(threads=1)
+        watch_index()
+
 # Start loading the model in background on startup
-threading.Thread(target=load_model, daemon=True).start()
+if not PRELOAD:
+    threading.Thread(target=load_model, daemon=True).start()
+
+@app.before_request
+def admit_request():
+    """Queue chat requests, replying 429 when the queue is full"""
+    if request.endpoint not in LIMITED_ENDPOINTS:
+        return None
+    if not limiter.acquire():
+        response = jsonify({
+            'error': True,
+            'response': 'The server is busy right now. Please try again in a moment.'
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = '1'
+        return response
+    g.admitted = True
+    return None
+
+@app.after_request
+def hold_slot_while_streaming(response):
+    """Keep a streamed response's queue slot until the stream is closed"""
+    if response.is_streamed and g.pop('admitted', False):
+        response.call_on_close(limiter.release)
+    return response
+
+@app.teardown_request
+def release_request(exc=None):
+    """Free the request's queue slot"""
+    if g.pop('admitted', False):
+        limiter.release()
 
 @app.route('/')
 def index():
     """Serve the HTML frontend"""
     return send_from_directory('.', 'index.html')
 
+def sse_event(payload):
+    """Format a Server-Sent Events message"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def not_ready_response(message):
+    """Return the JSON reply for an empty message or a model that isn't ready, or None"""
+    if not message:
+        return jsonify({
+            'error': True,
+            'response': 'Please provide a message.'
+        })
+    
+    return model_not_ready_response()
+
+def model_not_ready_response():
+    """Return the JSON reply for a model that is loading or failed to load, or None"""
+    # Check if model is still loading
+    if is_loading:
+        return jsonify({
+            'error': False,
+            'response': 'The Gemini AI model is still loading. Please wait a moment and try again.',
+            'loading': True
+        })
+    
+    # Check if model is loaded
+    if qa_system is None:
+        return jsonify({
+            'error': True,
+            'response': 'The Gemini AI model failed to load. Please try restarting the server.'
+        })
+    
+    return None
+
+def requested_domain(data):
+    """
+    The optional legal domain filter of a chat request, normalized.
+    Returns (domain, error response).
+    """
+    domain = data.get('domain') or None
+    if domain is None:
+        return None, None
+    domain = str(domain).strip().lower()
+    if domain not in DOMAIN_NAMES:
+        return None, (jsonify({
+            'error': True,
+            'response': f"Unknown domain '{domain}', expected one of {', '.join(DOMAIN_NAMES)}."
+        }), 400)
+    return domain, None
+
+def requested_session(data):
+    """
+    The optional chat session ID of a request. Returns (session ID, error response).
+    """
+    session_id = data.get('session_id') or None
+    if session_id is None:
+        return None, None
+    if not isinstance(session_id, str) or not SESSION_ID_RE.match(session_id):
+        return None, (jsonify({
+            'error': True,
+            'response': 'Invalid session_id: use 8 to 64 letters, digits, "-" or "_".'
+        }), 400)
+    return session_id, None
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat requests from frontend"""
@@ -41,56 +181,184 @@ def chat():
     try:
         data = request.get_json()
         message = data.get('message', '').strip()
+        domain, reply = requested_domain(data)
+        if reply is not None:
+            return reply
+        session_id, reply = requested_session(data)
+        if reply is not None:
+            return reply
         
-        if not message:
-            return jsonify({
-                'error': True,
-                'response': 'Please provide a message.'
-            })
-        
-        # Check if model is still loading
-        if is_loading:
-            return jsonify({
-                'error': False,
-                'response': 'The Gemini AI model is still loading. Please wait a moment and try again.',
-                'loading': True
-            })
-        
-        # Check if model is loaded
-        if qa_system is None:
-            return jsonify({
-                'error': True,
-                'response': 'The Gemini AI model failed to load. Please try restarting the server.'
-            })
+        reply = not_ready_response(message)
+        if reply is not None:
+            return reply
         
         # Get response from the Gemini QA system
-        print(f"📝 User question: {message}")
-        response = answer_question(qa_system, message)
+        log.debug("📝 User question: %s", message)
+        response = answer_question(qa_system, message, domain, session_id)
         
-        print(f"🤖 Gemini response: {response[:100]}...")
+        log.debug("🤖 Gemini response: %.100s...", response)
         
         return jsonify({
             'error': False,
             'response': response,
+            'degraded': isinstance(response, DegradedAnswer),
             'loading': False
         })
         
     except Exception as e:
-        print(f"❌ Error in chat endpoint: {e}")
+        log.exception("❌ Error in chat endpoint: %s", e)
         return jsonify({
             'error': True,
             'response': f'An error occurred: {str(e)}'
         })
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the answer token by token as Server-Sent Events"""
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '').strip()
+    domain, reply = requested_domain(data)
+    if reply is not None:
+        return reply
+    session_id, reply = requested_session(data)
+    if reply is not None:
+        return reply
+    
+    reply = not_ready_response(message)
+    if reply is not None:
+        return reply
+    
+    log.debug("📝 User question (streaming): %s", message)
+    
+    def generate():
+        for text in stream_answer(qa_system, message, domain, session_id):
+            yield sse_event({'token': text})
+        yield sse_event({'done': True})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of questions, streaming one JSON line per answer as each completes"""
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return jsonify({
+            'error': True,
+            'response': 'Please provide a list of questions.'
+        }), 400
+    if len(questions) > MAX_BATCH_SIZE:
+        return jsonify({
+            'error': True,
+            'response': f'At most {MAX_BATCH_SIZE} questions per batch.'
+        }), 400
+    questions = [str(question).strip() for question in questions]
+    if not all(questions):
+        return jsonify({
+            'error': True,
+            'response': 'Questions must not be empty.'
+        }), 400
+    
+    reply = model_not_ready_response()
+    if reply is not None:
+        return reply
+    
+    log.debug("📝 Batch of %d questions", len(questions))
+    
+    def generate():
+        for i, response in answer_questions(qa_system, questions):
+            yield json.dumps({'index': i, 'question': questions[i], 'response': response}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/admin/reload-index', methods=['POST'])
+def reload_index():
+    """Load the newest published vector store version now instead of at the next watcher check"""
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        # Behind a reverse proxy every request comes from localhost, so there is no safe default
+        return jsonify({'error': True, 'response': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode()):
+        return jsonify({'error': True, 'response': 'Forbidden'}), 403
+    
+    reply = model_not_ready_response()
+    if reply is not None:
+        return reply
+    
+    swapper = qa_system.get('index_swapper')
+    try:
+        swapped = swapper.reload()
+    except Exception as e:
+        log.exception("❌ Error reloading index: %s", e)
+        return jsonify({'error': True, 'response': f'Could not load the new index: {str(e)}'}), 500
+    return jsonify({'error': False, 'swapped': swapped, 'version': swapper.version})
+
 @app.route('/status')
 def status():
-    """Check if the Gemini model is ready"""
+    """Check if the Gemini model is ready; 503 until it is, so load balancers can gate on it"""
     global qa_system, is_loading
     return jsonify({
         'model_loaded': qa_system is not None,
         'is_loading': is_loading,
-        'status': 'loading' if is_loading else ('ready' if qa_system else 'error')
-    })
+        'status': 'loading' if is_loading else ('ready' if qa_system else 'error'),
+        'queue': limiter.stats(),
+        'llm': llm_stats()
+    }), 200 if qa_system is not None else 503
+
+def llm_stats():
+    """Stats of the LLM gateway, or None before the model is loaded"""
+    llm = qa_system['llm'] if qa_system is not None else None
+    return llm.stats() if hasattr(llm, 'stats') else None
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics of this worker process: stage latencies, caches, queue and index size"""
+    stats = limiter.stats()
+    metrics.set('law_gpt_requests_active', stats['active'])
+    metrics.set('law_gpt_requests_queued', stats['queued'])
+    metrics.set_total('law_gpt_requests_rejected_total', stats['rejected'])
+    metrics.set('law_gpt_model_loaded', int(qa_system is not None))
+    
+    llm = llm_stats()
+    if llm is not None:
+        metrics.set('law_gpt_llm_calls_active', llm['active'])
+        for name in ('calls', 'coalesced', 'hedges', 'timeouts', 'failures', 'rejected'):
+            metrics.set_total(f'law_gpt_llm_{name}_total', llm[name])
+        metrics.set('law_gpt_llm_circuit_open', int(llm['circuit'] != 'closed'))
+    
+    system = qa_system
+    if system is not None:
+        sessions = system.get('sessions')
+        if sessions is not None:
+            metrics.set('law_gpt_sessions', len(sessions))
+            metrics.set_total('law_gpt_sessions_evicted_total', sessions.evicted + sessions.expired)
+        
+        embeddings = system.get('embeddings')
+        for name, cache in (('query_embedding', getattr(embeddings, 'cache', None)),
+                            ('answer', system.get('answer_cache'))):
+            if cache is not None:
+                metrics.set_total('law_gpt_cache_hits_total', cache.hits, cache=name)
+                metrics.set_total('law_gpt_cache_lookups_total', cache.hits + cache.misses, cache=name)
+                metrics.set('law_gpt_cache_entries', len(cache), cache=name)
+        
+        db = system['db']
+        index = getattr(db, 'index', None)
+        if index is not None:
+            metrics.set('law_gpt_index_chunks', index.ntotal)
+        docstore_path = getattr(db, 'docstore_path', None)
+        if docstore_path is not None:
+            # Everything in the served version's directory: search index, chunk store, BM25 postings
+            size = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(os.path.dirname(docstore_path)) for name in names)
+            metrics.set('law_gpt_index_bytes', size)
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health')
 def health():
@@ -0,0 +1,37 @@
+# Gunicorn settings for the production server
+#
+# Run with:  gunicorn wsgi:app
+# Reload:    kill -HUP <master pid>  (new vectorstore/ versions are swapped in by each worker without one)
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Load the model and index once in the master, then fork
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+# Threads mostly wait on Gemini; the request queue in flask_app bounds real work
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 32))
+
+# Long answers stream for a while; old workers get time to finish them on reload
+timeout = 120
+graceful_timeout = 120
+keepalive = 5
+
+def on_reload(server):
+    """Reload the whole QA system in the master before the new workers are forked"""
+    import flask_app
+    flask_app.reload_model()
+
+def post_fork(server, worker):
+    """Per-worker setup: one compute thread per process, a fresh Gemini client and the index watcher"""
+    import faiss
+    faiss.omp_set_num_threads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    import flask_app
+    flask_app.after_fork()
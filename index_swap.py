@@ -0,0 +1,109 @@
+# Hot-swapping the served vector store when a new version is published
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+from vector_store import current_version, load_vector_store
+
+# Seconds between checks for a newly published version
+WATCH_INTERVAL = 10
+
+# Seconds to wait for requests on the old version before freeing it anyway
+DRAIN_TIMEOUT = 120
+
+# Loads new index versions next to the served one and swaps them in
+class IndexSwapper:
+    """
+    Owns qa_system['db']. Requests lease() the current store for as long
+    as they search it; swap() installs a new store with a single
+    assignment, waits until every lease on the old store is returned and
+    only then closes it.
+    """
+
+    def __init__(self, qa_system, index_dir, embeddings, drain_timeout=DRAIN_TIMEOUT):
+        self.qa_system = qa_system
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.drain_timeout = drain_timeout
+        self._leases = {}
+        self._condition = threading.Condition()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._rejected = None
+
+    @property
+    def version(self):
+        return getattr(self.qa_system['db'], 'version', None)
+
+    @contextmanager
+    def lease(self):
+        """
+        Yield the current store; a swap waits for it to be returned before freeing the store
+        """
+        with self._condition:
+            db = self.qa_system['db']
+            self._leases[id(db)] = self._leases.get(id(db), 0) + 1
+        try:
+            yield db
+        finally:
+            with self._condition:
+                self._leases[id(db)] -= 1
+                if not self._leases[id(db)]:
+                    del self._leases[id(db)]
+                    self._condition.notify_all()
+
+    def swap(self, new_db):
+        """
+        Serve new_db from now on, then drain and free the old store
+        """
+        with self._condition:
+            old_db = self.qa_system['db']
+            self.qa_system['db'] = new_db
+            drained = self._condition.wait_for(lambda: id(old_db) not in self._leases, self.drain_timeout)
+        if not drained:
+            print(f"⚠️  Requests still using the old index after {self.drain_timeout}s, freeing it anyway")
+        if hasattr(old_db, 'close'):
+            old_db.close()
+
+    def reload(self):
+        """
+        Load the published version if it isn't the one being served.
+        Returns True if the store was swapped. A version embedded with a
+        different model than the one loaded is refused: questions would be
+        embedded with the wrong model, so that takes a restart.
+        """
+        with self._reload_lock:
+            version = current_version(self.index_dir)
+            if version is None or version in (self.version, self._rejected):
+                return False
+            print(f"🔄 Loading index version {version}...")
+            try:
+                new_db = load_vector_store(self.index_dir, self.embeddings, version=version)
+            except ValueError as e:
+                self._rejected = version
+                print(f"❌ Not swapping to index version {version}: {e}. Restart the server to serve it.")
+                return False
+            # Page in the index before it takes traffic, so the first queries don't pay for it
+            if hasattr(new_db, 'search_positions'):
+                new_db.search_positions(np.zeros(new_db.index.d, dtype=np.float32), 1)
+            self.swap(new_db)
+            print(f"✅ Now serving index version {version}")
+            return True
+
+    def start_watching(self, interval=WATCH_INTERVAL):
+        """
+        Check for a new published version every interval seconds in a background thread
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"❌ Error loading new index version: {e}")
+
+        self._watcher = threading.Thread(target=watch, daemon=True)
+        self._watcher.start()
@@ -1,10 +1,18 @@
 # Importing Dependencies
 import os
-import glob
+import time
+import shutil
+import argparse
+import functools
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from manifest import file_hash, chunk_id_prefix, load_manifest, new_manifest, save_manifest, plan_update, prune_manifest
+from dedup import DedupReport, ChunkDeduplicator, dedupe_files
+from embedding_cache import CachedEmbeddings
+from embedding_backends import EMBEDDING_BACKENDS, embedding_cache_name, load_embeddings
+from page_store import PARSER_VERSION, PageStore, iter_parsed_pages
+from domains import source_domain
+from vector_store import INDEX_TYPES, build_search_index, load_index_meta, load_flat_store
 
 # Dataset Directory Path
 DATASET = "dataset/"
@@ -12,72 +20,312 @@ DATASET = "dataset/"
 # Faiss Index Path
 FAISS_INDEX = "vectorstore/"
 
-# Create Vector Store and Index
-def embed_all():
+# Embedding model (the HuggingFaceEmbeddings default)
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+# Chunking parameters
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 200
+
+# Number of chunks embedded and added to the index at a time
+BATCH_SIZE = 64
+
+# Seconds between checkpoints of the vector store and manifest
+CHECKPOINT_INTERVAL = 60
+
+# Find the PDF files to ingest
+def find_pdf_files(dataset=DATASET):
     """
-    Embed all files in the dataset directory
+    Find all PDF files in the dataset directory, in a stable order
     """
-    print("🚀 Starting document ingestion process...")
-    
-    # Get all PDF files recursively
     pdf_files = []
-    for root, dirs, files in os.walk(DATASET):
+    for root, dirs, files in os.walk(dataset):
         for file in files:
             if file.lower().endswith('.pdf'):
                 pdf_files.append(os.path.join(root, file))
-    
-    print(f"📚 Found {len(pdf_files)} PDF files to process")
-    
-    all_documents = []
-    successful_files = 0
-    failed_files = 0
-    
-    # Process each PDF individually
-    for pdf_file in pdf_files:
+
+    # os.walk order depends on the filesystem, sort so every run builds the same index
+    return sorted(pdf_files)
+
+# Split pages into chunks
+def split_pages(pages, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Split pages into chunks one page at a time, tagging each chunk with
+    the legal domain of its PDF. Runs inside pool workers.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for page in pages:
+        page.metadata.setdefault('domain', source_domain(page.metadata.get('source')))
+        chunks.extend(splitter.split_documents([page]))
+    return chunks
+
+# Stream the chunks of every PDF
+def iter_file_chunks(pdf_files, workers=1, store=None, file_hashes=None, **split_kwargs):
+    """
+    Yield (path, chunk iterator) per file. Pages are read from the
+    parsed-page store when it holds them, otherwise parsed and saved to
+    it. With workers > 1, parsing and splitting run in a process pool, in
+    page ranges for large PDFs. The chunk iterator raises if the file
+    can't be read.
+    """
+    max_pages = split_kwargs.pop('max_pages', None)
+    split = functools.partial(split_pages, **split_kwargs)
+    for pdf_file, chunks, error in iter_parsed_pages(pdf_files, workers, max_pages, store, file_hashes, split):
+        yield pdf_file, _raise_or_iter(chunks or [], error)
+
+def _raise_or_iter(chunks, error):
+    if error is not None:
+        raise RuntimeError(error)
+    yield from chunks
+
+# Save the vector store and manifest together
+def save_checkpoint(index_dir, vector_store, manifest):
+    """
+    Save the vector store, then the manifest that describes it
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_dir = os.path.join(index_dir, ".checkpoint")
+    vector_store.save_local(tmp_dir)
+    for name in os.listdir(tmp_dir):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(index_dir, name))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_manifest(index_dir, manifest)
+
+# Embed chunk streams into the vector store
+def stream_into_vector_store(index_dir, manifest, rebuild, removed_ids, file_chunks, embeddings,
+                             deduplicator=None, batch_size=BATCH_SIZE, checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Delete stale vectors, then embed and add new chunks batch by batch.
+
+    file_chunks yields (path, content hash, chunk iterator). Only one batch of
+    chunks is held at a time, and the store and manifest are checkpointed every
+    checkpoint_interval seconds so an interrupted run resumes where it stopped.
+    If a deduplicator is given, chunks that duplicate an indexed or earlier
+    chunk are dropped, and the kept chunk's ID is recorded in the file's
+    manifest entry. Returns (vector_store, stats).
+    """
+    vector_store = None
+    if not rebuild:
+        print("📂 Loading existing vector store...")
+        vector_store = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        indexed_ids = set(vector_store.index_to_docstore_id.values())
+        removed_ids = [doc_id for doc_id in removed_ids if doc_id in indexed_ids]
+        if removed_ids:
+            print(f"🗑️  Removing {len(removed_ids)} stale chunks...")
+            vector_store.delete(removed_ids)
+        if deduplicator is not None:
+            deduplicator.seed((doc_id, doc.page_content) for doc_id, doc in vector_store.docstore._dict.items())
+
+    stats = {'files': 0, 'failed': 0, 'chunks': 0}
+    batch = []
+    batch_ids = []
+    last_checkpoint = time.monotonic()
+
+    def flush():
+        nonlocal vector_store
+        if not batch:
+            return
+        texts = [doc.page_content for doc in batch]
+        metadatas = [doc.metadata for doc in batch]
+        text_embeddings = list(zip(texts, embeddings.embed_documents(texts)))
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=list(batch_ids))
+        else:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=list(batch_ids))
+        stats['chunks'] += len(batch)
+        batch.clear()
+        batch_ids.clear()
+
+    def checkpoint():
+        nonlocal last_checkpoint
+        flush()
+        if vector_store is not None:
+            save_checkpoint(index_dir, vector_store, manifest)
+            print(f"💾 Checkpoint: {vector_store.index.ntotal} chunks saved")
+        if isinstance(embeddings, CachedEmbeddings):
+            embeddings.save()
+        last_checkpoint = time.monotonic()
+
+    for path, content_hash, chunks in file_chunks:
+        # Resume an interrupted file from the first chunk that wasn't saved
+        entry = manifest['files'].get(path)
+        if entry is None or entry['hash'] != content_hash or entry.get('complete', True):
+            entry = {'hash': content_hash, 'chunk_ids': [], 'next_chunk': 0, 'complete': False}
+            manifest['files'][path] = entry
+        elif entry['next_chunk']:
+            print(f"⏩ Resuming {os.path.basename(path)} at chunk {entry['next_chunk']}")
+
+        prefix = chunk_id_prefix(path, content_hash)
+        print(f"📖 Processing: {os.path.basename(path)}")
         try:
-            print(f"📖 Processing: {os.path.basename(pdf_file)}")
-            loader = PyPDFLoader(pdf_file)
-            documents = loader.load()
-            all_documents.extend(documents)
-            successful_files += 1
-            print(f"✅ Successfully loaded {len(documents)} pages from {os.path.basename(pdf_file)}")
+            for i, chunk in enumerate(chunks):
+                if i < entry['next_chunk']:
+                    continue
+                entry['next_chunk'] = i + 1
+                doc_id = f"{prefix}-{i}"
+                if vector_store is not None and doc_id in vector_store.docstore._dict:
+                    # Saved before the manifest last time: track it again
+                    if doc_id not in entry['chunk_ids']:
+                        entry['chunk_ids'].append(doc_id)
+                    continue
+                original = deduplicator.find_original(chunk.page_content, doc_id) if deduplicator is not None else None
+                if original is not None:
+                    # Remembered so this file is embedded again if the kept chunk goes away
+                    if original not in entry.setdefault('duplicate_of', []):
+                        entry['duplicate_of'].append(original)
+                    continue
+                entry['chunk_ids'].append(doc_id)
+                batch.append(chunk)
+                batch_ids.append(doc_id)
+                if len(batch) >= batch_size:
+                    flush()
+                    if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                        checkpoint()
         except Exception as e:
-            failed_files += 1
-            print(f"❌ Error loading {os.path.basename(pdf_file)}: {str(e)}")
+            stats['failed'] += 1
+            print(f"❌ Error loading {os.path.basename(path)}: {str(e)}")
             print("⏭️  Skipping this file and continuing...")
             continue
-    
-    if not all_documents:
-        print("❌ No documents were successfully loaded!")
+
+        entry['complete'] = True
+        del entry['next_chunk']
+        stats['files'] += 1
+        print(f"✅ Finished {os.path.basename(path)} ({len(entry['chunk_ids'])} chunks)")
+
+    flush()
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.save()
+        embeddings.cache.print_stats()
+    if vector_store is None:
+        return None, stats
+
+    print("💾 Saving vector store...")
+    save_checkpoint(index_dir, vector_store, manifest)
+    return vector_store, stats
+
+# Create Vector Store and Index
+def embed_all(workers=None, rebuild=False, dedup=True, batch_size=BATCH_SIZE, checkpoint_interval=CHECKPOINT_INTERVAL,
+              cache=True, index_type="flat", index_params=None, embedding_backend=None,
+              embedding_model=EMBEDDING_MODEL, page_cache=True):
+    """
+    Embed new and changed files in the dataset directory
+    """
+    print("🚀 Starting document ingestion process...")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Get all PDF files recursively
+    pdf_files = find_pdf_files()
+
+    print(f"📚 Found {len(pdf_files)} PDF files")
+
+    # Compare against what is already in the vector store
+    settings = {'embedding_model': embedding_model, 'chunk_size': CHUNK_SIZE, 'chunk_overlap': CHUNK_OVERLAP,
+                'parser': PARSER_VERSION}
+    file_hashes = {pdf_file: file_hash(pdf_file) for pdf_file in pdf_files}
+
+    # Skip byte-identical copies of the same PDF
+    dedup_report = DedupReport()
+    if dedup:
+        sizes = {pdf_file: os.path.getsize(pdf_file) for pdf_file in pdf_files}
+        file_hashes = dedupe_files(file_hashes, sizes, dedup_report)
+        if dedup_report.duplicate_files:
+            print(f"🧹 Skipping {len(dedup_report.duplicate_files)} duplicate PDF files")
+
+    manifest = None
+    if not rebuild and os.path.exists(os.path.join(FAISS_INDEX, "index.faiss")):
+        manifest = load_manifest(FAISS_INDEX)
+    rebuild, changed, removed_ids = plan_update(manifest, file_hashes, settings)
+
+    if rebuild:
+        print("🔁 No matching manifest, rebuilding the whole vector store")
+        manifest = new_manifest(settings)
+    else:
+        prune_manifest(manifest, file_hashes, removed_ids)
+
+    if not changed and not removed_ids:
+        print("✅ Vector store is up to date, nothing to do!")
+        meta = load_index_meta(FAISS_INDEX) or {}
+        if (any(key not in meta for key in ('docstore', 'bm25', 'citations', 'domains', 'embedding'))
+                or meta.get('index_type') != index_type or index_params):
+            build_search_index(FAISS_INDEX, load_flat_store(FAISS_INDEX), index_type, settings=settings,
+                               **(index_params or {}))
         return
-    
-    print(f"\n📊 Processing Summary:")
-    print(f"✅ Successfully processed: {successful_files} files")
-    print(f"❌ Failed to process: {failed_files} files")
-    print(f"📄 Total pages loaded: {len(all_documents)}")
-    
-    print("\n🔄 Creating text chunks...")
-    # Create the splitter
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200)
-    # Split the documents into chunks
-    chunks = splitter.split_documents(all_documents)
-    print(f"✂️  Created {len(chunks)} text chunks")
-    
+
+    print(f"📄 {len(changed)} new, changed or interrupted files, {len(removed_ids)} stale chunks to remove")
+    print(f"⚙️  Using {workers} worker process(es), batches of {batch_size} chunks")
+
     print("\n🧠 Loading embeddings model...")
     # Load the embeddings
-    embeddings = HuggingFaceEmbeddings()
-    
-    print("🏗️  Creating vector store...")
-    # Create the vector store
-    vector_store = FAISS.from_documents(chunks, embeddings)
-    
-    print("💾 Saving vector store...")
-    # Save the vector store
-    vector_store.save_local(FAISS_INDEX)
-    
-    print(f"\n🎉 Successfully created vector store with {len(chunks)} chunks!")
+    embeddings = load_embeddings(embedding_model, embedding_backend)
+    if cache:
+        # Reuse vectors of chunks embedded by earlier runs
+        embeddings = CachedEmbeddings(embeddings, embedding_cache_name(embedding_model, embeddings))
+
+    # Stream the chunks into the vector store
+    # Each PDF is parsed once; later runs (e.g. with other chunking) read its pages back
+    store = PageStore() if page_cache else None
+    file_chunks = ((path, file_hashes[path], chunks)
+                   for path, chunks in iter_file_chunks(changed, workers, store, file_hashes))
+    deduplicator = ChunkDeduplicator(report=dedup_report) if dedup else None
+    vector_store, stats = stream_into_vector_store(FAISS_INDEX, manifest, rebuild, removed_ids, file_chunks,
+                                                   embeddings, deduplicator, batch_size, checkpoint_interval)
+
+    print(f"\n📊 Processing Summary:")
+    print(f"✅ Successfully processed: {stats['files']} files")
+    print(f"❌ Failed to process: {stats['failed']} files")
+    print(f"✂️  Embedded {stats['chunks']} new text chunks")
+    if store is not None:
+        store.print_stats()
+
+    if vector_store is None:
+        print("❌ No documents were successfully loaded!")
+        return
+
+    if dedup:
+        dedup_report.print_summary(dimension=vector_store.index.d)
+
+    # Build the (optionally compressed) search index the server loads
+    build_search_index(FAISS_INDEX, vector_store, index_type, settings=settings, **(index_params or {}))
+
+    print(f"\n🎉 Vector store now holds {vector_store.index.ntotal} chunks!")
     print(f"📂 Vector store saved to: {FAISS_INDEX}")
     print("✅ Ingestion process completed!")
 
 if __name__ == "__main__":
-    embed_all()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Embed the dataset PDFs into the FAISS vector store")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of PDF parsing processes (default: CPU count, 1 = serial)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore the manifest and rebuild the whole vector store")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Embed duplicate files and chunks too")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Chunks embedded per batch (bounds memory use)")
+    parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL,
+                        help="Seconds between vector store checkpoints")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't read or write the on-disk embedding cache")
+    parser.add_argument("--no-page-cache", action="store_true",
+                        help="Parse every PDF again instead of reading its pages from parsed_pages/")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="Search index: exact flat, IVF, IVF-PQ, HNSW or scalar-quantized (SQ8)")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=None,
+                        help="Run the embedding model with PyTorch, ONNX Runtime or ONNX with int8 weights "
+                             "(default: LAW_GPT_EMBEDDING_BACKEND or torch)")
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL,
+                        help="Embedding model; changing it rebuilds the store (see migrate_embeddings.py)")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: ~4*sqrt(chunks))")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists searched per query")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (default: dim/8)")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW search depth")
+    args = parser.parse_args()
+    index_params = {name: value for name, value in (('nlist', args.nlist), ('nprobe', args.nprobe),
+                                                    ('pq_m', args.pq_m), ('ef_search', args.ef_search))
+                    if value is not None}
+    embed_all(workers=args.workers, rebuild=args.rebuild, dedup=not args.no_dedup,
+              batch_size=args.batch_size, checkpoint_interval=args.checkpoint_interval,
+              cache=not args.no_cache, page_cache=not args.no_page_cache, index_type=args.index_type, index_params=index_params,
+              embedding_backend=args.embedding_backend, embedding_model=args.embedding_model)
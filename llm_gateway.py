@@ -0,0 +1,317 @@
+# Gateway in front of the LLM: coalescing, a concurrency cap, deadlines, hedging and circuit breaking
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from telemetry import log
+
+# LLM calls in flight at once per worker process, hedges included
+LLM_MAX_CONCURRENCY = int(os.environ.get('LAW_GPT_LLM_MAX_CONCURRENCY', 8))
+
+# Seconds a question waits for the LLM (for a free slot and the answer) before giving up
+LLM_TIMEOUT = float(os.environ.get('LAW_GPT_LLM_TIMEOUT', 30))
+
+# Seconds after which a second, hedged call is sent if the first hasn't answered (unset: never)
+LLM_HEDGE_AFTER = float(os.environ['LAW_GPT_LLM_HEDGE_AFTER']) if os.environ.get('LAW_GPT_LLM_HEDGE_AFTER') else None
+
+# Consecutive failed calls that open the circuit, and seconds it stays open before a trial call
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30
+
+class LLMUnavailable(RuntimeError):
+    """
+    No answer from the LLM: the circuit is open, every slot stayed busy,
+    the deadline passed or the upstream call failed
+    """
+
+# Circuit breaker
+class CircuitBreaker:
+    """
+    Closed until failure_threshold calls in a row fail, then open: calls
+    are refused without reaching the upstream. After cooldown seconds one
+    trial call is let through (half-open); its success closes the circuit
+    and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                log.info("🔌 LLM circuit closed")
+            self.state = "closed"
+            self.failures = 0
+
+    def abandon_trial(self):
+        """
+        A half-open trial call couldn't start: stay open for another cooldown
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                if self.state == "closed":
+                    self.trips += 1
+                log.warning("🔌 LLM circuit open after %d failures, retrying in %ds", self.failures, self.cooldown)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+# The gateway
+class LLMGateway:
+    """
+    Wraps an LLM with the same invoke / stream / astream /
+    batch_as_completed methods. Identical prompts in flight at the same
+    time share one upstream call; at most max_concurrency calls run at
+    once; every call has a deadline, and a slow one can be hedged with a
+    second call; a circuit breaker refuses calls while the upstream keeps
+    failing. Every way of not getting an answer raises LLMUnavailable.
+    """
+
+    def __init__(self, llm, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT, hedge_after=LLM_HEDGE_AFTER,
+                 breaker=None):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        # A slot is held until the upstream call returns, even after its caller gave up on it
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.active = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.hedges = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _count(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise LLMUnavailable("the LLM circuit is open after repeated failures")
+
+    def _acquire(self, deadline):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self.breaker.abandon_trial()
+            self._count('timeouts')
+            raise LLMUnavailable("no LLM slot became free before the deadline")
+        self._count('active')
+
+    def _release(self, _=None):
+        self._count('active', -1)
+        self._slots.release()
+
+    def _attempt(self, prompt):
+        """
+        Start one upstream call on a slot already held, releasing it when the call returns
+        """
+        self._count('calls')
+        future = self._executor.submit(self.llm.invoke, prompt)
+        future.add_done_callback(self._release)
+        return future
+
+    def _failed(self, reason, error=None):
+        self.breaker.record_failure()
+        raise LLMUnavailable(reason) from error
+
+    def _call(self, prompt, deadline):
+        """
+        One upstream answer for prompt within the deadline. With hedging,
+        a second call is sent if the first is slow or fails, when a slot is free.
+        """
+        self._admit()
+        self._acquire(deadline)
+        started = time.monotonic()
+        attempts = [self._attempt(prompt)]
+        hedged = self.hedge_after is None
+        error = None
+        while attempts:
+            now = time.monotonic()
+            if now >= deadline:
+                self._count('timeouts')
+                self._failed(f"the LLM didn't answer within {self.timeout:g}s", error)
+            wait_until = deadline if hedged else min(deadline, started + self.hedge_after)
+            done, pending = wait(attempts, timeout=wait_until - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.breaker.record_success()
+                    return future.result()
+                error = future.exception()
+            attempts = list(pending)
+            if not hedged and (not attempts or time.monotonic() >= started + self.hedge_after):
+                hedged = True
+                if self._slots.acquire(blocking=False):
+                    self._count('active')
+                    self._count('hedges')
+                    attempts.append(self._attempt(prompt))
+        self._count('failures')
+        self._failed(f"the LLM call failed: {error}", error)
+
+    def invoke(self, prompt, config=None, timeout=None):
+        """
+        Answer prompt, joining an identical call already in flight. When
+        the call it joined fails upstream, a question tries once more (the
+        questions that joined it share that retry too), so one failure
+        doesn't fail every question that was coalesced into it.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        retried = False
+        while True:
+            with self._lock:
+                flight = self._inflight.get(prompt)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[prompt] = Future()
+                else:
+                    self.coalesced += 1
+            if leader:
+                try:
+                    flight.set_result(self._call(prompt, deadline))
+                except Exception as e:
+                    flight.set_exception(e)
+                finally:
+                    with self._lock:
+                        del self._inflight[prompt]
+            try:
+                return flight.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                raise LLMUnavailable("the LLM didn't answer before the deadline") from None
+            except LLMUnavailable as e:
+                if leader or retried or e.__cause__ is None or time.monotonic() >= deadline:
+                    raise
+                retried = True
+
+    def batch_as_completed(self, prompts, config=None, *, return_exceptions=False):
+        """
+        Yield (index, answer) as each prompt is answered, with at most
+        config['max_concurrency'] questions waiting on the gateway at once
+        """
+        max_concurrency = (config or {}).get('max_concurrency') or self.max_concurrency
+        if not prompts:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(prompts), max_concurrency)) as pool:
+            futures = {pool.submit(self.invoke, prompt): i for i, prompt in enumerate(prompts)}
+            for future in as_completed(futures):
+                if future.exception() is not None and not return_exceptions:
+                    raise future.exception()
+                yield futures[future], future.exception() or future.result()
+
+    def stream(self, prompt, config=None, timeout=None):
+        """
+        Stream the answer to prompt. The deadline covers the whole stream;
+        each chunk is awaited on a gateway thread so a hung upstream can't
+        hold the caller past it.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._admit()
+        self._acquire(deadline)
+        self._count('calls')
+        chunks = None
+        waiting = None
+        try:
+            try:
+                chunks = iter(self.llm.stream(prompt))
+            except Exception as e:
+                self._count('failures')
+                self._failed(f"the LLM call failed: {e}", e)
+            while True:
+                waiting = self._executor.submit(next, chunks, None)
+                try:
+                    chunk = waiting.result(timeout=max(0.0, deadline - time.monotonic()))
+                except TimeoutError:
+                    self._count('timeouts')
+                    self._failed(f"the LLM didn't finish within {self.timeout:g}s")
+                except Exception as e:
+                    self._count('failures')
+                    self._failed(f"the LLM call failed: {e}", e)
+                if chunk is None:
+                    self.breaker.record_success()
+                    return
+                yield chunk
+        finally:
+            # The slot is freed once the upstream stops, even if that's after the deadline
+            if waiting is not None and not waiting.done():
+                waiting.add_done_callback(self._release)
+            else:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                self._release()
+
+    async def astream(self, prompt, config=None, timeout=None):
+        """
+        Async version of stream: chunks are awaited with the remaining
+        time, and a call past its deadline is cancelled
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._admit()
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire, deadline))
+        try:
+            # The thread can't be stopped: a caller cancelled while it waits frees the slot it gets
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(self._release_acquired)
+            raise
+        self._count('calls')
+        chunks = None
+        try:
+            try:
+                chunks = self.llm.astream(prompt)
+            except Exception as e:
+                self._count('failures')
+                self._failed(f"the LLM call failed: {e}", e)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    self.breaker.record_success()
+                    return
+                except TimeoutError:
+                    self._count('timeouts')
+                    self._failed(f"the LLM didn't finish within {self.timeout:g}s")
+                except Exception as e:
+                    self._count('failures')
+                    self._failed(f"the LLM call failed: {e}", e)
+                yield chunk
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+            self._release()
+
+    def _release_acquired(self, acquiring):
+        if not acquiring.cancelled() and acquiring.exception() is None:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'calls': self.calls, 'coalesced': self.coalesced, 'hedges': self.hedges,
+                    'timeouts': self.timeouts, 'failures': self.failures, 'rejected': self.rejected,
+                    'circuit': self.breaker.state, 'circuit_trips': self.breaker.trips,
+                    'max_concurrency': self.max_concurrency}
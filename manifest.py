@@ -0,0 +1,132 @@
+# Per-file ingestion manifest stored next to the FAISS index
+import os
+import json
+import hashlib
+
+# Manifest file name, stored inside the vector store directory
+MANIFEST_FILE = "manifest.json"
+
+MANIFEST_VERSION = 1
+
+# Hash a file's contents
+def file_hash(path, block_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Build stable chunk IDs for a file
+def chunk_id_prefix(path, content_hash):
+    """
+    Return the ID prefix shared by the chunks of one file version
+    """
+    return hashlib.sha1(f"{path}:{content_hash}".encode('utf-8')).hexdigest()[:16]
+
+# Return an empty manifest
+def new_manifest(settings):
+    """
+    Create an empty manifest for the given ingestion settings
+    """
+    return {'version': MANIFEST_VERSION, 'settings': dict(settings), 'files': {}}
+
+# Load the manifest
+def load_manifest(index_dir):
+    """
+    Load the manifest from the vector store directory, or None if there is none
+    """
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable manifest {path}: {e}")
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+# Save the manifest
+def save_manifest(index_dir, manifest):
+    """
+    Atomically write the manifest into the vector store directory
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# Work out what an ingestion run has to do
+def plan_update(manifest, file_hashes, settings):
+    """
+    Compare the manifest with the current files.
+
+    Returns (rebuild, changed, removed_ids) where changed lists the files that
+    must be (re-)embedded and removed_ids the vector IDs that must be deleted.
+    Files whose last ingestion was interrupted are listed as changed, but their
+    vectors are kept so the run can resume where it stopped. Files with chunks
+    dropped as duplicates of a removed chunk are embedded again from scratch,
+    so the shared text stays indexed.
+    A missing manifest or different settings (embedding model, chunking)
+    means everything has to be rebuilt.
+    """
+    if manifest is None or manifest.get('settings') != dict(settings):
+        return True, sorted(file_hashes), []
+
+    recorded = manifest['files']
+    changed = []
+    removed_ids = []
+
+    for path in sorted(file_hashes):
+        entry = recorded.get(path)
+        if entry is None:
+            changed.append(path)
+        elif entry['hash'] != file_hashes[path]:
+            changed.append(path)
+            removed_ids.extend(entry['chunk_ids'])
+        elif not entry.get('complete', True):
+            changed.append(path)
+
+    for path, entry in recorded.items():
+        if path not in file_hashes:
+            removed_ids.extend(entry['chunk_ids'])
+
+    # Re-embedding a dependent file removes its chunks too, which others may depend on
+    dependents = stale_dependents(manifest, removed_ids, set(changed))
+    while dependents:
+        for path in dependents:
+            changed.append(path)
+            removed_ids.extend(recorded[path]['chunk_ids'])
+        dependents = stale_dependents(manifest, removed_ids, set(changed))
+
+    return False, sorted(changed), removed_ids
+
+# Files whose dropped duplicates lose the chunk they were kept as
+def stale_dependents(manifest, removed_ids, excluded=()):
+    """
+    Return the files not in excluded that had a chunk dropped as a
+    duplicate of one of removed_ids
+    """
+    removed = set(removed_ids)
+    return sorted(path for path, entry in manifest['files'].items()
+                  if path not in excluded and not removed.isdisjoint(entry.get('duplicate_of', ())))
+
+# Drop manifest entries that no longer match the files
+def prune_manifest(manifest, file_hashes, removed_ids=()):
+    """
+    Remove the entries of deleted and changed files, and of files that
+    depend on removed chunks, keeping interrupted entries of unchanged
+    files so they can be resumed
+    """
+    removed = set(removed_ids)
+    for path in list(manifest['files']):
+        entry = manifest['files'][path]
+        if file_hashes.get(path) != entry['hash'] or not removed.isdisjoint(entry.get('duplicate_of', ())):
+            del manifest['files'][path]
@@ -0,0 +1,96 @@
+# Re-embed an existing vector store with another embedding model
+#
+# Run with:  python migrate_embeddings.py --model sentence-transformers/all-mpnet-base-v2
+import time
+import argparse
+from langchain_community.vectorstores import FAISS
+from manifest import load_manifest
+from embedding_cache import CachedEmbeddings
+from embedding_backends import EMBEDDING_BACKENDS, embedding_cache_name, hub_id, load_embeddings
+from vector_store import INDEX_TYPES, build_search_index, load_embedding_info, load_flat_store, load_index_meta
+from ingest import FAISS_INDEX, BATCH_SIZE, save_checkpoint
+
+# Re-embed every chunk of the store with a new model
+def migrate_embeddings(model_name, index_dir=FAISS_INDEX, embedding_backend=None, batch_size=BATCH_SIZE,
+                       index_type=None, cache=True):
+    """
+    Convert the vector store in index_dir to model_name: the chunk texts
+    already in index.pkl are embedded again batch by batch (the PDFs are not
+    re-parsed), keeping their IDs, metadata and order. The flat store and
+    manifest are then replaced and a new search index version is published.
+    With the embedding cache, an interrupted migration reuses the vectors
+    it already computed when run again.
+    """
+    info = load_embedding_info(index_dir)
+    if info is None:
+        print(f"❌ No vector store in {index_dir}")
+        return None
+    if info['model'] is not None and hub_id(info['model']) == hub_id(model_name):
+        print(f"✅ {index_dir} is already embedded with {model_name}, nothing to do!")
+        return None
+
+    old_store = load_flat_store(index_dir)
+    ntotal = old_store.index.ntotal
+    print(f"🔁 Re-embedding {ntotal} chunks from {info['model']} ({info['dimension']}-dim) to {model_name}")
+
+    embeddings = load_embeddings(model_name, embedding_backend)
+    if cache:
+        embeddings = CachedEmbeddings(embeddings, embedding_cache_name(model_name, embeddings))
+
+    start = time.perf_counter()
+    vector_store = None
+    for offset in range(0, ntotal, batch_size):
+        ids = [old_store.index_to_docstore_id[position] for position in range(offset, min(offset + batch_size, ntotal))]
+        docs = [old_store.docstore.search(doc_id) for doc_id in ids]
+        texts = [doc.page_content for doc in docs]
+        text_embeddings = list(zip(texts, embeddings.embed_documents(texts)))
+        metadatas = [doc.metadata for doc in docs]
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        done = offset + len(ids)
+        if done % (batch_size * 20) < batch_size or done == ntotal:
+            elapsed = time.perf_counter() - start
+            print(f"🧠 {done}/{ntotal} chunks re-embedded ({done / elapsed:.0f} chunks/s)")
+            if isinstance(embeddings, CachedEmbeddings):
+                embeddings.save()
+
+    if vector_store is None:
+        print("❌ The vector store is empty")
+        return None
+
+    # The chunking is unchanged, only the model differs
+    manifest = load_manifest(index_dir)
+    settings = {'embedding_model': model_name, 'chunk_size': info['chunk_size'],
+                'chunk_overlap': info['chunk_overlap']}
+    if manifest is not None:
+        manifest['settings']['embedding_model'] = model_name
+        settings = {**manifest['settings'], **settings}
+        save_checkpoint(index_dir, vector_store, manifest)
+    else:
+        vector_store.save_local(index_dir)
+
+    meta = load_index_meta(index_dir) or {}
+    build_search_index(index_dir, vector_store, index_type or meta.get('index_type', "flat"), settings=settings)
+    print(f"✅ Migrated {ntotal} chunks to {model_name} ({vector_store.index.d}-dim) "
+          f"in {time.perf_counter() - start:.1f}s")
+    print("🔄 Running servers keep the old version until restarted; "
+          f"run ingest.py with --embedding-model {model_name} to keep updating this store")
+    return vector_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed the vector store with another embedding model")
+    parser.add_argument("--model", required=True,
+                        help="Embedding model to convert to (e.g. all-MiniLM-L6-v2)")
+    parser.add_argument("--index-dir", default=FAISS_INDEX, help="Vector store directory")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Chunks embedded per batch")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help="Search index to build (default: the type currently served)")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=None,
+                        help="Run the new model with PyTorch, ONNX Runtime or ONNX with int8 weights")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't read or write the on-disk embedding cache")
+    args = parser.parse_args()
+    migrate_embeddings(args.model, args.index_dir, args.embedding_backend, args.batch_size, args.index_type,
+                       cache=not args.no_cache)
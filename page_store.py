@@ -0,0 +1,197 @@
+# Parsed-page store: the page texts of each PDF, extracted once and kept compressed on disk
+import os
+import re
+import json
+import gzip
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document
+from manifest import file_hash
+
+# Default store directory
+PAGE_STORE_DIR = "parsed_pages/"
+
+# Bumped when the stored page format changes
+PAGE_FORMAT_VERSION = 1
+
+# Pages extracted per pool task, so a large PDF is parsed by several processes
+PAGES_PER_TASK = 32
+
+# Extractor to use: pymupdf or pypdf (default: PyMuPDF when installed)
+PDF_EXTRACTOR = os.environ.get('LAW_GPT_PDF_EXTRACTOR')
+
+def _pick_extractor(name=PDF_EXTRACTOR):
+    """
+    Return (name, version) of the extractor: PyMuPDF is several times
+    faster than pypdf, which is pure Python, but optional
+    """
+    if name in (None, "pymupdf"):
+        try:
+            import fitz
+            return "pymupdf", fitz.VersionBind
+        except ImportError:
+            if name == "pymupdf":
+                print("⚠️  PyMuPDF isn't installed, extracting PDF text with pypdf")
+    import pypdf
+    return "pypdf", pypdf.__version__
+
+EXTRACTOR, EXTRACTOR_VERSION = _pick_extractor()
+
+# Identifies the text a parse produces: extractors (and their versions) lay out text differently
+PARSER_VERSION = f"{EXTRACTOR}-{EXTRACTOR_VERSION}-{PAGE_FORMAT_VERSION}"
+
+# Count the pages of a PDF
+def count_pages(path, extractor=EXTRACTOR):
+    if extractor == "pymupdf":
+        import fitz
+        with fitz.open(path) as pdf:
+            return pdf.page_count
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+# Extract a range of pages
+def extract_pages(path, start, stop, extractor=EXTRACTOR):
+    """
+    Return the text and label of pages [start, stop) of a PDF.
+    Runs inside pool workers.
+    """
+    if extractor == "pymupdf":
+        import fitz
+        with fitz.open(path) as pdf:
+            return [{'text': pdf[i].get_text(), 'page_label': pdf[i].get_label() or str(i + 1)}
+                    for i in range(start, stop)]
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    labels = reader.page_labels
+    return [{'text': reader.pages[i].extract_text(), 'page_label': labels[i]} for i in range(start, stop)]
+
+# Turn stored pages into Documents
+def page_documents(path, pages, page_count, first=0):
+    return [Document(page_content=page['text'], metadata={'source': path, 'page': i, 'page_label': page['page_label'],
+                                                          'total_pages': page_count})
+            for i, page in enumerate(pages, first)]
+
+# Parse (unless given) and split a range of pages
+def parse_range(path, first, stop, page_count, split=None, pages=None):
+    """
+    Return (the extracted pages or None if pages was given, the Documents
+    of pages [first, stop) or split's chunks of them). Runs inside pool
+    workers, so split must be picklable.
+    """
+    extracted = None
+    if pages is None:
+        pages = extracted = extract_pages(path, first, stop)
+    documents = page_documents(path, pages, page_count, first)
+    return extracted, split(documents) if split else documents
+
+# Compressed on-disk store of parsed pages
+class PageStore:
+    """
+    One gzipped JSON file per PDF, keyed by the file's content hash, in a
+    directory per parser version, so a different extractor never reads
+    text another one produced. Partial parses (only the first max_pages
+    pages) are kept too and serve requests for as many pages or fewer.
+    """
+
+    def __init__(self, store_dir=PAGE_STORE_DIR, parser=PARSER_VERSION):
+        self.parser = parser
+        self.directory = os.path.join(store_dir, re.sub(r'[^A-Za-z0-9._-]+', '_', parser))
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, content_hash):
+        return os.path.join(self.directory, f"{content_hash}.json.gz")
+
+    def load(self, content_hash, max_pages=None):
+        """
+        Return (page count, pages) or None if the store doesn't hold enough pages
+        """
+        path = self._path(content_hash)
+        entry = None
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Ignoring unreadable parsed pages {path}: {e}")
+        needed = entry and (entry['page_count'] if max_pages is None else min(entry['page_count'], max_pages))
+        if entry is None or entry['parser'] != self.parser or len(entry['pages']) < needed:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['page_count'], entry['pages'][:needed]
+
+    def save(self, content_hash, page_count, pages):
+        """
+        Atomically write the pages of a PDF
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(content_hash)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump({'parser': self.parser, 'page_count': page_count, 'pages': pages}, f)
+        os.replace(tmp_path, path)
+
+    def print_stats(self):
+        print(f"📄 Parsed-page store: {self.hits} PDFs read from {self.directory}, {self.misses} parsed")
+
+# Parse PDFs, reading and filling the page store
+def iter_parsed_pages(pdf_files, workers=1, max_pages=None, store=None, file_hashes=None, split=None):
+    """
+    Yield (path, page Documents, error) per file, in input order, or
+    (path, chunks, error) given split, which turns a list of page
+    Documents into chunks. Pages come from store when it holds them;
+    otherwise the PDF is parsed and saved to store. With workers > 1,
+    parsing and splitting run in ranges of PAGES_PER_TASK pages across a
+    process pool. Only a bounded window of files is in flight.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def start(path):
+        try:
+            content_hash = None
+            cached = None
+            if store is not None:
+                content_hash = (file_hashes or {}).get(path) or file_hash(path)
+                cached = store.load(content_hash, max_pages)
+            if cached is not None:
+                page_count, pages = cached
+                stop = len(pages)
+            else:
+                page_count, pages = count_pages(path), None
+                stop = page_count if max_pages is None else min(page_count, max_pages)
+            ranges = [(first, min(first + PAGES_PER_TASK, stop)) for first in range(0, stop, PAGES_PER_TASK)]
+            # Stored pages only go to the pool when there is splitting to do
+            futures = executor and (pages is None or split) and [
+                executor.submit(parse_range, path, first, last, page_count, split, pages and pages[first:last])
+                for first, last in ranges]
+            return path, content_hash, (page_count, pages, ranges, futures)
+        except Exception as e:
+            return path, None, e
+
+    def finish(path, content_hash, job):
+        if isinstance(job, Exception):
+            raise job
+        page_count, pages, ranges, futures = job
+        parts = [future.result() for future in futures] if futures else \
+            [parse_range(path, first, last, page_count, split, pages and pages[first:last]) for first, last in ranges]
+        if pages is None and store is not None:
+            store.save(content_hash, page_count, list(itertools.chain.from_iterable(part for part, _ in parts)))
+        return list(itertools.chain.from_iterable(output for _, output in parts))
+
+    try:
+        files = iter(pdf_files)
+        pending = deque(start(path) for path in itertools.islice(files, workers * 2 if executor else 1))
+        while pending:
+            path, *job = pending.popleft()
+            try:
+                result = path, finish(path, *job), None
+            except Exception as e:
+                result = path, None, str(e)
+            for next_path in itertools.islice(files, 1):
+                pending.append(start(next_path))
+            yield result
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
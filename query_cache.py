@@ -0,0 +1,204 @@
+# Query-time caches for the chat pipeline
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Query embedding cache limits
+QUERY_CACHE_SIZE = 2048
+QUERY_CACHE_TTL = 24 * 3600
+
+# Semantic answer cache limits
+ANSWER_CACHE_SIZE = 1000
+ANSWER_CACHE_TTL = 3600
+ANSWER_CACHE_THRESHOLD = 0.95
+
+# Normalize a question before using it as a cache key
+def normalize_question(question):
+    """
+    Lowercase and collapse whitespace
+    """
+    return re.sub(r'\s+', ' ', question).strip().lower()
+
+# Numbers a question cites
+_NUMBER_RE = re.compile(r'\b\d+[a-z]{0,2}\b')
+
+def question_numbers(question):
+    """
+    The numbers in a question ("Section 302", "Article 21", "65B"), which
+    tell near-identical questions about different provisions apart
+    """
+    return sorted(set(_NUMBER_RE.findall(question.lower())))
+
+# Identify the vector store contents
+def index_version(index_dir):
+    """
+    Return a string that changes whenever the vector store is rewritten
+    """
+    parts = []
+    for name in ("index.faiss", "index.pkl"):
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+    return ":".join(parts)
+
+# Thread-safe LRU cache with a time-to-live
+class LRUCache:
+    """
+    Exact-match LRU cache whose entries expire after ttl seconds
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+# Embeddings wrapper with an LRU cache for queries
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Serve repeated query embeddings from an in-memory LRU cache
+    """
+
+    def __init__(self, embeddings, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.embeddings = embeddings
+        self.cache = LRUCache(max_size, ttl)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Embed many queries, running the uncached ones through the model in one batch
+        """
+        keys = [normalize_question(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            for key, vector in zip(missing, self.embeddings.embed_documents([texts[i] for i in first])):
+                self.cache.put(key, vector)
+                for i in missing[key]:
+                    vectors[i] = vector
+        return vectors
+
+# Cache of answers to semantically equivalent questions
+class SemanticCache:
+    """
+    Return a stored answer when a new question's embedding is within a
+    cosine similarity threshold of a cached question with the same
+    version. The version must match exactly; answer_cache_version builds
+    it from the index, the domain and the numbers the question cites.
+    Entries expire after ttl seconds, and the least recently used ones are
+    dropped beyond max_size.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry['time'] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, vector, version, with_chunk_ids=False):
+        """
+        Return the cached answer for the closest question, or None. With
+        with_chunk_ids, return (answer, IDs of the chunks it was built from).
+        """
+        with self._lock:
+            self._expire()
+            if self._entries and self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[key]['vector'] for key in self._matrix_ids])
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            scores = self._matrix @ self._unit(vector)
+            for position in np.argsort(-scores):
+                if scores[position] < self.threshold:
+                    break
+                key = self._matrix_ids[position]
+                entry = self._entries[key]
+                if entry['version'] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return (entry['answer'], entry['chunk_ids']) if with_chunk_ids else entry['answer']
+
+            self.misses += 1
+            return None
+
+    def store(self, vector, version, answer, chunk_ids=()):
+        """
+        Cache an answer for a question embedding, with the IDs of the
+        chunks its context was built from
+        """
+        with self._lock:
+            key = self._next_id
+            self._next_id += 1
+            self._entries[key] = {'vector': self._unit(vector), 'version': version,
+                                  'answer': answer, 'chunk_ids': tuple(chunk_ids), 'time': time.monotonic()}
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,13 +1,24 @@
 import os
-import pickle
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import argparse
 from tqdm import tqdm
+from manifest import file_hash, load_manifest, new_manifest, plan_update, prune_manifest
+from ingest import iter_file_chunks, stream_into_vector_store
+from embedding_cache import CachedEmbeddings
+from embedding_backends import EMBEDDING_BACKENDS, embedding_cache_name, load_embeddings
+from page_store import PARSER_VERSION, PageStore
+from vector_store import build_search_index
+
+# Quick ingestion settings, recorded in the manifest
+QUICK_SETTINGS = {
+    'embedding_model': "all-MiniLM-L6-v2",
+    'chunk_size': 500,
+    'chunk_overlap': 50,
+    'max_pages': 20,
+    'parser': PARSER_VERSION,
+}
 
 # Quick ingestion for faster startup
-def quick_embed():
+def quick_embed(embedding_backend=None):
     """
     Quick embedding of only a few key documents for fast startup
     """
@@ -44,64 +55,61 @@ def quick_embed():
         print("❌ No PDF files found in dataset!")
         return
     
-    print(f"📚 Processing {len(existing_files)} documents...")
-    
-    # Load documents
-    all_documents = []
-    for file_path in existing_files:
-        try:
-            print(f"📖 Loading: {os.path.basename(file_path)}")
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-            
-            # Limit pages per document for speed (first 20 pages only)
-            if len(documents) > 20:
-                documents = documents[:20]
-                print(f"  → Limited to first 20 pages")
-            
-            all_documents.extend(documents)
-            print(f"  → Loaded {len(documents)} pages")
-        except Exception as e:
-            print(f"  ❌ Error loading {file_path}: {str(e)}")
-            continue
-    
-    if not all_documents:
-        print("❌ No documents were successfully loaded!")
+    # Only re-embed files that changed since the last quick ingestion
+    file_hashes = {file_path: file_hash(file_path) for file_path in existing_files}
+    manifest = None
+    if os.path.exists("vectorstore/index.faiss"):
+        manifest = load_manifest("vectorstore/")
+    rebuild, changed, removed_ids = plan_update(manifest, file_hashes, QUICK_SETTINGS)
+
+    if rebuild:
+        manifest = new_manifest(QUICK_SETTINGS)
+    else:
+        prune_manifest(manifest, file_hashes)
+
+    if not changed and not removed_ids:
+        print("✅ Vector database is up to date!")
         return
-    
-    print(f"📄 Total pages loaded: {len(all_documents)}")
-    
-    # Split documents into smaller chunks
-    print("✂️ Splitting documents...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,  # Smaller chunks for faster processing
-        chunk_overlap=50,
-        length_function=len
-    )
-    
-    texts = text_splitter.split_documents(all_documents)
-    print(f"📝 Created {len(texts)} text chunks")
+
+    print(f"📚 Processing {len(changed)} documents (first {QUICK_SETTINGS['max_pages']} pages each)...")
     
     # Create embeddings (using faster model)
     print("🧠 Creating embeddings...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",  # Faster, smaller model
-        model_kwargs={'device': 'cpu'}
+    embeddings = load_embeddings(
+        QUICK_SETTINGS['embedding_model'],  # Faster, smaller model
+        embedding_backend,
+        device='cpu'
     )
+    embeddings = CachedEmbeddings(embeddings, embedding_cache_name(QUICK_SETTINGS['embedding_model'], embeddings))
     
-    # Create FAISS vector store
-    print("💾 Creating vector database...")
-    vectorstore = FAISS.from_documents(texts, embeddings)
+    # Stream smaller chunks into the FAISS vector store
+    print("💾 Updating vector database...")
+    file_chunks = iter_file_chunks(
+        changed,
+        store=PageStore(),  # Pages parsed by earlier runs are read back
+        file_hashes=file_hashes,
+        chunk_size=QUICK_SETTINGS['chunk_size'],  # Smaller chunks for faster processing
+        chunk_overlap=QUICK_SETTINGS['chunk_overlap'],
+        max_pages=QUICK_SETTINGS['max_pages']  # Limit pages per document for speed
+    )
+    file_chunks = ((path, file_hashes[path], chunks) for path, chunks in file_chunks)
+    vectorstore, stats = stream_into_vector_store("vectorstore/", manifest, rebuild, removed_ids, file_chunks, embeddings)
     
-    # Save the vector store
-    if not os.path.exists("vectorstore"):
-        os.makedirs("vectorstore")
+    if vectorstore is None:
+        print("❌ No documents were successfully loaded!")
+        return
     
-    vectorstore.save_local("vectorstore/")
+    print(f"📝 Embedded {stats['chunks']} text chunks")
+    build_search_index("vectorstore/", vectorstore, settings=QUICK_SETTINGS)
     print("✅ Vector database saved!")
     
     print("🎉 Quick ingestion completed successfully!")
     print("🚀 Your Law Chatbot is now ready!")
 
 if __name__ == "__main__":
-    quick_embed()
+    parser = argparse.ArgumentParser(description="Quickly embed a few PDFs for a fast first start")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=None,
+                        help="Run the embedding model with PyTorch, ONNX Runtime or ONNX with int8 weights "
+                             "(default: LAW_GPT_EMBEDDING_BACKEND or torch)")
+    args = parser.parse_args()
+    quick_embed(embedding_backend=args.embedding_backend)
@@ -0,0 +1,56 @@
+# Admission control for the chat endpoints
+import threading
+
+# Requests answered at the same time by one worker process
+MAX_ACTIVE_REQUESTS = 8
+
+# Requests allowed to wait for a free slot; beyond this they are rejected
+MAX_QUEUED_REQUESTS = 16
+
+# Seconds a queued request waits for a slot before it is rejected
+QUEUE_TIMEOUT = 30
+
+# Bounded request queue
+class RequestLimiter:
+    """
+    Let at most max_active requests run and max_queued wait. acquire()
+    returns False when the queue is full or the wait times out, so the
+    caller can reply 429 instead of piling up work.
+    """
+
+    def __init__(self, max_active=MAX_ACTIVE_REQUESTS, max_queued=MAX_QUEUED_REQUESTS, timeout=QUEUE_TIMEOUT):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self.active < self.max_active:
+                self.active += 1
+                return True
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self.active < self.max_active, self.timeout)
+            finally:
+                self.queued -= 1
+            if not admitted:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        return {'active': self.active, 'queued': self.queued, 'rejected': self.rejected,
+                'max_active': self.max_active, 'max_queued': self.max_queued}
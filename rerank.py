@@ -0,0 +1,100 @@
+# Cross-encoder reranking of retrieved chunks
+import time
+import threading
+
+# Small CPU cross-encoder trained for passage ranking
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Candidates fetched from the index for reranking
+RERANK_FETCH_K = 50
+
+# Candidates scored per cross-encoder forward pass
+RERANK_BATCH_SIZE = 16
+
+# Seconds the reranker may spend on one query
+RERANK_TIME_BUDGET = 0.25
+
+# Stop scoring once the k-th best score leads the last batch's best by this margin
+RERANK_CUTOFF_MARGIN = 3.0
+
+# Load the cross-encoder
+def load_reranker(model_name=RERANK_MODEL, **kwargs):
+    """
+    Return a Reranker, or None if the cross-encoder can't be loaded
+    """
+    try:
+        from sentence_transformers import CrossEncoder
+        model = CrossEncoder(model_name, max_length=512, device='cpu')
+        # The first forward pass is slow (lazy init); keep it out of the batch time estimate
+        model.predict([("warm up", "warm up")] * RERANK_BATCH_SIZE, batch_size=RERANK_BATCH_SIZE,
+                      show_progress_bar=False)
+    except Exception as e:
+        print(f"⚠️  Reranker unavailable, using vector order: {e}")
+        return None
+    print(f"✅ Reranker loaded ({model_name})")
+    return Reranker(model, **kwargs)
+
+# Reranks candidates within a time budget
+class Reranker:
+    """
+    Score (question, chunk) pairs with a cross-encoder, in batches, in the
+    order the index returned them. Scoring stops early when the last batch
+    scored far below the current top k: candidates are ordered by vector
+    similarity, so later ones are unlikely to do better. It also stops
+    before a batch that would overrun the time budget; unscored candidates
+    keep their vector order behind the scored ones. The batch time is
+    learned across queries. The first batch is always scored, so the
+    estimate keeps tracking the real batch time and one slow batch can't
+    switch reranking off.
+    """
+
+    def __init__(self, model, batch_size=RERANK_BATCH_SIZE, time_budget=RERANK_TIME_BUDGET,
+                 cutoff_margin=RERANK_CUTOFF_MARGIN):
+        self.model = model
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.cutoff_margin = cutoff_margin
+        # Moving average of the seconds one batch takes, shared by the request threads
+        self.batch_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def rerank(self, question, docs, k=3):
+        """
+        Return (top k docs, stats). stats has the number of candidates
+        scored, why scoring stopped and the time spent.
+        """
+        start = time.perf_counter()
+        scored = []
+        reason = 'all scored'
+        for offset in range(0, len(docs), self.batch_size):
+            elapsed = time.perf_counter() - start
+            if offset and elapsed + self.batch_seconds > self.time_budget:
+                reason = 'time budget'
+                break
+
+            batch_start = time.perf_counter()
+            batch = docs[offset:offset + self.batch_size]
+            scores = self.model.predict([(question, doc.page_content) for doc in batch],
+                                        batch_size=self.batch_size, show_progress_bar=False)
+            batch_seconds = time.perf_counter() - batch_start
+            if len(batch) == self.batch_size:
+                with self._lock:
+                    self.batch_seconds = batch_seconds if not self.batch_seconds else \
+                        0.8 * self.batch_seconds + 0.2 * batch_seconds
+            scored.extend((float(score), offset + i) for i, score in enumerate(scores))
+
+            if len(scored) >= k and offset + self.batch_size < len(docs):
+                kth_best = sorted(scored, reverse=True)[k - 1][0]
+                if kth_best - max(float(score) for score in scores) > self.cutoff_margin:
+                    reason = 'score gap'
+                    break
+
+        order = [position for _, position in sorted(scored, key=lambda item: (-item[0], item[1]))]
+        order += range(len(scored), len(docs))
+        stats = {
+            'candidates': len(docs),
+            'scored': len(scored),
+            'stopped': reason if scored else 'vector order',
+            'seconds': time.perf_counter() - start,
+        }
+        return [docs[position] for position in order[:k]], stats
@@ -0,0 +1,156 @@
+# Server-side chat sessions: the recent turns of each conversation and the chunks retrieved for them
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+
+# Sessions kept per worker process, and seconds an idle session is kept
+MAX_SESSIONS = 5000
+SESSION_TTL = 1800
+
+# Turns remembered per session
+MAX_TURNS = 4
+
+# Characters of each question kept in a session
+MAX_QUESTION_CHARS = 300
+
+# A follow-up reuses the chunks of the turn it follows when its embedding is
+# at least this similar (cosine) to that turn's, instead of searching again
+REUSE_SIMILARITY = 0.6
+
+# Session IDs accepted from clients
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# Questions longer than this are taken to stand on their own
+MAX_FOLLOW_UP_WORDS = 12
+
+# A question naming more things than this ("record a phone call without
+# consent") stands on its own, even if it says "it" or "this"
+MAX_FOLLOW_UP_CONTENT_WORDS = 2
+
+# Openings and pronouns that make a short question depend on the previous one
+_FOLLOW_UP_RE = re.compile(r"^\s*(?:and|also|but|so|then|what about|how about|what if)\b"
+                           r"|\b(?:it|its|that|this|these|those|they|them|their|he|she|his|her|such|same|above"
+                           r"|former|latter)\b", re.I)
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Words that don't name what a question is about
+_FUNCTION_WORDS = frozenset("""
+a an the and or but so then also about what whats what's which who whom whose when where why how if
+is are was were be been being am do does did done can could shall should will would may might must
+have has had having get gets got it its it's that this these those they them their he she his her him
+i me my we our us you your such same above former latter any all some not no yes there here than
+for to of in on at by with from under into as more else case one ones tell explain mean means say
+please again instead too very much many other just only now
+""".split())
+
+def content_words(question):
+    """
+    The words of a question that name its subject, not counting
+    question words, pronouns and other function words
+    """
+    return [word for word in _WORD_RE.findall(question.lower()) if word not in _FUNCTION_WORDS]
+
+def is_follow_up(question):
+    """
+    Whether a question refers back to the conversation ("what is the
+    punishment for that?", "and for minors?"): short, pointing back, and
+    naming little of its own
+    """
+    return (len(question.split()) <= MAX_FOLLOW_UP_WORDS and _FOLLOW_UP_RE.search(question) is not None
+            and len(content_words(question)) <= MAX_FOLLOW_UP_CONTENT_WORDS)
+
+def resolve_follow_up(question, last_turn):
+    """
+    Return (standalone question, topic). A follow-up is rewritten to carry
+    the topic of the conversation, the last question that stood on its
+    own; any other question starts a new topic.
+    """
+    if last_turn is None or not is_follow_up(question):
+        return question, question[:MAX_QUESTION_CHARS]
+    topic = last_turn['topic']
+    return f"{question} (follow-up to: {topic})", topic
+
+def reusable_chunk_ids(last_turn, query_vector, threshold=REUSE_SIMILARITY):
+    """
+    The chunk IDs retrieved for the last turn, if the follow-up's embedding
+    is still close enough to that turn's for them to be relevant
+    """
+    if last_turn is None or not last_turn['chunk_ids']:
+        return []
+    vector = np.asarray(query_vector, dtype=np.float32)
+    similarity = float(last_turn['vector'].astype(np.float32) @ vector) / max(float(np.linalg.norm(vector)), 1e-12)
+    return list(last_turn['chunk_ids']) if similarity >= threshold else []
+
+# Bounded session store
+class SessionStore:
+    """
+    The last max_turns turns of each session: the question (truncated),
+    its topic, the IDs of the chunks put into its prompt and its query
+    embedding (unit length, float16). Sessions idle for ttl seconds expire
+    and the least recently used ones are dropped beyond max_sessions, so
+    memory stays bounded however many users chat at once.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, max_turns=MAX_TURNS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.evicted = 0
+        self.expired = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        # Sessions are kept in order of last use, so the expired ones are at the front
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session['time'] <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+    def last_turn(self, session_id):
+        """
+        Return the latest turn of a session, or None
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None or not session['turns']:
+                return None
+            return session['turns'][-1]
+
+    def turns(self, session_id):
+        """
+        Return the remembered turns of a session, oldest first
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            return list(session['turns']) if session is not None else []
+
+    def record(self, session_id, question, topic, chunk_ids, query_vector):
+        """
+        Add a turn to a session, creating it if needed
+        """
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = (vector / max(float(np.linalg.norm(vector)), 1e-12)).astype(np.float16)
+        turn = {'question': question[:MAX_QUESTION_CHARS], 'topic': topic, 'chunk_ids': tuple(chunk_ids),
+                'vector': vector}
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = {'turns': deque(maxlen=self.max_turns)}
+            session['turns'].append(turn)
+            session['time'] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def __len__(self):
+        return len(self._sessions)
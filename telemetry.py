@@ -0,0 +1,270 @@
+# Per-request tracing, metrics and logging for the chat pipeline
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Share of requests whose log lines are written (warnings and errors always are)
+LOG_SAMPLE_RATE = float(os.environ.get('LAW_GPT_LOG_SAMPLE_RATE', '1.0'))
+
+# Lowest level written by the chat pipeline logger
+LOG_LEVEL = os.environ.get('LAW_GPT_LOG_LEVEL', 'INFO').upper()
+
+# Histogram buckets, in seconds, for stage and request latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Histogram buckets, in characters, for response sizes
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_current_trace = contextvars.ContextVar('law_gpt_trace', default=None)
+
+# Drops the info lines of requests that weren't sampled
+class SamplingFilter(logging.Filter):
+    """
+    Let through every warning and error, and lower-level records only
+    when the current request's trace was sampled (or outside requests)
+    """
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        trace = _current_trace.get()
+        return trace is None or trace.sampled
+
+def _make_logger():
+    logger = logging.getLogger("law_gpt")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(process)d] %(message)s"))
+        handler.addFilter(SamplingFilter())
+        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return logger
+
+log = _make_logger()
+
+# Cumulative histogram in the Prometheus layout
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+# In-process metric registry
+class Metrics:
+    """
+    Counters, gauges and histograms keyed by name and labels, rendered in
+    the Prometheus text format. Each worker process has its own.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def set_total(self, name, value, **labels):
+        """
+        Set a counter to a total kept elsewhere (e.g. a cache's hit count)
+        """
+        with self._lock:
+            self._counters[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for kind, samples in (('counter', self._counters), ('gauge', self._gauges)):
+                for name in sorted({name for name, _ in samples}):
+                    lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (sample_name, labels), value in sorted(samples.items()):
+                        if sample_name == name:
+                            lines.append(f"{name}{_labels_text(labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (sample_name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if sample_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels_text(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels_text(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe('law_gpt_stage_seconds', 'Time spent in each stage of answering a question')
+metrics.describe('law_gpt_request_seconds', 'Time to answer a request, from question to last token')
+metrics.describe('law_gpt_response_chars', 'Size of the answers sent back')
+metrics.describe('law_gpt_requests_total', 'Answered requests by kind and outcome')
+metrics.describe('law_gpt_requests_active', 'Chat requests being answered')
+metrics.describe('law_gpt_requests_queued', 'Chat requests waiting for a free slot')
+metrics.describe('law_gpt_requests_rejected_total', 'Chat requests turned away with 429')
+metrics.describe('law_gpt_model_loaded', '1 once the QA system is loaded')
+metrics.describe('law_gpt_cache_hits_total', 'Cache lookups that found an entry')
+metrics.describe('law_gpt_cache_lookups_total', 'Cache lookups')
+metrics.describe('law_gpt_cache_entries', 'Entries held by each cache')
+metrics.describe('law_gpt_index_chunks', 'Chunks in the served search index')
+metrics.describe('law_gpt_index_bytes', 'Size on disk of the served index version')
+metrics.describe('law_gpt_sessions', 'Chat sessions held by this worker')
+metrics.describe('law_gpt_sessions_evicted_total', 'Chat sessions dropped as idle or least recently used')
+metrics.describe('law_gpt_llm_calls_active', 'LLM calls in flight')
+metrics.describe('law_gpt_llm_calls_total', 'Upstream LLM calls, hedges included')
+metrics.describe('law_gpt_llm_coalesced_total', 'Questions that joined an identical LLM call already in flight')
+metrics.describe('law_gpt_llm_hedges_total', 'Hedged second LLM calls')
+metrics.describe('law_gpt_llm_timeouts_total', 'LLM calls abandoned at their deadline')
+metrics.describe('law_gpt_llm_failures_total', 'LLM calls that failed')
+metrics.describe('law_gpt_llm_rejected_total', 'LLM calls refused while the circuit was open')
+metrics.describe('law_gpt_llm_circuit_open', '1 while the LLM circuit breaker is open or half-open')
+
+# Timings and attributes of one request
+class Trace:
+    """
+    Collects the spans (stage durations) and attributes of one request.
+    finish() records them in the metrics and, if the request was sampled,
+    writes them as one JSON log line.
+    """
+
+    def __init__(self, kind, sample_rate=LOG_SAMPLE_RATE):
+        self.kind = kind
+        self.sampled = sample_rate >= 1.0 or random.random() < sample_rate
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.attributes = {}
+        self.outcome = 'answered'
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def finish(self):
+        total = time.perf_counter() - self.start
+        for name, seconds in self.spans.items():
+            metrics.observe('law_gpt_stage_seconds', seconds, stage=name)
+        metrics.observe('law_gpt_request_seconds', total, kind=self.kind)
+        metrics.inc('law_gpt_requests_total', kind=self.kind, outcome=self.outcome)
+        if 'response_chars' in self.attributes:
+            metrics.observe('law_gpt_response_chars', self.attributes['response_chars'], buckets=SIZE_BUCKETS)
+        if self.sampled and log.isEnabledFor(logging.INFO):
+            log.info("trace %s", json.dumps({
+                'kind': self.kind, 'outcome': self.outcome, 'total_ms': round(total * 1000, 1),
+                **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in self.spans.items()},
+                **self.attributes}))
+
+# Trace the request running in the current context
+@contextmanager
+def request_trace(kind):
+    """
+    Start a Trace that span() and annotate() in this context (including
+    threads started with asyncio.to_thread) record into, and finish it
+    when the block exits
+    """
+    trace = Trace(kind)
+    previous = _current_trace.get()
+    _current_trace.set(trace)
+    try:
+        yield trace
+    except GeneratorExit:
+        # The client went away while the answer was streaming
+        trace.outcome = 'disconnected'
+        raise
+    except BaseException:
+        trace.outcome = 'error'
+        raise
+    finally:
+        # Not reset(token): a streamed request may finish in another context than it started in
+        _current_trace.set(previous)
+        trace.finish()
+
+@contextmanager
+def span(name):
+    """
+    Time a stage of the current request; does nothing outside a request
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+def add_span(name, seconds):
+    """
+    Record a stage duration measured by the caller (e.g. time to first token)
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, seconds)
+
+def annotate(**attributes):
+    """
+    Attach attributes (sizes, counts, outcome) to the current request's trace
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    outcome = attributes.pop('outcome', None)
+    if outcome is not None:
+        trace.outcome = outcome
+    trace.attributes.update(attributes)
@@ -0,0 +1,108 @@
+# Tests of the LLM gateway against the fake LLM:  python -m pytest test_llm_gateway.py
+import time
+import asyncio
+import threading
+import pytest
+from fake_llm import FakeLLM
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable
+
+def free_slots(gateway):
+    """
+    Take every free slot without blocking, give them back and return how many there were
+    """
+    taken = 0
+    while gateway._slots.acquire(blocking=False):
+        taken += 1
+    for _ in range(taken):
+        gateway._slots.release()
+    return taken
+
+def test_identical_prompts_share_one_call():
+    llm = FakeLLM(latency=0.2)
+    gateway = LLMGateway(llm, max_concurrency=4, timeout=5)
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(gateway.invoke("same prompt"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(answers) == 5 and len(set(answers)) == 1
+    assert llm.calls == 1
+    assert gateway.coalesced == 4
+
+def test_breaker_opens_after_repeated_failures_and_recovers():
+    llm = FakeLLM(latency=0, error_rate=1.0)
+    gateway = LLMGateway(llm, timeout=5, breaker=CircuitBreaker(failure_threshold=3, cooldown=0.2))
+    for i in range(3):
+        with pytest.raises(LLMUnavailable):
+            gateway.invoke(f"prompt {i}")
+    assert gateway.breaker.state == "open"
+
+    # Refused without reaching the upstream
+    with pytest.raises(LLMUnavailable):
+        gateway.invoke("refused")
+    assert llm.calls == 3
+    assert gateway.rejected == 1
+
+    # After the cooldown a trial call goes through and closes the circuit
+    llm.error_rate = 0.0
+    time.sleep(0.25)
+    assert gateway.invoke("trial")
+    assert gateway.breaker.state == "closed"
+
+def test_hung_call_fails_at_the_deadline():
+    gateway = LLMGateway(FakeLLM(hang_rate=1.0, hang=1.0), timeout=0.1)
+    start = time.monotonic()
+    with pytest.raises(LLMUnavailable):
+        gateway.invoke("hangs")
+    assert time.monotonic() - start < 0.5
+    assert gateway.timeouts == 1
+
+def test_stream_error_releases_the_slot():
+    gateway = LLMGateway(FakeLLM(latency=0.01, error_rate=1.0), max_concurrency=1, timeout=5)
+    with pytest.raises(LLMUnavailable):
+        list(gateway.stream("fails midway"))
+    assert gateway.active == 0
+    assert free_slots(gateway) == 1
+
+def test_stream_that_cannot_start_releases_the_slot():
+    class BrokenLLM(FakeLLM):
+        def stream(self, prompt, config=None):
+            raise RuntimeError("connection refused")
+
+    gateway = LLMGateway(BrokenLLM(), max_concurrency=1, timeout=5)
+    with pytest.raises(LLMUnavailable):
+        list(gateway.stream("never starts"))
+    assert gateway.active == 0
+    assert free_slots(gateway) == 1
+
+def test_cancelled_astream_releases_the_slot():
+    llm = FakeLLM(latency=1.0)
+    gateway = LLMGateway(llm, max_concurrency=1, timeout=5)
+
+    async def consume():
+        return [chunk async for chunk in gateway.astream("streamed")]
+
+    async def scenario():
+        # Cancelled mid-stream
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert gateway.active == 0
+
+        # Cancelled while waiting for the only slot, which is busy
+        busy = asyncio.ensure_future(asyncio.to_thread(gateway.invoke, "holds the slot"))
+        await asyncio.sleep(0.1)
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await busy
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert gateway.active == 0
+    assert free_slots(gateway) == 1
@@ -2,8 +2,8 @@
 import os
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from vector_store import load_vector_store, load_store_embeddings
+from context_builder import BudgetedRetriever
 from langchain.chains import RetrievalQA
 
 # Set the Google API key
@@ -63,7 +63,7 @@ def retrieval_qa_chain(llm, prompt, db):
         qa_chain = RetrievalQA.from_chain_type(
             llm=llm,
             chain_type='stuff',
-            retriever=db.as_retriever(search_kwargs={'k': 2}),
+            retriever=BudgetedRetriever(vectorstore=db, k=2),
             return_source_documents=True,
             chain_type_kwargs={'prompt': prompt}
         )
@@ -76,19 +76,20 @@ def retrieval_qa_chain(llm, prompt, db):
         return None
 
 # Return the chain
-def qa_pipeline():
+def qa_pipeline(embedding_backend=None):
     """
-    Create the QA pipeline
+    Create the QA pipeline, embedding questions with the given backend
+    (see embedding_backends.EMBEDDING_BACKENDS)
     """
     try:
         print("🔄 Initializing QA pipeline...")
         
-        # Load the HuggingFace embeddings
-        embeddings = HuggingFaceEmbeddings()
+        # Load the embeddings the vector store was built with
+        embeddings = load_store_embeddings(FAISS_INDEX, embedding_backend)
         print("✅ Embeddings loaded")
 
         # Load the index
-        db = FAISS.load_local("vectorstore/", embeddings, allow_dangerous_deserialization=True)
+        db = load_vector_store("vectorstore/", embeddings)
         print("✅ Vector database loaded")
 
         # Load the LLM
@@ -1,16 +1,50 @@
 # Gemini-specific implementation for Law Chatbot
 import os
+import time
+import asyncio
+from contextlib import contextmanager
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from vector_store import load_vector_store, load_store_embeddings
+from query_cache import CachedQueryEmbeddings, SemanticCache, index_version, question_numbers
+from bm25 import HYBRID_FETCH_K, hybrid_search, hybrid_search_batch
+from citations import parse_citations
+from sessions import SessionStore, resolve_follow_up, reusable_chunk_ids
+from index_swap import IndexSwapper
+from rerank import RERANK_FETCH_K, load_reranker
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context, estimate_tokens, log_context_stats, make_token_counter
+from llm_gateway import LLMGateway, LLMUnavailable
+from fake_llm import FakeLLM
+from telemetry import log, span, add_span, annotate, request_trace
 
 # Set the Google API key
 os.environ['GOOGLE_API_KEY'] = ''
 
+# Maximum number of concurrent Gemini calls for a batch of questions
+BATCH_CONCURRENCY = 8
+
+# Chunks put into the prompt
+CONTEXT_K = 3
+
+# HuggingFace tokenizer that counts the prompt context's tokens exactly (unset: estimated,
+# as Gemini has no local tokenizer)
+TOKENIZER = os.environ.get('LAW_GPT_TOKENIZER')
+
+# Serve with a fake LLM instead of Gemini, e.g. "latency=0.5,error_rate=0.1" (see fake_llm.py)
+FAKE_LLM = os.environ.get('LAW_GPT_FAKE_LLM')
+
+class DegradedAnswer(str):
+    """
+    An answer made of the retrieved passages only, because the LLM was unavailable
+    """
+
 def load_gemini_llm():
     """
-    Load Google Gemini LLM
+    Load Google Gemini LLM, behind the gateway that coalesces, limits and
+    times out its calls
     """
+    if FAKE_LLM:
+        print(f"🧪 Using a fake LLM ({FAKE_LLM})")
+        return LLMGateway(FakeLLM.from_spec(FAKE_LLM))
     try:
         # Initialize Gemini model
         llm = ChatGoogleGenerativeAI(
@@ -21,29 +55,34 @@ def load_gemini_llm():
         )
         
         print("✅ Gemini model initialized successfully!")
-        return llm
+        return LLMGateway(llm)
     
     except Exception as e:
         print(f"❌ Error loading Gemini model: {str(e)}")
         return None
 
-def create_gemini_qa_system():
+def create_gemini_qa_system(embedding_backend=None):
     """
-    Create a simplified QA system using Gemini
+    Create a simplified QA system using Gemini. embedding_backend picks
+    how questions are embedded (see embedding_backends.EMBEDDING_BACKENDS).
     """
     try:
         print("🔄 Initializing Gemini QA system...")
         
-        # Load embeddings (same model as used in ingestion)
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",  # Same model as quick_ingest.py
-            model_kwargs={'device': 'cpu'}
-        )
+        # Load embeddings (the model the vector store was built with)
+        embeddings = load_store_embeddings("vectorstore/", embedding_backend, device='cpu')
+        # Repeated questions reuse their query embedding
+        embeddings = CachedQueryEmbeddings(embeddings)
         print("✅ Embeddings loaded")
         
         # Load vector database
-        db = FAISS.load_local("vectorstore/", embeddings, allow_dangerous_deserialization=True)
+        db = load_vector_store("vectorstore/", embeddings)
         print("✅ Vector database loaded")
+        if getattr(db, 'bm25', None) is not None:
+            print("✅ BM25 index loaded, using hybrid search")
+        
+        # Cross-encoder that reorders the retrieved candidates
+        reranker = load_reranker()
         
         # Load Gemini
         llm = load_gemini_llm()
@@ -51,31 +90,159 @@ def create_gemini_qa_system():
             return None
             
         print("✅ Gemini QA system ready!")
-        return {'llm': llm, 'db': db}
+        qa_system = {
+            'llm': llm,
+            'db': db,
+            'embeddings': embeddings,
+            'reranker': reranker,
+            'answer_cache': SemanticCache(),
+            'sessions': SessionStore(),
+            'count_tokens': make_token_counter(TOKENIZER),
+            'index_version': index_version("vectorstore/")
+        }
+        # Newly published index versions are swapped in without a restart
+        qa_system['index_swapper'] = IndexSwapper(qa_system, "vectorstore/", embeddings)
+        return qa_system
         
     except Exception as e:
         print(f"❌ Error creating Gemini QA system: {str(e)}")
         return None
 
-def answer_question(qa_system, question):
+@contextmanager
+def lease_db(qa_system):
     """
-    Answer a question using Gemini and vector search
+    Yield the served vector store; an index hot swap waits until the block
+    exits before freeing it
     """
-    try:
-        llm = qa_system['llm']
-        db = qa_system['db']
-        
-        print(f"🔍 Searching for relevant documents for: {question}")
-        # Search for relevant documents
-        docs = db.similarity_search(question, k=3)
-        print(f"📄 Found {len(docs)} relevant documents")
-        
-        # Combine retrieved context
-        context = "\n\n".join([doc.page_content for doc in docs])
-        print(f"📝 Context length: {len(context)} characters")
-        
-        # Create enhanced prompt for Gemini with better formatting instructions
-        prompt = f"""You are an expert legal assistant with extensive knowledge of Indian law. Your responses should be professional, well-structured, and comprehensive.
+    swapper = qa_system.get('index_swapper')
+    if swapper is None:
+        yield qa_system['db']
+    else:
+        with swapper.lease() as db:
+            yield db
+
+def served_index_version(qa_system, db):
+    """
+    Version of the index behind db, used to key the answer cache
+    """
+    return getattr(db, 'version', None) or qa_system.get('index_version')
+
+def search_unique(db, query_vector, k=3, fetch_k=6, question=None, bm25_index=None, domains=None):
+    """
+    Similarity search that skips duplicate passages, so indexes built from
+    duplicated PDFs don't fill every slot with the same text. With a BM25
+    index, keyword and vector rankings are fused. domains limits the
+    search to those domain partitions. fetch_k candidates are drawn
+    before duplicates are dropped, from rankings at least that deep.
+    """
+    if not hasattr(db, 'search_positions'):
+        docs = db.similarity_search_by_vector(query_vector, k=fetch_k)
+    elif bm25_index is not None and question:
+        docs = hybrid_search(db, bm25_index, question, query_vector, k=fetch_k,
+                             fetch_k=max(fetch_k, HYBRID_FETCH_K), domains=domains)
+    else:
+        docs = db.get_by_positions(db.search_positions(query_vector, fetch_k, domains))
+    return _unique_docs(docs, k)
+
+def search_unique_batch(db, query_vectors, questions, k=3, fetch_k=6, bm25_index=None, domains=None):
+    """
+    search_unique for many questions, with one matrix search over the index
+    and one chunk fetch. Returns a document list per question. domains, if
+    given, holds each question's domains or None.
+    """
+    if not hasattr(db, 'search_positions_batch'):
+        return [search_unique(db, vector, k, fetch_k, question, bm25_index)
+                for vector, question in zip(query_vectors, questions)]
+    if bm25_index is not None:
+        doc_lists = hybrid_search_batch(db, bm25_index, questions, query_vectors, k=fetch_k,
+                                        fetch_k=max(fetch_k, HYBRID_FETCH_K), domains=domains)
+    else:
+        doc_lists = db.get_by_positions_batch(db.search_positions_batch(query_vectors, fetch_k, domains))
+    return [_unique_docs(docs, k) for docs in doc_lists]
+
+def route_domains(db, question, query_vector, domain=None):
+    """
+    Domain partitions to search for a question: the requested domain, else
+    the ones the router picks. None searches the whole index.
+    """
+    partitions = getattr(db, 'partitions', None)
+    if partitions is None:
+        return None
+    domains = [domain] if domain else partitions.route(question, query_vector)
+    annotate(domains=",".join(domains) if domains else "all")
+    return domains
+
+def _doc_key(doc):
+    return " ".join(doc.page_content.split()).lower()
+
+def _unique_docs(docs, k, seen=()):
+    unique_docs = []
+    seen = set(seen)
+    for doc in docs:
+        key = _doc_key(doc)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique_docs.append(doc)
+        if len(unique_docs) == k:
+            break
+    return unique_docs
+
+def cited_docs(db, question):
+    """
+    The chunks holding the provisions the question cites ("Section 302
+    IPC", "Article 21"), from the citation index, as (cited, candidates),
+    at most CONTEXT_K each. Sections cited without an act ("Section 302")
+    could be any statute's, so their chunks are only search candidates
+    for the reranker and never stand in for the search.
+    """
+    citation_index = getattr(db, 'citations', None)
+    if citation_index is None:
+        return [], []
+    citations = parse_citations(question)
+    if not citations:
+        return [], []
+    positions = citation_index.lookup([(act, section) for act, section in citations if act])[:CONTEXT_K]
+    unnamed = citation_index.lookup([(act, section) for act, section in citations if not act])
+    candidates = [position for position in unnamed if position not in positions][:CONTEXT_K]
+    return (db.get_by_positions(positions) if positions else [],
+            db.get_by_positions(candidates) if candidates else [])
+
+def candidate_count(qa_system):
+    """
+    Chunks to retrieve per question: over-fetch when a reranker picks the final ones
+    """
+    return RERANK_FETCH_K if qa_system.get('reranker') is not None else CONTEXT_K
+
+def rerank_docs(qa_system, question, docs, k=CONTEXT_K):
+    """
+    Keep the k best candidates, reranked by the cross-encoder if there is one
+    """
+    reranker = qa_system.get('reranker')
+    if reranker is None:
+        return docs[:k]
+    docs, stats = reranker.rerank(question, docs, k=k)
+    log.info("🎯 Reranked %d/%d candidates in %.0f ms (%s)",
+             stats['scored'], stats['candidates'], stats['seconds'] * 1000, stats['stopped'])
+    annotate(reranked=stats['scored'])
+    return docs
+
+def assemble_context(qa_system, question, docs, cited=()):
+    """
+    Build the prompt context within the token budget, cited provisions
+    first and whole, and report the tokens saved
+    """
+    context, stats = build_context(question, docs, qa_system.get('context_budget', CONTEXT_TOKEN_BUDGET),
+                                   qa_system.get('count_tokens', estimate_tokens), pinned=cited)
+    log_context_stats(stats)
+    annotate(context_tokens=stats['tokens_after'], tokens_saved=stats['tokens_saved'])
+    return context
+
+def build_prompt(context, question):
+    """
+    Create enhanced prompt for Gemini with better formatting instructions
+    """
+    return f"""You are an expert legal assistant with extensive knowledge of Indian law. Your responses should be professional, well-structured, and comprehensive.
 
 **CONTEXT FROM LEGAL DOCUMENTS:**
 {context}
@@ -93,21 +260,353 @@ def answer_question(qa_system, question):
 
 **Please provide your response in a well-formatted, professional manner:**"""
 
-        print("🤖 Calling Gemini API...")
-        # Get response from Gemini
-        response = llm.invoke(prompt)
+def answer_cache_version(qa_system, db, domain=None, question=None):
+    """
+    Key of the answer cache partition: the index version, the domain
+    filter if any, since a filtered answer only holds that domain's law,
+    and the numbers the question cites, since "Section 302 IPC" and
+    "Section 304 IPC" embed almost identically
+    """
+    version = served_index_version(qa_system, db)
+    if domain:
+        version = f"{version}:{domain}"
+    numbers = question_numbers(question) if question else []
+    return f"{version}#{','.join(numbers)}" if numbers else version
+
+def degraded_answer(context, error):
+    """
+    The reply when the LLM can't answer: the retrieved passages themselves
+    """
+    log.warning("🩹 Answering with the retrieved passages only: %s", error)
+    annotate(outcome='degraded')
+    return DegradedAnswer("⚠️ The AI model is unavailable right now, so here are the most relevant passages "
+                          f"from the legal documents instead:\n\n{context}")
+
+def prepare_answer(qa_system, question, domain=None, session_id=None):
+    """
+    Run everything before the LLM call: embed the question, check the
+    answer cache and retrieve the context, from the given legal domain
+    only if set. Within a session, a follow-up is searched with the
+    conversation's topic added and reuses the previous turn's chunks while
+    they are still relevant; its citations are parsed from what was
+    asked, and it bypasses the answer cache, since its answer depends on
+    the conversation.
+    Returns (cache_key, cached_answer, prompt, context); prompt and
+    context are None on a cache hit, cache_key is None for a follow-up.
+    """
+    sessions = qa_system.get('sessions') if session_id else None
+    last_turn = sessions.last_turn(session_id) if sessions is not None else None
+    asked = question
+    question, topic = resolve_follow_up(asked, last_turn)
+    follow_up = question != asked
+    if follow_up:
+        log.info("🧵 Follow-up rewritten as: %s", question)
+        annotate(follow_up=True)
+    
+    with lease_db(qa_system) as db:
+        answer_cache = qa_system.get('answer_cache') if not follow_up else None
+        version = answer_cache_version(qa_system, db, domain, asked)
         
-        if hasattr(response, 'content'):
-            result = response.content
-        else:
-            result = str(response)
-            
-        print(f"✅ Gemini responded with {len(result)} characters")
-        return result
-            
-    except Exception as e:
-        error_msg = f"Error in answer_question: {str(e)}"
-        print(f"❌ {error_msg}")
-        import traceback
-        print(f"📋 Full traceback: {traceback.format_exc()}")
-        return f"I apologize, but I encountered an error: {str(e)}"
+        # Embed the question once, for the answer cache and the search
+        with span('embed'):
+            query_vector = db.embeddings.embed_query(question)
+        
+        # Reuse the answer to an equivalent question, if one was asked recently
+        if answer_cache is not None:
+            hit = answer_cache.lookup(query_vector, version, with_chunk_ids=True)
+            if hit is not None:
+                cached, chunk_ids = hit
+                log.info("⚡ Answer cache hit for: %s", question)
+                annotate(outcome='cached')
+                if sessions is not None:
+                    sessions.record(session_id, asked, topic, chunk_ids, query_vector)
+                return (query_vector, version, chunk_ids), cached, None, None
+        
+        # Cited provisions ("Section 302 IPC") are looked up directly
+        with span('citations'):
+            cited, candidates = cited_docs(db, asked)
+        
+        # A follow-up reuses the previous turn's chunks while they are still relevant
+        reused = []
+        if follow_up and len(cited) < CONTEXT_K and hasattr(db, 'get_by_ids'):
+            chunk_ids = reusable_chunk_ids(last_turn, query_vector)
+            if chunk_ids:
+                with span('session'):
+                    reused = _unique_docs(db.get_by_ids(chunk_ids), CONTEXT_K - len(cited),
+                                          seen=map(_doc_key, cited))
+                log.info("♻️  Reusing %d chunks from the previous turn", len(reused))
+                annotate(reused=len(reused))
+        
+        # Search for relevant documents to fill the remaining slots
+        docs = []
+        if len(cited) + len(reused) < CONTEXT_K:
+            log.info("🔍 Searching for relevant documents for: %s", question)
+            k = candidate_count(qa_system)
+            with span('search'):
+                domains = route_domains(db, question, query_vector, domain)
+                docs = search_unique(db, query_vector, k=k, fetch_k=2 * k, question=question,
+                                     bm25_index=getattr(db, 'bm25', None), domains=domains)
+            docs = _unique_docs(docs + candidates, k + len(candidates), seen=map(_doc_key, cited + reused))
+        docs = reused + docs
+    if docs:
+        with span('rerank'):
+            docs = rerank_docs(qa_system, question, docs, k=CONTEXT_K - len(cited))
+    log.info("📄 Found %d relevant documents (%d cited)", len(cited) + len(docs), len(cited))
+    chunk_ids = [doc.id for doc in cited + docs if doc.id]
+    if sessions is not None:
+        sessions.record(session_id, asked, topic, chunk_ids, query_vector)
+    
+    # Fit the most relevant parts of the retrieved chunks into the token budget
+    with span('prompt'):
+        context = assemble_context(qa_system, question, docs, cited)
+        prompt = build_prompt(context, question)
+    annotate(docs=len(cited) + len(docs), cited=len(cited), prompt_chars=len(prompt))
+    
+    return (query_vector, version, chunk_ids) if not follow_up else None, None, prompt, context
+
+def prepare_answers(qa_system, questions):
+    """
+    prepare_answer for a batch: all questions are embedded in one forward
+    pass and searched with one matrix search, each in the domains the
+    router picks for it.
+    Returns (cache_keys, cached_answers, prompts, contexts); each prompt
+    and context is None on a cache hit.
+    """
+    with lease_db(qa_system) as db:
+        answer_cache = qa_system.get('answer_cache')
+        versions = [answer_cache_version(qa_system, db, question=question) for question in questions]
+        
+        with span('embed'):
+            if hasattr(db.embeddings, 'embed_queries'):
+                query_vectors = db.embeddings.embed_queries(questions)
+            else:
+                query_vectors = db.embeddings.embed_documents(questions)
+        
+        cached = [None] * len(questions)
+        if answer_cache is not None:
+            cached = [answer_cache.lookup(vector, version) for vector, version in zip(query_vectors, versions)]
+        pending = [i for i, answer in enumerate(cached) if answer is None]
+        log.info("⚡ %d of %d answers cached", len(questions) - len(pending), len(questions))
+        annotate(questions=len(questions), cached=len(questions) - len(pending))
+        
+        with span('citations'):
+            cited, candidates = {}, {}
+            for i in pending:
+                cited[i], candidates[i] = cited_docs(db, questions[i])
+        searched = [i for i in pending if len(cited[i]) < CONTEXT_K]
+        
+        k = candidate_count(qa_system)
+        doc_lists = []
+        if searched:
+            with span('search'):
+                domains = [route_domains(db, questions[i], query_vectors[i]) for i in searched]
+                doc_lists = search_unique_batch(db, [query_vectors[i] for i in searched],
+                                                [questions[i] for i in searched],
+                                                k=k, fetch_k=2 * k, bm25_index=getattr(db, 'bm25', None),
+                                                domains=domains)
+    
+    found = dict(zip(searched, doc_lists))
+    prompts = [None] * len(questions)
+    contexts = [None] * len(questions)
+    chunk_ids = [()] * len(questions)
+    for i in pending:
+        docs = _unique_docs(found.get(i, []) + candidates[i], k + len(candidates[i]),
+                            seen=map(_doc_key, cited[i]))
+        if docs:
+            with span('rerank'):
+                docs = rerank_docs(qa_system, questions[i], docs, k=CONTEXT_K - len(cited[i]))
+        chunk_ids[i] = [doc.id for doc in cited[i] + docs if doc.id]
+        with span('prompt'):
+            contexts[i] = assemble_context(qa_system, questions[i], docs, cited[i])
+            prompts[i] = build_prompt(contexts[i], questions[i])
+    
+    cache_keys = [(vector, version, ids) for vector, version, ids in zip(query_vectors, versions, chunk_ids)]
+    return cache_keys, cached, prompts, contexts
+
+def cache_answer(qa_system, cache_key, answer):
+    """
+    Store a successful answer in the semantic answer cache, under the
+    index version it was retrieved from; answers without a cache key
+    (follow-ups) aren't cached
+    """
+    answer_cache = qa_system.get('answer_cache')
+    if answer_cache is not None and cache_key is not None:
+        query_vector, version, chunk_ids = cache_key
+        answer_cache.store(query_vector, version, answer, chunk_ids)
+
+def interrupted_answer(parts, context, error):
+    """
+    What to stream when the LLM fails: the passages if nothing was sent
+    yet, else a note that the answer is incomplete (never cached)
+    """
+    if not parts:
+        return degraded_answer(context, error)
+    log.warning("🩹 Stream cut short after %d chunks: %s", len(parts), error)
+    annotate(outcome='degraded')
+    return "\n\n⚠️ The answer was cut short because the AI model stopped responding."
+
+def _chunk_text(chunk):
+    return chunk.content if hasattr(chunk, 'content') else str(chunk)
+
+def answer_question(qa_system, question, domain=None, session_id=None):
+    """
+    Answer a question using Gemini and vector search, optionally searching
+    only one legal domain, as the next turn of a chat session if given
+    """
+    with request_trace('chat'):
+        try:
+            llm = qa_system['llm']
+            cache_key, cached, prompt, context = prepare_answer(qa_system, question, domain, session_id)
+            if cached is not None:
+                annotate(response_chars=len(cached))
+                return cached
+
+            log.info("🤖 Calling Gemini API...")
+            # Get response from Gemini
+            try:
+                with span('llm_total'):
+                    response = llm.invoke(prompt)
+            except LLMUnavailable as e:
+                return degraded_answer(context, e)
+            result = _chunk_text(response)
+                
+            log.info("✅ Gemini responded with %d characters", len(result))
+            annotate(response_chars=len(result))
+            cache_answer(qa_system, cache_key, result)
+            return result
+                
+        except Exception as e:
+            log.exception("❌ Error in answer_question: %s", e)
+            annotate(outcome='error')
+            return f"I apologize, but I encountered an error: {str(e)}"
+
+def answer_questions(qa_system, questions, max_concurrency=BATCH_CONCURRENCY):
+    """
+    Answer many questions, yielding (index, answer) as each one completes.
+    Cached answers come first; the rest are sent to Gemini in a batch with
+    at most max_concurrency calls in flight.
+    """
+    with request_trace('batch'):
+        try:
+            llm = qa_system['llm']
+            cache_keys, cached, prompts, contexts = prepare_answers(qa_system, questions)
+        except Exception as e:
+            log.exception("❌ Error in answer_questions: %s", e)
+            annotate(outcome='error')
+            for i in range(len(questions)):
+                yield i, f"I apologize, but I encountered an error: {str(e)}"
+            return
+        
+        response_chars = 0
+        for i, answer in enumerate(cached):
+            if answer is not None:
+                response_chars += len(answer)
+                yield i, answer
+        
+        pending = [i for i, prompt in enumerate(prompts) if prompt is not None]
+        if not pending:
+            annotate(response_chars=response_chars)
+            return
+        log.info("🤖 Calling Gemini API for %d questions...", len(pending))
+        start = time.perf_counter()
+        results = llm.batch_as_completed([prompts[i] for i in pending], config={'max_concurrency': max_concurrency},
+                                         return_exceptions=True)
+        errors = 0
+        for j, response in results:
+            i = pending[j]
+            if isinstance(response, LLMUnavailable):
+                errors += 1
+                yield i, degraded_answer(contexts[i], response)
+                continue
+            if isinstance(response, Exception):
+                log.error("❌ Error answering question %d: %s", i, response)
+                errors += 1
+                yield i, f"I apologize, but I encountered an error: {str(response)}"
+                continue
+            result = _chunk_text(response)
+            response_chars += len(result)
+            cache_answer(qa_system, cache_keys[i], result)
+            yield i, result
+        add_span('llm_total', time.perf_counter() - start)
+        annotate(response_chars=response_chars, errors=errors)
+
+def stream_answer(qa_system, question, domain=None, session_id=None):
+    """
+    Answer a question, yielding the text as Gemini produces it
+    """
+    with request_trace('stream'):
+        try:
+            llm = qa_system['llm']
+            cache_key, cached, prompt, context = prepare_answer(qa_system, question, domain, session_id)
+            if cached is not None:
+                annotate(response_chars=len(cached))
+                yield cached
+                return
+
+            log.info("🤖 Streaming from Gemini API...")
+            start = time.perf_counter()
+            parts = []
+            try:
+                for chunk in llm.stream(prompt):
+                    text = _chunk_text(chunk)
+                    if text:
+                        if not parts:
+                            add_span('llm_ttft', time.perf_counter() - start)
+                        parts.append(text)
+                        yield text
+            except LLMUnavailable as e:
+                yield interrupted_answer(parts, context, e)
+                return
+
+            result = "".join(parts)
+            add_span('llm_total', time.perf_counter() - start)
+            log.info("✅ Gemini streamed %d characters", len(result))
+            annotate(response_chars=len(result))
+            cache_answer(qa_system, cache_key, result)
+                
+        except Exception as e:
+            log.exception("❌ Error in stream_answer: %s", e)
+            annotate(outcome='error')
+            yield f"I apologize, but I encountered an error: {str(e)}"
+
+async def astream_answer(qa_system, question, domain=None, session_id=None):
+    """
+    Async version of stream_answer: retrieval runs in a worker thread and
+    Gemini is streamed on the event loop, so no thread is held while
+    waiting for tokens
+    """
+    with request_trace('stream'):
+        try:
+            llm = qa_system['llm']
+            cache_key, cached, prompt, context = await asyncio.to_thread(prepare_answer, qa_system, question,
+                                                                          domain, session_id)
+            if cached is not None:
+                annotate(response_chars=len(cached))
+                yield cached
+                return
+
+            log.info("🤖 Streaming from Gemini API...")
+            start = time.perf_counter()
+            parts = []
+            try:
+                async for chunk in llm.astream(prompt):
+                    text = _chunk_text(chunk)
+                    if text:
+                        if not parts:
+                            add_span('llm_ttft', time.perf_counter() - start)
+                        parts.append(text)
+                        yield text
+            except LLMUnavailable as e:
+                yield interrupted_answer(parts, context, e)
+                return
+
+            result = "".join(parts)
+            add_span('llm_total', time.perf_counter() - start)
+            log.info("✅ Gemini streamed %d characters", len(result))
+            annotate(response_chars=len(result))
+            cache_answer(qa_system, cache_key, result)
+                
+        except Exception as e:
+            log.exception("❌ Error in astream_answer: %s", e)
+            annotate(outcome='error')
+            yield f"I apologize, but I encountered an error: {str(e)}"
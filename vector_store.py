@@ -0,0 +1,571 @@
+# Search index types and the memory-mapped vector store used for serving
+import os
+import json
+import math
+import time
+import pickle
+import shutil
+import sqlite3
+import threading
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import FAISS
+from bm25 import BM25_DIR, build_bm25_index, load_bm25_index
+from citations import CITATIONS_FILE, build_citation_index, load_citation_index
+from domains import DOMAINS_DIR, build_domain_partitions, load_domain_partitions, source_domain
+from manifest import load_manifest
+from embedding_backends import hub_id, embedder_model_name, load_embeddings
+
+# Index metadata file, stored inside each published version
+INDEX_META_FILE = "index_meta.json"
+
+# Published search index versions live in versions/<version>/; CURRENT names the served one
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+
+# Published versions kept on disk, so workers still serving an older one can finish
+KEEP_VERSIONS = 3
+
+# Older versions are only deleted once superseded for this many seconds, so every
+# server has had time to swap to a newer one
+VERSION_GRACE_PERIOD = 600
+
+# Supported search index types
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw", "sq8")
+
+# Index types whose vectors are stored in inverted lists that faiss can memory-map
+MMAP_INDEX_TYPES = ("flat", "ivf", "ivfpq", "sq8")
+
+# Index types that scan every vector of the partitions they search, so routing a
+# question to a few domains cuts its cost. IVF and HNSW already visit only the
+# neighbourhood of the query, and routing would just add a search per partition.
+ROUTED_INDEX_TYPES = ("flat", "sq8")
+
+# Chunk text store, read only for search hits
+DOCSTORE_FILE = "docstore.sqlite"
+
+# Default search-time parameters
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+# Embedding model used when no store exists yet
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Models assumed, by vector dimension, for stores written before the model was recorded
+KNOWN_DIMENSIONS = {
+    384: "all-MiniLM-L6-v2",
+    768: "sentence-transformers/all-mpnet-base-v2",
+}
+
+# Maximum number of vectors used to train IVF/PQ/SQ indexes
+TRAIN_SAMPLE_SIZE = 50_000
+
+# Choose the number of IVF lists for a corpus size
+def default_nlist(ntotal):
+    """
+    Roughly 4 * sqrt(n) inverted lists, with at least 39 training points per list
+    """
+    return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+# Choose the number of PQ sub-quantizers for a dimension
+def default_pq_m(dimension):
+    """
+    Largest sub-quantizer count <= dimension / 8 that divides the dimension
+    """
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+# Build the faiss.index_factory description for an index type
+def factory_string(index_type, dimension, ntotal, nlist=None, pq_m=None, hnsw_m=32):
+    """
+    Return the index_factory string for index_type.
+    Flat and SQ8 are wrapped in a single inverted list, which searches
+    exactly the same but lets faiss memory-map the vectors.
+    """
+    if index_type == "flat":
+        return "IVF1,Flat"
+    if index_type == "ivf":
+        return f"IVF{nlist or default_nlist(ntotal)},Flat"
+    if index_type == "ivfpq":
+        return f"IVF{nlist or default_nlist(ntotal)},PQ{pq_m or default_pq_m(dimension)}"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "sq8":
+        return "IVF1,SQ8"
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+
+# Read every vector back from a flat index
+def flat_vectors(flat_index):
+    """
+    Return the vectors stored in a flat index as a float32 matrix
+    """
+    return flat_index.reconstruct_n(0, flat_index.ntotal)
+
+# Build a search index from the vectors of the flat index
+def build_index(vectors, index_type, nlist=None, pq_m=None, hnsw_m=32, train_size=TRAIN_SAMPLE_SIZE, seed=0):
+    """
+    Train (on a random sample) and fill a FAISS index of the given type
+    """
+    ntotal, dimension = vectors.shape
+    index = faiss.index_factory(dimension, factory_string(index_type, dimension, ntotal, nlist, pq_m, hnsw_m),
+                                faiss.METRIC_L2)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(ntotal, size=min(train_size, ntotal), replace=False)]
+        index.train(sample)
+    for start in range(0, ntotal, 10_000):
+        index.add(vectors[start:start + 10_000])
+    return index
+
+# Apply search-time parameters
+def set_search_params(index, search_params):
+    """
+    Set nprobe / efSearch on an index that supports them
+    """
+    parameter_space = faiss.ParameterSpace()
+    for name, value in (search_params or {}).items():
+        try:
+            parameter_space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+def default_search_params(index_type, nprobe=None, ef_search=None):
+    if index_type in ("ivf", "ivfpq"):
+        return {'nprobe': nprobe or DEFAULT_NPROBE}
+    if index_type in ("flat", "sq8"):
+        return {'nprobe': 1}
+    if index_type == "hnsw":
+        return {'efSearch': ef_search or DEFAULT_EF_SEARCH}
+    return {}
+
+# Find the published version
+def current_version(index_dir):
+    """
+    Return the name of the served search index version, or None if none was published
+    """
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def serving_dir(index_dir, version=None):
+    """
+    Directory holding the search index, chunk store and metadata of a
+    version (the current one by default). Stores from before versioning
+    keep them in the vector store directory itself.
+    """
+    version = version or current_version(index_dir)
+    if version is None:
+        return index_dir
+    return os.path.join(index_dir, VERSIONS_DIR, version)
+
+# Make a built version the served one
+def publish_version(index_dir, version, keep=KEEP_VERSIONS):
+    """
+    Atomically point CURRENT at version, then delete versions older than
+    the newest keep that were superseded more than VERSION_GRACE_PERIOD ago
+    """
+    path = os.path.join(index_dir, CURRENT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+    versions_dir = os.path.join(index_dir, VERSIONS_DIR)
+    published = sorted(name for name in os.listdir(versions_dir) if not name.endswith(".tmp"))
+    now = time.time()
+    for name, successor in zip(published[:-keep], published[1:]):
+        superseded_at = os.path.getmtime(os.path.join(versions_dir, successor))
+        if name != version and now - superseded_at > VERSION_GRACE_PERIOD:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+    # Search files from before versioning
+    for name in os.listdir(index_dir):
+        if (name.startswith("search.") and name.endswith(".faiss")) or name in (DOCSTORE_FILE, INDEX_META_FILE):
+            os.remove(os.path.join(index_dir, name))
+    shutil.rmtree(os.path.join(index_dir, BM25_DIR), ignore_errors=True)
+
+# Load the index metadata
+def load_index_meta(index_dir, version=None):
+    """
+    Return the metadata of the current (or given) version, or None for stores without it
+    """
+    path = os.path.join(serving_dir(index_dir, version), INDEX_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Save the index metadata
+def save_index_meta(index_dir, meta):
+    """
+    Atomically write the index metadata
+    """
+    path = os.path.join(index_dir, INDEX_META_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# Describe the embeddings a store was built with
+def embedding_info(vectors, settings):
+    """
+    Return the embedding model, vector dimension, whether the vectors are
+    unit length, and the chunking parameters of a store
+    """
+    norms = np.linalg.norm(vectors[:1000], axis=1)
+    return {
+        'model': settings.get('embedding_model'),
+        'dimension': int(vectors.shape[1]),
+        'normalized': bool(len(norms)) and bool(np.allclose(norms, 1.0, atol=1e-3)),
+        'chunk_size': settings.get('chunk_size'),
+        'chunk_overlap': settings.get('chunk_overlap'),
+    }
+
+# Read back the embeddings a store was built with
+def load_embedding_info(index_dir, version=None):
+    """
+    Return the embedding info recorded for the current (or given) version.
+    Older stores fall back to the ingestion manifest, then to guessing the
+    model from the vector dimension. Returns None when there is no store.
+    """
+    meta = load_index_meta(index_dir, version) or {}
+    if 'embedding' in meta:
+        return meta['embedding']
+
+    if 'dimension' in meta:
+        dimension = meta['dimension']
+    elif os.path.exists(os.path.join(index_dir, "index.faiss")):
+        dimension = faiss.read_index(os.path.join(index_dir, "index.faiss")).d
+    else:
+        return None
+
+    settings = (load_manifest(index_dir) or {}).get('settings', {})
+    info = {'model': settings.get('embedding_model'), 'dimension': dimension, 'normalized': None,
+            'chunk_size': settings.get('chunk_size'), 'chunk_overlap': settings.get('chunk_overlap')}
+    if info['model'] is None:
+        info['model'] = KNOWN_DIMENSIONS.get(dimension)
+        print(f"⚠️  {index_dir} doesn't record its embedding model, assuming {info['model']} "
+              f"from its {dimension}-dim vectors; rebuild the search index to record it")
+    return info
+
+# Make sure an embedder matches a store
+def check_embeddings(info, embeddings):
+    """
+    Raise ValueError if embeddings isn't the model the store was built
+    with. Embedders whose model name is unknown are checked by embedding a
+    probe text instead.
+    """
+    if info is None or embeddings is None:
+        return
+    name = embedder_model_name(embeddings)
+    if name is not None and info.get('model') is not None:
+        if hub_id(name) != hub_id(info['model']):
+            raise ValueError(f"The vector store was embedded with {info['model']} ({info['dimension']}-dim) "
+                             f"but the embedder is {name}; load it with load_store_embeddings() "
+                             f"or convert the store with migrate_embeddings.py")
+        return
+
+    vector = np.asarray(embeddings.embed_query("dimension check"), dtype=np.float32)
+    if len(vector) != info['dimension']:
+        raise ValueError(f"The vector store holds {info['dimension']}-dim vectors "
+                         f"but the embedder returns {len(vector)}-dim ones")
+    if info.get('normalized') and not math.isclose(float(np.linalg.norm(vector)), 1.0, abs_tol=1e-3):
+        raise ValueError("The vector store holds unit-length vectors but the embedder doesn't normalize")
+
+# Load the embedder a store was built with
+def load_store_embeddings(index_dir, backend=None, device=None, default_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Load the embedding model recorded for the served version of index_dir
+    (default_model if there is no store yet) on the given backend
+    """
+    info = load_embedding_info(index_dir)
+    model_name = (info or {}).get('model') or default_model
+    if info is not None:
+        print(f"🧠 Vector store was embedded with {model_name} ({info['dimension']}-dim)")
+    return load_embeddings(model_name, backend, device=device)
+
+# Write the chunk texts to SQLite
+def export_docstore(index_dir, vector_store):
+    """
+    Write every chunk, keyed by its position in the index, to docstore.sqlite
+    """
+    path = os.path.join(index_dir, DOCSTORE_FILE)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, doc_id TEXT, text TEXT, metadata TEXT)")
+        rows = []
+        for position in range(vector_store.index.ntotal):
+            doc_id = vector_store.index_to_docstore_id[position]
+            doc = vector_store.docstore.search(doc_id)
+            rows.append((position, doc_id, doc.page_content, json.dumps(doc.metadata)))
+            if len(rows) >= 10_000:
+                connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+                rows = []
+        connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        # Chat sessions fetch the chunks of earlier turns by ID
+        connection.execute("CREATE INDEX chunks_doc_id ON chunks (doc_id)")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+# Build and save the search index used by the loaders
+def build_search_index(index_dir, vector_store, index_type="flat", nlist=None, pq_m=None, hnsw_m=32,
+                       nprobe=None, ef_search=None, settings=None):
+    """
+    Build the search index, chunk store, BM25 postings, statute citation
+    index and per-domain partitions the server loads, from the flat
+    index.faiss and index.pkl, and record the index type and parameters in
+    index_meta.json. They are written to a new version directory, which
+    is published once complete; servers keep using the previous version
+    until then. The flat index and pickle stay the source of truth for
+    incremental ingestion. The embedding model and chunking parameters
+    come from settings, else the ingestion manifest.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+
+    vectors = flat_vectors(vector_store.index)
+    ntotal, dimension = vectors.shape
+    if index_type in ("ivf", "ivfpq") and ntotal < 256:
+        print(f"⚠️  Only {ntotal} vectors, too few to train a '{index_type}' index; using the flat index")
+        index_type = "flat"
+    if ntotal == 0:
+        return None
+
+    print(f"🏗️  Building '{index_type}' search index over {ntotal} vectors...")
+    start = time.perf_counter()
+    description = factory_string(index_type, dimension, ntotal, nlist, pq_m, hnsw_m)
+    index = build_index(vectors, index_type, nlist, pq_m, hnsw_m)
+
+    version = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 1_000_000_000:09d}"
+    version_dir = os.path.join(index_dir, VERSIONS_DIR, version)
+    tmp_dir = version_dir + ".tmp"
+    os.makedirs(tmp_dir)
+    index_file = f"search.{index_type}.faiss"
+    faiss.write_index(index, os.path.join(tmp_dir, index_file))
+    export_docstore(tmp_dir, vector_store)
+    docs = lambda: (vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+                    for position in range(ntotal))
+    build_bm25_index(tmp_dir, (doc.page_content for doc in docs()))
+    build_citation_index(tmp_dir, ((position, doc.metadata.get('source'), doc.page_content)
+                                   for position, doc in enumerate(docs())))
+    # Partitions too small to train an IVF index are flat, like the whole index above
+    build_domain_partitions(tmp_dir, vectors,
+                            [doc.metadata.get('domain') or source_domain(doc.metadata.get('source')) for doc in docs()],
+                            lambda part: build_index(part, "flat" if index_type in ("ivf", "ivfpq") and len(part) < 256
+                                                     else index_type, None, pq_m, hnsw_m),
+                            route=index_type in ROUTED_INDEX_TYPES)
+
+    save_index_meta(tmp_dir, {
+        'version': version,
+        'index_type': index_type,
+        'index_file': index_file,
+        'factory': description,
+        'search_params': default_search_params(index_type, nprobe, ef_search),
+        'mmap': index_type in MMAP_INDEX_TYPES,
+        'docstore': DOCSTORE_FILE,
+        'bm25': BM25_DIR,
+        'citations': CITATIONS_FILE,
+        'domains': DOMAINS_DIR,
+        'ntotal': ntotal,
+        'dimension': dimension,
+        'embedding': embedding_info(vectors, settings or (load_manifest(index_dir) or {}).get('settings', {})),
+    })
+    os.replace(tmp_dir, version_dir)
+    publish_version(index_dir, version)
+    print(f"✅ Built {description} in {time.perf_counter() - start:.1f}s, published version {version}")
+    return index
+
+# Read-only vector store over a memory-mapped index and SQLite chunk store
+class MmapVectorStore(VectorStore):
+    """
+    Serving-side vector store. The faiss index is memory-mapped, so worker
+    processes share its pages through the page cache, and chunk texts are
+    read from SQLite only for the search hits.
+    """
+
+    def __init__(self, index, docstore_path, embedding, bm25=None, version=None, citations=None, partitions=None):
+        self.index = index
+        self.docstore_path = docstore_path
+        self.embedding = embedding
+        self.bm25 = bm25
+        self.citations = citations
+        self.partitions = partitions
+        self.version = version
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads, open one per thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            uri = "file:" + os.path.abspath(self.docstore_path) + "?mode=ro"
+            # Closed from whichever thread retires the store, see close()
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """
+        Release the index and chunk store, once no request uses this store any more
+        """
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+        self.index = None
+        self.bm25 = None
+        self.citations = None
+        self.partitions = None
+
+    def _fetch(self, positions):
+        positions = sorted(set(positions))
+        if not positions:
+            return {}
+        placeholders = ",".join("?" * len(positions))
+        rows = self._connection().execute(
+            f"SELECT position, doc_id, text, metadata FROM chunks WHERE position IN ({placeholders})", positions)
+        return {row[0]: Document(page_content=row[2], metadata=json.loads(row[3]), id=row[1]) for row in rows}
+
+    def get_by_positions(self, positions):
+        """
+        Return the documents at the given index positions, in order
+        """
+        positions = [int(p) for p in positions]
+        found = self._fetch(positions)
+        return [found[p] for p in positions if p in found]
+
+    def get_by_ids(self, ids):
+        """
+        Return the documents with the given chunk IDs, in order
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connection().execute(
+            f"SELECT position, doc_id, text, metadata FROM chunks WHERE doc_id IN ({placeholders})", ids)
+        found = {row[1]: Document(page_content=row[2], metadata=json.loads(row[3]), id=row[1]) for row in rows}
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def get_by_positions_batch(self, position_lists):
+        """
+        get_by_positions for several position lists, with a single query
+        """
+        position_lists = [[int(p) for p in positions] for positions in position_lists]
+        found = self._fetch(p for positions in position_lists for p in positions)
+        return [[found[p] for p in positions if p in found] for positions in position_lists]
+
+    def search_positions(self, embedding, k=4, domains=None):
+        """
+        Return the index positions of the k nearest chunks, best first,
+        searching only the partitions of the given domains if any
+        """
+        if domains is not None and self.partitions is not None:
+            return self.partitions.search(embedding, k, domains)
+        return [p for p, _ in self._search(embedding, k)]
+
+    def search_positions_batch(self, embeddings, k=4, domains=None):
+        """
+        Search many query vectors with one matrix search; one position list
+        per query. domains, if given, holds each query's domains (None
+        searches the whole index for that query).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if domains is None or self.partitions is None or all(d is None for d in domains):
+            _, positions = self.index.search(embeddings, k)
+            return [[int(p) for p in row if p >= 0] for row in positions]
+        results = [None] * len(embeddings)
+        full = [i for i, d in enumerate(domains) if d is None]
+        routed = [i for i, d in enumerate(domains) if d is not None]
+        if full:
+            for i, row in zip(full, self.search_positions_batch(embeddings[full], k)):
+                results[i] = row
+        for i, row in zip(routed, self.partitions.search_batch(embeddings[routed], k, [domains[i] for i in routed])):
+            results[i] = row
+        return results
+
+    def _search(self, embedding, k):
+        vector = np.asarray([embedding], dtype=np.float32)
+        scores, positions = self.index.search(vector, k)
+        return [(int(p), float(score)) for p, score in zip(positions[0], scores[0]) if p >= 0]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        hits = self._search(embedding, k)
+        docs = self.get_by_positions([p for p, _ in hits])
+        return list(zip(docs, [score for _, score in hits]))
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("MmapVectorStore is read-only, run ingest.py to add documents")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("MmapVectorStore is built by ingest.py")
+
+# Load the vector store recorded in the index metadata
+def load_vector_store(index_dir, embeddings, search_params=None, mmap=True, version=None):
+    """
+    Load the search index of the current (or given) version, memory-mapped
+    when possible, with its SQLite chunk store and BM25 index. Stores
+    without one are loaded from index.faiss/index.pkl. Raises ValueError
+    if embeddings isn't the model the store was built with.
+    """
+    version = version or current_version(index_dir)
+    directory = serving_dir(index_dir, version)
+    check_embeddings(load_embedding_info(index_dir, version), embeddings)
+    meta = load_index_meta(index_dir, version)
+    if meta is None or 'docstore' not in meta:
+        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap and meta.get('mmap') else 0
+    index = faiss.read_index(os.path.join(directory, meta['index_file']), flags)
+    search_params = {**meta.get('search_params', {}), **(search_params or {})}
+    set_search_params(index, search_params)
+    print(f"📐 Using '{meta['index_type']}' search index ({meta.get('factory', '')}"
+          f"{', memory-mapped' if flags else ''}{f', version {version}' if version else ''})")
+    bm25 = load_bm25_index(directory) if 'bm25' in meta else None
+    citations = load_citation_index(directory) if 'citations' in meta else None
+    partitions = load_domain_partitions(directory, flags) if 'domains' in meta else None
+    if partitions is not None:
+        for partition in partitions.indexes.values():
+            set_search_params(partition, search_params)
+    return MmapVectorStore(index, os.path.join(directory, meta['docstore']), embeddings, bm25, version, citations,
+                           partitions)
+
+# Load the flat store used for ingestion
+def load_flat_store(index_dir, embeddings=None):
+    """
+    Load index.faiss and the pickled docstore written by ingestion
+    """
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    with open(os.path.join(index_dir, "index.pkl"), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
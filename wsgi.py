@@ -0,0 +1,15 @@
+# WSGI entry point for production: loads the model before the server forks
+#
+# Run with:  gunicorn wsgi:app   (settings in gunicorn.conf.py)
+import os
+
+os.environ.setdefault('LAW_GPT_PRELOAD', '1')
+
+import flask_app
+
+# Load the embedding model, vector store and Gemini once, in the master
+# process; workers share the loaded pages copy-on-write
+if flask_app.qa_system is None:
+    flask_app.load_model()
+
+app = flask_app.app